@@ -0,0 +1,148 @@
+# app/core/capture.py
+"""
+Captura de entregas de webhooks para reproducirlas en local (bench.webhook_replay).
+
+Con WEBHOOK_CAPTURE_FILE definido, app.main agrega WebhookCaptureMiddleware:
+cada POST a una ruta de WEBHOOK_CAPTURE_PATHS se guarda como una línea JSON
+
+    {"ts", "path", "query", "headers": {...}, "body": "...", "body_encoding": "utf-8"|"base64"}
+
+- Secretos fuera: headers de firma/autorización y claves sensibles del body
+  JSON (REDACT_KEYS de app.core.logging) quedan como "***". El replay vuelve
+  a firmar con sus propios secretos.
+- La escritura va a un hilo aparte vía una cola acotada
+  (WEBHOOK_CAPTURE_QUEUE); si se llena se descarta y se cuenta, nunca se
+  frena el request.
+"""
+import base64, json, logging, os, queue, threading, time
+from typing import Any, Dict, Optional
+
+from app.core.logging import REDACT_KEYS
+
+log = logging.getLogger("ameth.capture")
+
+CAPTURE_FILE = os.getenv("WEBHOOK_CAPTURE_FILE", "").strip()
+CAPTURE_PATHS = tuple(
+    p.strip() for p in os.getenv(
+        "WEBHOOK_CAPTURE_PATHS", "/mp/webhooks/mercadopago,/messaging/whatsapp/webhook"
+    ).split(",") if p.strip()
+)
+CAPTURE_QUEUE = max(1, int(os.getenv("WEBHOOK_CAPTURE_QUEUE", "10000") or 10000))
+
+_REDACT_HEADERS = REDACT_KEYS | {"cookie", "x-telegram-bot-api-secret-token", "x-mp-secret"}
+
+
+def scrub(obj: Any) -> Any:
+    """Como logging.redact pero sin truncar: el body tiene que seguir siendo reproducible."""
+    if isinstance(obj, dict):
+        return {k: ("***" if str(k).lower() in REDACT_KEYS else scrub(v)) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [scrub(v) for v in obj]
+    return obj
+
+
+def _encode_body(raw: bytes) -> Dict[str, str]:
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(raw).decode("ascii"), "body_encoding": "base64"}
+    try:
+        parsed = json.loads(text) if text else None
+    except ValueError:
+        parsed = None
+    if parsed is not None:
+        cleaned = scrub(parsed)
+        if cleaned != parsed:
+            text = json.dumps(cleaned, ensure_ascii=False)
+    return {"body": text, "body_encoding": "utf-8"}
+
+
+class _Writer:
+    def __init__(self, path: str):
+        self.path = path
+        self.q: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=CAPTURE_QUEUE)
+        self.dropped = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="webhook-capture", daemon=True)
+        self._thread.start()
+
+    def put(self, item: Dict[str, Any]) -> None:
+        try:
+            self.q.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self.q.get()
+                if item is None:
+                    break
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                self.written += 1
+                if self.q.empty():
+                    f.flush()
+
+    def close(self, timeout: float = 5.0) -> None:
+        self.q.put(None)
+        self._thread.join(timeout)
+
+
+_writer: Optional[_Writer] = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer(path: str) -> _Writer:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _Writer(path)
+    return _writer
+
+
+def close() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        log.info("webhook capture closed", extra={"written": _writer.written, "dropped": _writer.dropped})
+        _writer = None
+
+
+class WebhookCaptureMiddleware:
+    """ASGI puro: copia el body a medida que la app lo lee; no lo consume por su cuenta."""
+
+    def __init__(self, app, path: str = CAPTURE_FILE, paths=CAPTURE_PATHS):
+        self.app = app
+        self.path = path
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        chunks = []
+
+        async def _receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self._capture(scope, b"".join(chunks))
+            return message
+
+        await self.app(scope, _receive, send)
+
+    def _capture(self, scope, raw: bytes) -> None:
+        headers = {}
+        for k, v in scope.get("headers") or ():
+            name = k.decode("latin-1").lower()
+            headers[name] = "***" if name in _REDACT_HEADERS else v.decode("latin-1")
+        _get_writer(self.path).put({
+            "ts": time.time(),
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "headers": headers,
+            **_encode_body(raw),
+        })
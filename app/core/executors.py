@@ -0,0 +1,51 @@
+# app/core/executors.py
+"""
+Executors dedicados para I/O de finanzas.
+
+FastAPI corre los endpoints sync en el threadpool por defecto (compartido con
+el resto de rutas). Las rutas de finanzas son async y delegan aquí:
+- un pool de lectores (FINANCE_IO_READERS hilos, default 4)
+- un único escritor (serializa escrituras sin bloquear el event loop)
+Así el I/O de finanzas no compite con /messaging ni con /mp.
+"""
+import asyncio, os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+FINANCE_IO_READERS = max(1, int(os.getenv("FINANCE_IO_READERS", "4") or 4))
+
+_readers: Optional[ThreadPoolExecutor] = None
+_writer: Optional[ThreadPoolExecutor] = None
+
+
+def _get_readers() -> ThreadPoolExecutor:
+    global _readers
+    if _readers is None:
+        _readers = ThreadPoolExecutor(max_workers=FINANCE_IO_READERS, thread_name_prefix="finance-read")
+    return _readers
+
+
+def _get_writer() -> ThreadPoolExecutor:
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="finance-write")
+    return _writer
+
+
+async def run_read(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_readers(), partial(fn, *args, **kwargs))
+
+
+async def run_write(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_writer(), partial(fn, *args, **kwargs))
+
+
+def shutdown(wait: bool = True) -> None:
+    global _readers, _writer
+    for ex in (_readers, _writer):
+        if ex is not None:
+            ex.shutdown(wait=wait)
+    _readers = _writer = None
@@ -0,0 +1,127 @@
+# app/core/idempotency.py
+"""
+Header Idempotency-Key para POSTs que crean cosas (registros, preferencias MP).
+
+- La primera petición con una clave ejecuta el handler y guarda la respuesta
+  (status + cuerpo ya serializado) en un store en memoria acotado:
+  IDEMPOTENCY_MAX_KEYS entradas (LRU) con TTL IDEMPOTENCY_TTL_S.
+- Reintentos con la misma clave reciben la respuesta guardada en O(1) sin
+  volver a ejecutar la escritura (header Idempotency-Replayed: true).
+- Si llegan a la vez, esperan el resultado de la primera.
+- Misma clave con otro cuerpo -> 422. Si el handler falla no se guarda nada:
+  el cliente puede reintentar con la misma clave.
+
+La clave se aísla por método + ruta. El store es por proceso: con varios
+workers, el balanceador debe enrutar por cliente o los reintentos pueden caer
+en otro worker.
+"""
+import asyncio, hashlib, os, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+from app.core import serialization
+
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "86400") or 86400)
+IDEMPOTENCY_MAX_KEYS = max(1, int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000") or 10000))
+MAX_KEY_LEN = 255
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires", "future")
+
+    def __init__(self, fingerprint: str, expires: float, future: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        self.future = future  # -> (status, body, media_type)
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_s: float = IDEMPOTENCY_TTL_S, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl_s = ttl_s
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self, now: float) -> None:
+        # Las entradas están en orden de inserción/uso; las vencidas salen por delante.
+        while self._entries:
+            key, e = next(iter(self._entries.items()))
+            if e.expires > now and len(self._entries) <= self.max_keys:
+                break
+            if not e.future.done() and e.expires > now:
+                break  # no expulsar una petición en curso
+            self._entries.popitem(last=False)
+
+    async def run(self, key: str, fingerprint: str,
+                  fn: Callable[[], Awaitable[Any]], status_code: int = 200):
+        """Devuelve (status, body, media_type, replayed)."""
+        now = time.monotonic()
+        e = self._entries.get(key)
+        if e is not None and e.expires <= now and e.future.done():
+            del self._entries[key]
+            e = None
+        if e is not None:
+            if e.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key reutilizada con otra petición")
+            self._entries.move_to_end(key)
+            self.hits += 1
+            try:
+                status, body, media_type = await asyncio.shield(e.future)
+            except asyncio.CancelledError:
+                if e.future.cancelled():  # la primera se canceló (cliente se fue): ejecutar ésta
+                    return await self.run(key, fingerprint, fn, status_code)
+                raise
+            return status, body, media_type, True
+
+        self.misses += 1
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._entries[key] = _Entry(fingerprint, now + self.ttl_s, fut)
+        self._evict(now)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._entries.pop(key, None)
+            fut.cancel()
+            raise
+        except Exception as exc:
+            self._entries.pop(key, None)
+            fut.set_exception(exc)
+            fut.exception()  # marcada como recuperada aunque nadie esté esperando
+            raise
+        if isinstance(result, Response):
+            out = (result.status_code, bytes(result.body), result.media_type)
+        else:
+            out = (status_code, serialization.dumps(result), "application/json")
+        fut.set_result(out)
+        return (*out, False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+store = IdempotencyStore()
+
+
+async def handle(request: Request, key: Optional[str],
+                 fn: Callable[[], Awaitable[Any]], status_code: int = 200) -> Any:
+    """
+    Envuelve un handler. Sin clave ejecuta fn() tal cual (respuesta normal de
+    FastAPI); con clave devuelve un Response con el cuerpo guardado.
+    """
+    if key is None:
+        return await fn()
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LEN:
+        raise HTTPException(status_code=400, detail="Idempotency-Key inválida")
+    body = await request.body()
+    fingerprint = hashlib.sha256(request.url.query.encode() + b"\n" + body).hexdigest()
+    scoped = f"{request.method} {request.url.path} {key}"
+    status, content, media_type, replayed = await store.run(scoped, fingerprint, fn, status_code)
+    headers = {"Idempotency-Key": key}
+    if replayed:
+        headers["Idempotency-Replayed"] = "true"
+    return Response(content=content, status_code=status, media_type=media_type, headers=headers)
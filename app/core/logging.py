@@ -1,7 +1,142 @@
-﻿import logging
+﻿import atexit, contextvars, json, logging, os, queue, random, sys, uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
 
 LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s - %(message)s"
 
-def setup_logging(level: int = logging.INFO):
-    logging.basicConfig(level=level, format=LOG_FORMAT)
+# Claves cuyo valor nunca debe llegar a los logs (comparación en minúsculas).
+REDACT_KEYS = {
+    "authorization", "token", "access_token", "refresh_token", "api_key", "x-api-key",
+    "secret", "password", "client_secret", "x-signature", "x-hub-signature-256",
+}
+MAX_FIELD_CHARS = 512
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_listener: Optional[QueueListener] = None
+
+
+def redact(obj: Any, _depth: int = 0) -> Any:
+    """Copia del payload con secretos enmascarados y strings largos truncados."""
+    if _depth > 6:
+        return "…"
+    if isinstance(obj, dict):
+        return {
+            k: ("***" if str(k).lower() in REDACT_KEYS else redact(v, _depth + 1))
+            for k, v in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [redact(v, _depth + 1) for v in obj[:50]]
+    if isinstance(obj, (bytes, bytearray)):
+        obj = obj.decode("utf-8", errors="replace")
+    if isinstance(obj, str) and len(obj) > MAX_FIELD_CHARS:
+        return obj[:MAX_FIELD_CHARS] + f"…(+{len(obj) - MAX_FIELD_CHARS})"
+    return obj
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por evento. `extra={"payload": ...}` se redacta aquí (hilo del listener)."""
+
+    _STD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sample"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        rid = getattr(record, "request_id", None)
+        if rid:
+            out["request_id"] = rid
+        for k, v in vars(record).items():
+            if k not in self._STD:
+                out[k] = redact(v)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Emitir = filtrar + capturar request_id + queue.put. El formateo (mensaje,
+    JSON, redacción) ocurre en el hilo del QueueListener. Como la cola es
+    en-proceso, no hace falta el prepare() estándar que formatea en el caller.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Descarta eventos con `extra={"sample": p}` con probabilidad 1-p."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        p = getattr(record, "sample", None)
+        return p is None or random.random() < p
+
+
+def setup_logging(level: int = logging.INFO, json_format: Optional[bool] = None):
+    global _listener
+    if json_format is None:
+        json_format = os.getenv("LOG_JSON", "1").lower() in ("1", "true", "yes")
+    env_level = os.getenv("LOG_LEVEL", "").upper()
+    if env_level:
+        level = logging.getLevelName(env_level)
+        if not isinstance(level, int):
+            level = logging.INFO
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is None:
+        sink = logging.StreamHandler(sys.stdout)
+        sink.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+        q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        qh = _ContextQueueHandler(q)
+        qh.addFilter(SamplingFilter())
+        root.handlers = [h for h in root.handlers if not isinstance(h, _ContextQueueHandler)] + [qh]
+        _listener = QueueListener(q, sink, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown_logging)
     return logging.getLogger("ameth")
+
+
+def shutdown_logging():
+    """Vacía la cola y detiene el listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """Propaga/genera X-Request-ID y lo deja en request_id_var para los logs."""
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = None
+        for k, v in scope.get("headers") or ():
+            if k == self.header:
+                rid = v.decode("latin-1")[:128]
+                break
+        rid = rid or uuid.uuid4().hex
+        token = request_id_var.set(rid)
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.header, rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            request_id_var.reset(token)
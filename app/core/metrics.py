@@ -0,0 +1,121 @@
+# app/core/metrics.py
+"""
+Métricas en memoria con exposición en formato texto de Prometheus.
+
+Sin dependencias externas: histogramas con buckets fijos, un lock por
+histograma y una observación = bisect + 3 sumas.
+
+    with metrics.timed(metrics.STORAGE, store="finance_json", op="load"):
+        ...
+"""
+import threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, name: str, help_: str, labelnames: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [conteo por bucket (+Inf al final), suma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for key, counts, total, n in series:
+            base = ",".join(f'{ln}="{_esc(lv)}"' for ln, lv in zip(self.labelnames, key))
+            sep = "," if base else ""
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {acc}')
+            out.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {n}')
+            out.append(f"{self.name}_sum{{{base}}} {total}")
+            out.append(f"{self.name}_count{{{base}}} {n}")
+        return out
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUESTS = Histogram(
+    "ameth_http_request_duration_seconds", "Latencia de requests HTTP por ruta.",
+    ("method", "route", "status"),
+)
+STORAGE = Histogram(
+    "ameth_storage_duration_seconds", "Duración de operaciones de almacenamiento.",
+    ("store", "op"),
+)
+UPSTREAM = Histogram(
+    "ameth_upstream_duration_seconds", "Duración de llamadas salientes (MP, Telegram, WhatsApp).",
+    ("service", "op"),
+)
+REGISTRY: List[Histogram] = [REQUESTS, STORAGE, UPSTREAM]
+
+
+@contextmanager
+def timed(hist: Histogram, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - t0, **labels)
+
+
+def render_latest() -> str:
+    lines: List[str] = []
+    for h in REGISTRY:
+        lines.extend(h.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware, que agrega una task por
+    request). La etiqueta 'route' es la plantilla de la ruta ('/finance/records/{rec_id}'),
+    no el path crudo, para acotar la cardinalidad.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUESTS.observe(
+                time.perf_counter() - t0,
+                method=scope.get("method", ""), route=route, status=status["code"],
+            )
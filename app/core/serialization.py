@@ -0,0 +1,19 @@
+# app/core/serialization.py
+"""
+JSON rápido para respuestas grandes: orjson si está instalado, si no el json
+estándar. Pensado para datos que ya se validaron al escribirse (registros del
+repositorio): se serializan tal cual, sin pasar por Pydantic ni jsonable_encoder.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # opcional: el fallback es más lento pero equivalente
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
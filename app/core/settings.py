@@ -0,0 +1,131 @@
+# app/core/settings.py
+"""
+Configuración centralizada: .env se carga UNA vez (aquí) y las variables se
+leen a un objeto inmutable. Los módulos importan `settings` en vez de llamar
+load_dotenv/os.getenv por su cuenta.
+"""
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List
+
+
+def _flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def _csv(name: str) -> List[str]:
+    return [x.strip() for x in os.getenv(name, "").split(",") if x.strip()]
+
+
+def _kv_ints(name: str, default: str) -> Dict[str, int]:
+    """'a=1,b=2' -> {'a': 1, 'b': 2} (entradas inválidas se ignoran)."""
+    out: Dict[str, int] = {}
+    for part in (os.getenv(name) or default).split(","):
+        k, _, v = part.partition("=")
+        if k.strip() and v.strip().isdigit():
+            out[k.strip()] = max(1, int(v))
+    return out
+
+
+@dataclass(frozen=True)
+class Settings:
+    cors_origins: List[str] = field(default_factory=list)
+    # Integraciones opcionales montadas en app.main (AMETH_ROUTERS)
+    enabled_routers: List[str] = field(default_factory=list)
+
+    # Mercado Pago
+    mp_access_token: str = ""
+    mp_webhook_secret: str = ""
+    mp_api_base: str = "https://api.mercadopago.com"
+    base_url: str = ""
+    ameth_internal_url: str = "http://127.0.0.1:8000"
+    kyaru_record_endpoint: str = "/recordFinance"
+    debug_mp: bool = False
+
+    # Google OAuth
+    google_scopes: List[str] = field(default_factory=list)
+    google_client_id: str = ""
+    google_client_secret: str = ""
+    google_redirect_uri: str = ""
+    google_tokens_dir: str = "./data/tokens"
+
+    # Google Sheets (app/services/sheets_sync.py)
+    sheets_spreadsheet_id: str = ""
+    sheets_api_base: str = "https://sheets.googleapis.com/v4"
+    sheets_debounce_s: float = 2.0
+
+    # Twilio
+    twilio_account_sid: str = ""
+    twilio_auth_token: str = ""
+    twilio_whatsapp_from: str = "whatsapp:+14155238886"
+    twilio_api_base: str = "https://api.twilio.com"
+
+    # Telegram / WhatsApp Cloud
+    telegram_bot_token: str = ""
+    telegram_chat_id: str = ""
+    telegram_api_base: str = "https://api.telegram.org"
+    telegram_webhook_secret: str = ""
+    whatsapp_token: str = ""
+    phone_number_id: str = ""
+    whatsapp_api_base: str = "https://graph.facebook.com/v19.0"
+    whatsapp_app_secret: str = ""
+    whatsapp_max_body: int = 1024 * 1024
+
+    # Gateway de mensajería (app/services/gateway.py)
+    gateway_concurrency: Dict[str, int] = field(default_factory=dict)
+    gateway_max_retries: int = 3
+    gateway_breaker_threshold: int = 5
+    gateway_breaker_reset_s: float = 30.0
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    try:
+        from dotenv import load_dotenv
+        # Cargar .env en local (en hosting vendrán del sistema)
+        load_dotenv(override=True)
+    except ImportError:
+        pass
+    return Settings(
+        cors_origins=_csv("CORS_ORIGINS"),
+        enabled_routers=_csv("AMETH_ROUTERS") or ["messaging", "mercadopago", "finance"],
+        mp_access_token=os.getenv("MP_ACCESS_TOKEN", ""),
+        mp_webhook_secret=os.getenv("MP_WEBHOOK_SECRET", ""),
+        mp_api_base=os.getenv("MP_API_BASE", "https://api.mercadopago.com").rstrip("/"),
+        base_url=os.getenv("BASE_URL", ""),
+        ameth_internal_url=os.getenv("AMETH_INTERNAL_URL", "http://127.0.0.1:8000"),
+        kyaru_record_endpoint=os.getenv("KYARU_RECORD_ENDPOINT", "/recordFinance"),
+        debug_mp=_flag("DEBUG_MP"),
+        google_scopes=os.getenv("GOOGLE_SCOPES", "").split(),
+        google_client_id=os.getenv("GOOGLE_CLIENT_ID", ""),
+        google_client_secret=os.getenv("GOOGLE_CLIENT_SECRET", ""),
+        google_redirect_uri=os.getenv("GOOGLE_REDIRECT_URI", ""),
+        google_tokens_dir=os.getenv("GOOGLE_TOKENS_DIR", "./data/tokens"),
+        sheets_spreadsheet_id=os.getenv("SHEETS_SPREADSHEET_ID", ""),
+        sheets_api_base=os.getenv("SHEETS_API_BASE", "https://sheets.googleapis.com/v4"),
+        sheets_debounce_s=float(os.getenv("SHEETS_DEBOUNCE_S", "2") or 2),
+        twilio_account_sid=os.getenv("TWILIO_ACCOUNT_SID", ""),
+        twilio_auth_token=os.getenv("TWILIO_AUTH_TOKEN", ""),
+        twilio_whatsapp_from=os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886"),
+        twilio_api_base=os.getenv("TWILIO_API_BASE", "https://api.twilio.com").rstrip("/"),
+        telegram_bot_token=os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("TELEGRAM_TOKEN") or "",
+        telegram_chat_id=os.getenv("TELEGRAM_CHAT_ID", ""),
+        telegram_api_base=os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/"),
+        telegram_webhook_secret=os.getenv("TELEGRAM_WEBHOOK_SECRET", ""),
+        whatsapp_token=os.getenv("WHATSAPP_TOKEN", ""),
+        phone_number_id=os.getenv("PHONE_NUMBER_ID", ""),
+        whatsapp_api_base=os.getenv("WHATSAPP_API_BASE", "https://graph.facebook.com/v19.0").rstrip("/"),
+        whatsapp_app_secret=os.getenv("WHATSAPP_APP_SECRET", ""),
+        whatsapp_max_body=int(os.getenv("WHATSAPP_MAX_BODY", str(1024 * 1024)) or 1024 * 1024),
+        gateway_concurrency=_kv_ints(
+            "GATEWAY_CONCURRENCY",
+            "telegram=8,whatsapp_cloud=16,twilio=" + (os.getenv("TWILIO_CONCURRENCY") or "8"),
+        ),
+        gateway_max_retries=max(0, int(os.getenv("GATEWAY_MAX_RETRIES") or os.getenv("TWILIO_MAX_RETRIES") or 3)),
+        gateway_breaker_threshold=max(1, int(os.getenv("GATEWAY_BREAKER_THRESHOLD", "5") or 5)),
+        gateway_breaker_reset_s=float(os.getenv("GATEWAY_BREAKER_RESET_S", "30") or 30),
+    )
+
+
+settings = get_settings()
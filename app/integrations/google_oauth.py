@@ -1,16 +1,25 @@
-﻿import os, pathlib
-from typing import Tuple
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-
-SCOPES = os.getenv("GOOGLE_SCOPES", "").split()
-CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
-TOKENS_DIR = pathlib.Path("./data/tokens"); TOKENS_DIR.mkdir(parents=True, exist_ok=True)
+﻿from __future__ import annotations
+
+import asyncio, logging, os, pathlib, threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from app.core.settings import settings
+
+# google-auth se importa dentro de cada función: es pesado y opcional.
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import Flow
+
+SCOPES = settings.google_scopes
+CLIENT_ID = settings.google_client_id
+CLIENT_SECRET = settings.google_client_secret
+REDIRECT_URI = settings.google_redirect_uri
+TOKENS_DIR = pathlib.Path(settings.google_tokens_dir)
 TOKEN_PATH = TOKENS_DIR / "google_token.json"
 
 def build_flow() -> Flow:
+    from google_auth_oauthlib.flow import Flow
     return Flow.from_client_config(
         {
             "web": {
@@ -25,22 +34,109 @@ def build_flow() -> Flow:
         redirect_uri=REDIRECT_URI
     )
 
-def save_creds(creds: Credentials):
-    with open(TOKEN_PATH, "w", encoding="utf-8") as f:
+# Margen antes de expirar en que el refresher en background renueva el token.
+REFRESH_MARGIN_S = 300
+log = logging.getLogger("ameth.google")
+
+
+def _write_atomic(creds: Credentials) -> None:
+    TOKENS_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = TOKEN_PATH.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
         f.write(creds.to_json())
+    os.replace(tmp, TOKEN_PATH)
 
-def load_creds() -> Credentials | None:
+
+class CredentialHolder:
+    """
+    Credenciales en memoria: el disco se lee una vez y el refresh lo hace
+    run_refresher() antes de la expiración. Un lock garantiza un solo
+    refresh a la vez (el que llega segundo reutiliza el resultado).
+    """
+
+    def __init__(self):
+        self._creds: Optional[Credentials] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> Optional[Credentials]:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._creds = _read_token_file()
+                    self._loaded = True
+        return self._creds
+
+    def set(self, creds: Optional[Credentials]) -> None:
+        with self._lock:
+            self._creds = creds
+            self._loaded = True
+
+    def seconds_left(self) -> Optional[float]:
+        creds = self._load()
+        if not creds or not creds.expiry:
+            return None
+        return (creds.expiry - datetime.utcnow()).total_seconds()
+
+    def refresh(self, force: bool = False) -> Optional[Credentials]:
+        creds = self._load()
+        if not creds or not creds.refresh_token:
+            return creds
+        with self._lock:
+            creds = self._creds
+            # otro hilo ya refrescó mientras esperábamos el lock
+            if not force and creds.valid and (creds.expiry is None or
+                    (creds.expiry - datetime.utcnow()).total_seconds() > REFRESH_MARGIN_S):
+                return creds
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
+            _write_atomic(creds)
+            return creds
+
+    def get(self) -> Optional[Credentials]:
+        creds = self._load()
+        if creds and not creds.valid and creds.refresh_token:
+            # respaldo: el refresher no alcanzó (o no está corriendo)
+            creds = self.refresh(force=True)
+        return creds
+
+
+holder = CredentialHolder()
+
+
+async def run_refresher(min_sleep: float = 30.0) -> None:
+    """Task de fondo: duerme hasta (expiry - margen) y refresca en un hilo."""
+    while True:
+        left = await asyncio.to_thread(holder.seconds_left)
+        if left is not None and left <= REFRESH_MARGIN_S:
+            try:
+                await asyncio.to_thread(holder.refresh)
+                after = await asyncio.to_thread(holder.seconds_left)
+                if after is not None and after > left:
+                    continue  # la expiración avanzó: recalcular la espera
+                # sin refresh_token (o sin cambio): no reintentar en caliente
+                log.warning("google token not refreshed", extra={"seconds_left": after})
+            except Exception as e:
+                log.warning("google token refresh failed: %s", e)
+        wait = (left - REFRESH_MARGIN_S) if left is not None else 600.0
+        await asyncio.sleep(max(min_sleep, wait))
+
+
+def save_creds(creds: Credentials):
+    _write_atomic(creds)
+    holder.set(creds)
+
+def _read_token_file() -> Credentials | None:
     if TOKEN_PATH.exists():
+        from google.oauth2.credentials import Credentials
         return Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
     return None
 
+def load_creds() -> Credentials | None:
+    return holder.get()
+
 def ensure_creds() -> Tuple[Credentials, bool]:
-    creds = load_creds()
+    creds = holder.get()
     if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            from google.auth.transport.requests import Request
-            creds.refresh(Request())
-            save_creds(creds)
-            return creds, False
         return None, True
     return creds, False
@@ -3,27 +3,34 @@ import os
 import json
 import hmac
 import hashlib
+import logging
 from typing import Dict, Any
 
-import httpx
 from fastapi import APIRouter, Request, HTTPException
 
+from app.core import executors, metrics
+from app.core.settings import settings
+from app.services import budgets, classifier, fx
+
 router = APIRouter()
+log = logging.getLogger("ameth.mercadopago")
 
 # ====== Env Vars ======
-MP_ACCESS_TOKEN: str = os.getenv("MP_ACCESS_TOKEN", "")
-MP_WEBHOOK_SECRET: str = os.getenv("MP_WEBHOOK_SECRET", "")
-AMETH_INTERNAL_URL: str = os.getenv("AMETH_INTERNAL_URL", "http://127.0.0.1:8000")
-KYARU_RECORD_ENDPOINT: str = os.getenv("KYARU_RECORD_ENDPOINT", "/recordFinance")
-DEBUG_MP: bool = os.getenv("DEBUG_MP", "0").lower() in ("1", "true", "yes")
+MP_ACCESS_TOKEN: str = settings.mp_access_token
+MP_WEBHOOK_SECRET: str = settings.mp_webhook_secret
+MP_API_BASE: str = settings.mp_api_base
+AMETH_INTERNAL_URL: str = settings.ameth_internal_url
+KYARU_RECORD_ENDPOINT: str = settings.kyaru_record_endpoint
+DEBUG_MP: bool = settings.debug_mp
 
 # ====== Utils ======
-def _debug(*args):
+def _debug(*args, payload: Any = None):
+    # Formateo diferido: en el request sólo se encola el LogRecord.
+    # Datos sensibles (firma, body, movimiento) van en `payload`: el formatter
+    # los pasa por app.core.logging.redact; los args posicionales no se redactan.
     if DEBUG_MP:
-        try:
-            print(*args, flush=True)
-        except Exception:
-            pass
+        extra = {"payload": payload} if payload is not None else None
+        log.info(" ".join(["%s"] * len(args)), *args, extra=extra)
 
 def parse_signature(sig_header: str) -> Dict[str, str]:
     """
@@ -65,9 +72,11 @@ def verify_mp_signature(x_signature: str, x_request_id: str, body: bytes) -> boo
         return False
 
 async def kyaru_post_movimiento(mov: Dict[str, Any]) -> None:
+    import httpx  # diferido: no pesa en el arranque
     url = f"{AMETH_INTERNAL_URL.rstrip('/')}{KYARU_RECORD_ENDPOINT}"
     async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(url, json=mov)
+        with metrics.timed(metrics.UPSTREAM, service="kyaru", op="record"):
+            r = await client.post(url, json=mov)
         r.raise_for_status()
 
 # ====== Endpoints ======
@@ -81,10 +90,17 @@ async def mercadopago_webhook(request: Request):
     x_sig = request.headers.get("x-signature")
     x_req = request.headers.get("x-request-id")
 
-    # Logs de diagnóstico (activar con DEBUG_MP=1)
-    _debug("SIG:", x_sig)
-    _debug("REQ:", x_req)
-    _debug("BODY:", raw.decode("utf-8", errors="ignore"))
+    # Parseo seguro del body
+    try:
+        payload = json.loads(raw.decode("utf-8") or "{}")
+    except Exception:
+        payload = {}
+
+    # Log de diagnóstico (activar con DEBUG_MP=1), redactado
+    _debug("mp webhook in", payload={
+        "headers": {"x-signature": x_sig, "x-request-id": x_req},
+        "body": payload or raw.decode("utf-8", errors="ignore"),
+    })
 
     # Validación condicional de firma:
     # - si hay MP_WEBHOOK_SECRET => exigir firma válida
@@ -92,12 +108,6 @@ async def mercadopago_webhook(request: Request):
     if MP_WEBHOOK_SECRET and not verify_mp_signature(x_sig, x_req, raw):
         raise HTTPException(status_code=400, detail="invalid signature")
 
-    # Parseo seguro del body
-    try:
-        payload = json.loads(raw.decode("utf-8") or "{}")
-    except Exception:
-        payload = {}
-
     # Tolerar simulador / pruebas: live_mode:false => responder 200 sin consultar API
     if not payload or payload.get("live_mode") is False:
         _debug("Simulador o live_mode:false → 200 OK")
@@ -110,12 +120,14 @@ async def mercadopago_webhook(request: Request):
     # Consultar detalle del pago (tolerante a errores: si falla, igual respondemos 200)
     detalle = None
     try:
+        import httpx
         headers = {"Authorization": f"Bearer {MP_ACCESS_TOKEN}"} if MP_ACCESS_TOKEN else {}
         async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.get(
-                f"https://api.mercadopago.com/v1/payments/{payment_id}",
-                headers=headers or None,
-            )
+            with metrics.timed(metrics.UPSTREAM, service="mercadopago", op="get_payment"):
+                resp = await client.get(
+                    f"{MP_API_BASE}/v1/payments/{payment_id}",
+                    headers=headers or None,
+                )
         if resp.status_code >= 400:
             _debug("MP payments API non-200:", resp.status_code, resp.text)
             return {"ok": True}  # no romper flujo por pruebas o ids ficticios
@@ -140,11 +152,29 @@ async def mercadopago_webhook(request: Request):
         if status in ["refunded", "charged_back", "cancelled", "canceled"]:
             tipo = "ajuste"
 
+        # Montos en CLP con la tasa del día del pago (app.services.fx); sin tasa
+        # se conserva el valor nominal y se marca fx_pendiente.
+        fx_pendiente = False
+        monto_clp, monto_bruto = round(float(net)), round(float(amount))
+        if (currency or fx.BASE_CURRENCY).upper() != fx.BASE_CURRENCY:
+            net_clp = fx.to_clp(net, currency, str(date or "")[:10])
+            bruto_clp = fx.to_clp(amount, currency, str(date or "")[:10])
+            if net_clp is None or bruto_clp is None:
+                fx_pendiente = True
+                log.warning("mp payment without fx rate", extra={"currency": currency, "payment_id": payment_id})
+            else:
+                monto_clp, monto_bruto = net_clp, bruto_clp
+
+        # classify() puede construir el índice (lee el historial): fuera del loop
+        categoria = await executors.run_read(classifier.classify, desc)
         mov = {
             "fecha": date,
             "concepto": desc,
-            "monto_clp": round(float(net)),
-            "monto_bruto": round(float(amount)),
+            "categoria": categoria,
+            "monto_clp": monto_clp,
+            "monto_bruto": monto_bruto,
+            "monto": str(net),
+            "fx_pendiente": fx_pendiente,
             "comision": 0,
             "moneda": currency,
             "origen": "mercado_pago",
@@ -152,8 +182,12 @@ async def mercadopago_webhook(request: Request):
             "estado": status,
             "tipo": tipo,
         }
-        _debug("MOV→Kyaru:", mov)
+        _debug("MOV→Kyaru", payload=mov)
         await kyaru_post_movimiento(mov)
+        if tipo == "gasto" and status == "approved":
+            # no pasa por el repositorio: se suma aparte al presupuesto (dedupe por referencia)
+            await executors.run_read(budgets.record_external, str(date or "")[:7],
+                                     mov["categoria"], mov["monto_clp"], f"mp:{payment_id}")
     except Exception as e:
         _debug("Error armando/enviando mov:", repr(e))
         # No interrumpir; igualmente devolver OK para evitar reintentos del simulador
@@ -1,9 +1,23 @@
 ﻿# app/integrations/messaging.py
 from fastapi import APIRouter, HTTPException, Request, Query
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional
+import hashlib
+import hmac
+import json
 import os
+import logging
+
+from app.core.settings import settings
+from app.services import commands, gateway, inbox
 
 router = APIRouter(prefix="/messaging", tags=["messaging"])
+log = logging.getLogger("ameth.messaging")
+
+# Mensajes entrantes con comandos de finanzas ("gasto 6000 almuerzo comida")
+inbox.register(commands.handle_event)
+
+# Fracción de webhooks de WhatsApp que se registran con payload (0..1).
+WHATSAPP_LOG_SAMPLE = float(os.getenv("WHATSAPP_LOG_SAMPLE", "1") or 1)
 
 
 # ---------------------------------------------------------------------
@@ -14,7 +28,19 @@ def messaging_health():
     """
     Simple healthcheck para el namespace /messaging.
     """
-    return {"status": "ok", "service": "whatsapp"}
+    return {"status": "ok", "service": "whatsapp", "circuits": gateway.health(), "inbox": inbox.stats()}
+
+
+@router.get("/deliveries/{delivery_id}")
+def delivery_status(delivery_id: str):
+    """
+    Estado de un envío hecho por el gateway (queued/sent/failed).
+    Sólo se conservan las últimas entregas en memoria.
+    """
+    d = gateway.get_delivery(delivery_id)
+    if not d:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return d
 
 
 # ---------------------------------------------------------------------
@@ -49,24 +75,125 @@ def whatsapp_verify(
     raise HTTPException(status_code=403, detail="Verification failed")
 
 
+def verify_hub_signature(secret: str, header: Optional[str], raw: bytes) -> bool:
+    """X-Hub-Signature-256: 'sha256=<hex>' = HMAC-SHA256(app_secret, body crudo)."""
+    if not header or not header.startswith("sha256="):
+        return False
+    digest = hmac.new(secret.encode(), raw, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(digest, header[7:])
+
+
+async def _read_capped(request: Request, cap: int) -> bytes:
+    """Lee el body por chunks y corta con 413 apenas supera `cap` bytes."""
+    cl = request.headers.get("content-length")
+    if cl and cl.isdigit() and int(cl) > cap:
+        raise HTTPException(status_code=413, detail="payload too large")
+    buf = bytearray()
+    async for chunk in request.stream():
+        buf += chunk
+        if len(buf) > cap:
+            raise HTTPException(status_code=413, detail="payload too large")
+    return bytes(buf)
+
+
+def iter_whatsapp_events(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre entry[] -> changes[] -> value.{messages,statuses}[] y emite un
+    evento plano por item (Meta agrupa varios por entrega).
+    """
+    for entry in payload.get("entry") or ():
+        for change in (entry or {}).get("changes") or ():
+            value = (change or {}).get("value") or {}
+            phone_id = (value.get("metadata") or {}).get("phone_number_id")
+            names = {c.get("wa_id"): (c.get("profile") or {}).get("name") for c in value.get("contacts") or ()}
+            for msg in value.get("messages") or ():
+                yield {
+                    "source": "whatsapp",
+                    "kind": "message",
+                    "id": msg.get("id"),
+                    "from": msg.get("from"),
+                    "name": names.get(msg.get("from")),
+                    "type": msg.get("type"),
+                    "text": (msg.get("text") or {}).get("body"),
+                    "timestamp": msg.get("timestamp"),
+                    "phone_number_id": phone_id,
+                }
+            for st in value.get("statuses") or ():
+                yield {
+                    "source": "whatsapp",
+                    "kind": "status",
+                    "id": st.get("id"),
+                    "status": st.get("status"),
+                    "recipient": st.get("recipient_id"),
+                    "timestamp": st.get("timestamp"),
+                    "phone_number_id": phone_id,
+                }
+
+
 @router.post("/whatsapp/webhook")
 async def whatsapp_webhook(request: Request):
     """
     Recepción de eventos de WhatsApp Cloud API.
-    De momento, solo registra el payload y responde ok.
+    Body acotado (WHATSAPP_MAX_BODY), firma verificada si hay
+    WHATSAPP_APP_SECRET; cada mensaje/estado se publica en app.services.inbox
+    y se responde de inmediato (el procesamiento es asíncrono).
     """
+    raw = await _read_capped(request, settings.whatsapp_max_body)
+    if settings.whatsapp_app_secret and not verify_hub_signature(
+        settings.whatsapp_app_secret, request.headers.get("x-hub-signature-256"), raw
+    ):
+        raise HTTPException(status_code=401, detail="invalid signature")
     try:
-        body: Dict[str, Any] = await request.json()
-        # Aquí podrías parsear y actuar: enviar respuesta, guardar en DB, etc.
-        print("[WHATSAPP][in]", body)
-        return {"ok": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"whatsapp_webhook_error: {e}")
+        body = json.loads(raw or b"{}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid json")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="invalid payload")
+
+    queued = dropped = 0
+    for evt in iter_whatsapp_events(body):
+        if inbox.publish(evt):
+            queued += 1
+        else:
+            dropped += 1
+    log.info("whatsapp webhook in", extra={"queued": queued, "dropped": dropped, "bytes": len(raw),
+                                           "sample": WHATSAPP_LOG_SAMPLE})
+    return {"ok": True, "queued": queued}
 
 
 # ---------------------------------------------------------------------
 # Telegram
 # ---------------------------------------------------------------------
+@router.post("/telegram/webhook")
+async def telegram_webhook(request: Request):
+    """
+    Updates del bot de Telegram (setWebhook). Si hay TELEGRAM_WEBHOOK_SECRET,
+    se exige en X-Telegram-Bot-Api-Secret-Token. El mensaje se publica en el
+    inbox y se responde de inmediato.
+    """
+    if settings.telegram_webhook_secret and not hmac.compare_digest(
+        request.headers.get("x-telegram-bot-api-secret-token") or "", settings.telegram_webhook_secret
+    ):
+        raise HTTPException(status_code=401, detail="invalid secret")
+    raw = await _read_capped(request, settings.whatsapp_max_body)
+    try:
+        update = json.loads(raw or b"{}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid json")
+    msg = (update or {}).get("message") or (update or {}).get("edited_message") or {}
+    if msg.get("text"):
+        inbox.publish({
+            "source": "telegram",
+            "kind": "message",
+            "id": f"tg:{update.get('update_id')}",
+            "chat_id": str((msg.get("chat") or {}).get("id") or ""),
+            "from": str((msg.get("from") or {}).get("id") or ""),
+            "text": msg["text"],
+            "timestamp": msg.get("date"),
+        })
+    return {"ok": True}
+
+
 @router.post("/telegram/test")
 async def telegram_test():
     """
@@ -76,8 +203,8 @@ async def telegram_test():
     try:
         from app.integrations.telegram_client import send_telegram
 
-        token = os.getenv("TELEGRAM_TOKEN")
-        chat = os.getenv("TELEGRAM_CHAT_ID")
+        token = settings.telegram_bot_token
+        chat = settings.telegram_chat_id
 
         if not token or not chat:
             raise RuntimeError(
@@ -103,8 +230,8 @@ async def telegram_send(
     try:
         from app.integrations.telegram_client import send_telegram
 
-        token = os.getenv("TELEGRAM_TOKEN")
-        chat = os.getenv("TELEGRAM_CHAT_ID")
+        token = settings.telegram_bot_token
+        chat = settings.telegram_chat_id
 
         if not token or not chat:
             raise RuntimeError(
@@ -1,29 +1,46 @@
 # app/integrations/telegram.py
-import os
+import threading
 import requests
 from typing import Optional
 
+from app.core import metrics
+from app.core.settings import settings
+
 class TelegramConfigError(RuntimeError):
     pass
 
+# Sesión compartida (keep-alive) para los envíos sync; los async van por
+# app.services.gateway.
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+    return _session
+
 def _get_config():
-    token = os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("TELEGRAM_TOKEN")
-    chat_id = os.getenv("TELEGRAM_CHAT_ID")
+    token = settings.telegram_bot_token
+    chat_id = settings.telegram_chat_id
     if not token:
         raise TelegramConfigError("Falta TELEGRAM_BOT_TOKEN/TELEGRAM_TOKEN")
     if not chat_id:
         raise TelegramConfigError("Falta TELEGRAM_CHAT_ID")
-    base_url = f"https://api.telegram.org/bot{token}"
+    base_url = f"{settings.telegram_api_base}/bot{token}"
     return base_url, chat_id
 
 def send_message(text: str, chat_id: Optional[str] = None) -> dict:
     base_url, default_chat = _get_config()
     cid = chat_id or default_chat
     url = f"{base_url}/sendMessage"
-    resp = requests.post(
-        url,
-        json={"chat_id": cid, "text": text, "parse_mode": "HTML"},
-        timeout=15,
-    )
+    with metrics.timed(metrics.UPSTREAM, service="telegram", op="sendMessage"):
+        resp = _get_session().post(
+            url,
+            json={"chat_id": cid, "text": text, "parse_mode": "HTML"},
+            timeout=15,
+        )
     resp.raise_for_status()
     return resp.json()
@@ -1,30 +1,19 @@
-﻿import os
-import requests
-from typing import Optional
+﻿from typing import Optional
 
-# Compatibilidad: acepta TELEGRAM_BOT_TOKEN o TELEGRAM_TOKEN
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("TELEGRAM_TOKEN")
-CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}" if BOT_TOKEN else None
+# Compatibilidad: mismo API que antes, pero un solo camino de envío.
+# - send_message (sync): app.integrations.telegram (sesión HTTP compartida)
+# - send_telegram (async): app.services.gateway
+from app.integrations.telegram import TelegramConfigError, send_message
+from app.services import gateway
 
-class TelegramConfigError(RuntimeError):
-    pass
+async def send_telegram(text: str, chat_id: Optional[str] = None) -> dict:
+    """Envía un mensaje a Telegram sin bloquear el event loop."""
+    try:
+        d = await gateway.send("telegram", chat_id, text)
+    except gateway.GatewayError as e:
+        raise TelegramConfigError(str(e))
+    if d["status"] != "sent":
+        raise RuntimeError(f"telegram: {d['error']}")
+    return d
 
-def send_message(text: str, chat_id: Optional[str] = None) -> dict:
-    """
-    Envía un mensaje a Telegram. Usa variables de entorno:
-    TELEGRAM_BOT_TOKEN y TELEGRAM_CHAT_ID.
-    """
-    if not BOT_TOKEN or not BASE_URL:
-        raise TelegramConfigError("Falta TELEGRAM_BOT_TOKEN/TELEGRAM_TOKEN")
-    cid = chat_id or CHAT_ID
-    if not cid:
-        raise TelegramConfigError("Falta TELEGRAM_CHAT_ID")
-    url = f"{BASE_URL}/sendMessage"
-    resp = requests.post(
-        url,
-        json={"chat_id": cid, "text": text, "parse_mode": "HTML"},
-        timeout=15
-    )
-    resp.raise_for_status()
-    return resp.json()
+__all__ = ["TelegramConfigError", "send_message", "send_telegram"]
@@ -1,12 +1,8 @@
-﻿import os, httpx
-WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
-PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
+﻿from app.services import gateway
 
 async def send_whatsapp(to: str, text: str):
-    url = f"https://graph.facebook.com/v19.0/{PHONE_NUMBER_ID}/messages"
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-    payload = {"messaging_product":"whatsapp","to":to,"type":"text","text":{"body":text}}
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(url, headers=headers, json=payload)
-        r.raise_for_status()
-        return r.json()
+    """WhatsApp Cloud API vía el gateway común (pool HTTP compartido)."""
+    d = await gateway.send("whatsapp_cloud", to, text)
+    if d["status"] != "sent":
+        raise RuntimeError(f"whatsapp_cloud: {d['error']}")
+    return d
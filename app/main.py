@@ -1,23 +1,22 @@
 ﻿# app/main.py
 from __future__ import annotations
 
-import os
+import importlib
 from typing import List
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.responses import PlainTextResponse
 
-# Cargar .env en local (en hosting vendrán del sistema)
-load_dotenv(override=True)
+# settings carga .env una sola vez (en hosting vendrán del sistema)
+from app.core.settings import settings
+from app.core import capture, metrics
+from app.core.logging import RequestIdMiddleware, setup_logging
 
-# Router de WhatsApp ya tiene prefix="/whatsapp" internamente
-from app.integrations.messaging import router as whatsapp_router
+log = setup_logging()
 
 
 def _origins_from_env() -> List[str]:
-    raw = os.getenv("CORS_ORIGINS", "")
-    items = [x.strip() for x in raw.split(",") if x.strip()]
-    return items or ["*"]  # por defecto permitir todo para pruebas
+    return settings.cors_origins or ["*"]  # por defecto permitir todo para pruebas
 
 app = FastAPI(
     title="Ameth API",
@@ -34,6 +33,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Métricas (latencia por ruta) ---
+# Se agrega al final para quedar más afuera y medir también CORS.
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
+# --- Captura de webhooks (sólo si WEBHOOK_CAPTURE_FILE; ver bench/webhook_replay.py) ---
+if capture.CAPTURE_FILE:
+    app.add_middleware(capture.WebhookCaptureMiddleware)
+
 # --- Rutas base ---
 @app.get("/", tags=["system"])
 def root():
@@ -43,28 +51,113 @@ def root():
 def health():
     return {"status": "ok", "service": "ameth", "version": "v1"}
 
-# --- Montar WhatsApp ---
-# OJO: NO repetir prefix aquí, ya lo trae el router (quedaría /whatsapp/whatsapp)
-app.include_router(whatsapp_router)
+@app.get("/metrics", tags=["system"], include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render_latest(), media_type="text/plain; version=0.0.4")
 
+# --- Integraciones opcionales ---
+# Se importan sólo si están habilitadas en AMETH_ROUTERS; un fallo de import
+# no tumba el arranque (se loguea y se sigue sin ese router).
+def _include_optional(name: str, module: str, **kwargs) -> bool:
+    if name not in settings.enabled_routers:
+        return False
+    try:
+        router = importlib.import_module(module).router
+        app.include_router(router, **kwargs)
+        return True
+    except Exception as e:
+        log.warning("%s router not loaded: %s", name, e)
+        return False
 
-from app.integrations.mercadopago import router as mp_router
-app.include_router(mp_router, prefix="/mp", tags=["mercado_pago"])
+# OJO: NO repetir prefix para messaging, ya lo trae el router
+_include_optional("messaging", "app.integrations.messaging")
+_include_optional("mercadopago", "app.integrations.mercadopago", prefix="/mp", tags=["mercado_pago"])
+_include_optional("finance", "app.routers.finance", prefix="/finance", tags=["finance"])
+# Checkout (preferencias, con caché y lote). Opt-in: no está en el default de
+# AMETH_ROUTERS porque también expone /mp/search con el token de MP.
+# El router ya trae prefix="/mp"; sus rutas no chocan con las de "mercadopago".
+_include_optional("mp_checkout", "app.mp_router")
 
-# === auto-include finance router ===
-finance = None
-try:
-    # preferir import relativo (estamos dentro del paquete 'app')
-    from .routers import finance as finance
-except Exception as e1:
-    try:
-        from app.routers import finance as finance
-    except Exception as e2:
-        print(f"Finance router not loaded: {e1 or e2}")
+@app.on_event("startup")
+async def _start_inbox():
+    from app.services import inbox
+    inbox.start()
 
-if finance:
-    try:
-        app.include_router(finance.router, prefix="/finance", tags=["finance"])
-    except Exception as e:
-        print(f"Finance router include failed: {e}")
-# === end auto-include ===
+@app.on_event("startup")
+async def _start_changes():
+    from app.services import changes
+    changes.start()
+
+@app.on_event("startup")
+async def _start_budgets():
+    from app.services import budgets
+    budgets.start()
+
+_bg_tasks = []
+
+@app.on_event("startup")
+async def _warm_classifier():
+    # El índice se arma leyendo todo el historial: en el pool de lectura y
+    # en segundo plano, así el primer webhook/comando no paga la carga.
+    import asyncio
+    from app.core import executors
+    from app.services import classifier
+    _bg_tasks.append(asyncio.ensure_future(executors.run_read(classifier.warm)))
+
+@app.on_event("startup")
+async def _start_google_refresher():
+    # Sólo si hay OAuth de Google configurado; el import es diferido.
+    if settings.google_client_id:
+        import asyncio
+        from app.integrations import google_oauth
+        _bg_tasks.append(asyncio.create_task(google_oauth.run_refresher()))
+
+@app.on_event("startup")
+async def _start_sheets_sync():
+    from app.services import sheets_sync
+    sheets_sync.start()
+
+@app.on_event("shutdown")
+async def _stop_sheets_sync():
+    from app.services import sheets_sync
+    await sheets_sync.stop()
+
+@app.on_event("shutdown")
+async def _stop_background_tasks():
+    for t in _bg_tasks:
+        t.cancel()
+    _bg_tasks.clear()
+
+@app.on_event("shutdown")
+def _stop_changes():
+    from app.services import changes
+    changes.stop()
+
+@app.on_event("shutdown")
+def _stop_budgets():
+    from app.services import budgets
+    budgets.stop()
+
+@app.on_event("shutdown")
+async def _stop_inbox():
+    from app.services import inbox
+    await inbox.stop()
+
+@app.on_event("shutdown")
+def _shutdown_executors():
+    from app.core import executors
+    executors.shutdown(wait=True)
+
+@app.on_event("shutdown")
+async def _shutdown_gateway():
+    from app.services import gateway
+    await gateway.aclose()
+
+@app.on_event("shutdown")
+def _close_capture():
+    capture.close()
+
+@app.on_event("shutdown")
+def _shutdown_logging():
+    from app.core.logging import shutdown_logging
+    shutdown_logging()
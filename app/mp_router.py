@@ -1,18 +1,107 @@
-﻿import os, httpx
-from fastapi import APIRouter, Request, Header
-from dotenv import load_dotenv
+﻿import asyncio, hashlib, json, os, time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
 
-load_dotenv()
+import httpx
+from fastapi import APIRouter, HTTPException, Request, Header
+from pydantic import BaseModel, Field
+
+from app.core import idempotency, metrics
+from app.core.settings import settings
 
 router = APIRouter(prefix="/mp", tags=["mercadopago"])
 
-MP_BASE = "https://api.mercadopago.com"
-ACCESS_TOKEN = os.environ["MP_ACCESS_TOKEN"]
-WEBHOOK_SECRET = os.environ["MP_WEBHOOK_SECRET"]
-BASE_URL = os.environ.get("BASE_URL", "")
+MP_BASE = settings.mp_api_base
+# .get vía settings: importar el módulo ya no revienta si faltan las variables
+ACCESS_TOKEN = settings.mp_access_token
+WEBHOOK_SECRET = settings.mp_webhook_secret
+BASE_URL = settings.base_url
 
-@router.post("/create_preference")
-async def create_preference(title: str, quantity: int = 1, unit_price: int = 10000):
+# Caché de preferencias: misma (title, quantity, unit_price) => misma preferencia.
+# Cada preferencia se crea con vencimiento (expiration_date_to = ahora +
+# MP_PREFERENCE_VALIDITY_S) y sale del caché MP_PREFERENCE_MARGIN_S antes de
+# que MP la dé por vencida, así nunca se entrega un init_point muerto.
+PREFERENCE_VALIDITY_S = int(os.getenv("MP_PREFERENCE_VALIDITY_S", "86400") or 86400)
+PREFERENCE_MARGIN_S = int(os.getenv("MP_PREFERENCE_MARGIN_S", "300") or 300)
+PREFERENCE_CACHE_MAX = max(1, int(os.getenv("MP_PREFERENCE_CACHE_MAX", "5000") or 5000))
+PREFERENCE_CONCURRENCY = max(1, int(os.getenv("MP_PREFERENCE_CONCURRENCY", "8") or 8))
+PREFERENCE_BATCH_MAX = int(os.getenv("MP_PREFERENCE_BATCH_MAX", "200") or 200)
+
+
+class PreferenceItem(BaseModel):
+    title: str = Field(..., min_length=1)
+    quantity: int = Field(1, ge=1)
+    unit_price: int = Field(10000, ge=1)
+
+
+class PreferenceBatch(BaseModel):
+    items: List[PreferenceItem]
+
+
+def _normalize(title: str, quantity: int, unit_price: int) -> Tuple[str, int, int]:
+    # espacios colapsados; mayúsculas se respetan porque el título lo ve el comprador
+    return " ".join(title.split()), int(quantity), int(unit_price)
+
+
+def _cache_key(item: Tuple[str, int, int]) -> str:
+    return hashlib.sha256(json.dumps(item, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _PreferenceCache:
+    """LRU acotado de futures: las peticiones iguales en vuelo comparten una sola llamada a MP."""
+
+    def __init__(self, max_items: int = PREFERENCE_CACHE_MAX):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, create) -> Tuple[dict, bool]:
+        now = time.monotonic()
+        hit = self._items.get(key)
+        if hit is not None and (hit[0] > now or not hit[1].done()):
+            self._items.move_to_end(key)
+            self.hits += 1
+            try:
+                return await asyncio.shield(hit[1]), True
+            except asyncio.CancelledError:
+                if hit[1].cancelled():  # se canceló quien creaba la preferencia: la crea ésta
+                    return await self.get(key, create)
+                raise
+
+        self.misses += 1
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._items[key] = (now + PREFERENCE_VALIDITY_S, fut)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+        try:
+            pref, ttl = await create()
+        except BaseException as exc:
+            if self._items.get(key, (0, None))[1] is fut:
+                del self._items[key]
+            if isinstance(exc, asyncio.CancelledError):
+                fut.cancel()
+            else:
+                fut.set_exception(exc)
+                fut.exception()  # recuperada aunque nadie espere
+            raise
+        if key in self._items:
+            self._items[key] = (time.monotonic() + ttl, fut)
+        fut.set_result(pref)
+        return pref, False
+
+    def stats(self) -> Dict[str, int]:
+        return {"items": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+_cache = _PreferenceCache()
+
+async def _create_preference(title: str, quantity: int, unit_price: int, idem_key: str | None = None,
+                             client: httpx.AsyncClient | None = None) -> Tuple[dict, float]:
+    """Crea la preferencia en MP; devuelve (respuesta, segundos que puede quedar en caché)."""
+    now = datetime.now(timezone.utc)
+    expires_to = now + timedelta(seconds=PREFERENCE_VALIDITY_S)
     payload = {
         "items": [{"title": title, "quantity": quantity, "unit_price": unit_price}],
         "back_urls": {
@@ -20,14 +109,85 @@ async def create_preference(title: str, quantity: int = 1, unit_price: int = 100
             "failure": f"{BASE_URL}/mp/thanks?status=failure",
             "pending": f"{BASE_URL}/mp/thanks?status=pending",
         },
-        "notification_url": f"{BASE_URL}/mp/webhook"
+        "notification_url": f"{BASE_URL}/mp/webhook",
+        "expires": True,
+        "expiration_date_from": now.isoformat(timespec="milliseconds"),
+        "expiration_date_to": expires_to.isoformat(timespec="milliseconds"),
     }
     headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
-    async with httpx.AsyncClient(timeout=30) as client:
+    if idem_key:
+        # MP también deduplica por su lado con la misma clave
+        headers["X-Idempotency-Key"] = idem_key
+    if client is None:
+        async with httpx.AsyncClient(timeout=30) as own:
+            return await _create_preference(title, quantity, unit_price, idem_key, own)
+    with metrics.timed(metrics.UPSTREAM, service="mercadopago", op="create_preference"):
         r = await client.post(f"{MP_BASE}/checkout/preferences", json=payload, headers=headers)
     r.raise_for_status()
     data = r.json()
-    return {"init_point": data.get("init_point"), "preference_id": data.get("id")}
+    # si MP devuelve otro vencimiento, manda el suyo
+    try:
+        mp_expires = datetime.fromisoformat(data["expiration_date_to"])
+        if mp_expires.tzinfo is not None:
+            expires_to = mp_expires
+    except (KeyError, TypeError, ValueError):
+        pass
+    ttl = (expires_to - datetime.now(timezone.utc)).total_seconds() - PREFERENCE_MARGIN_S
+    pref = {
+        "init_point": data.get("init_point"),
+        "preference_id": data.get("id"),
+        "expires_at": expires_to.isoformat(),
+    }
+    return pref, max(0.0, ttl)
+
+
+async def get_preference(title: str, quantity: int, unit_price: int, idem_key: str | None = None,
+                         client: httpx.AsyncClient | None = None,
+                         sem: asyncio.Semaphore | None = None) -> dict:
+    item = _normalize(title, quantity, unit_price)
+
+    async def create():
+        if sem is None:
+            return await _create_preference(*item, idem_key, client)
+        async with sem:  # sólo las llamadas reales a MP ocupan cupo del pool
+            return await _create_preference(*item, idem_key, client)
+
+    pref, cached = await _cache.get(_cache_key(item), create)
+    return dict(pref, cached=cached)
+
+
+@router.post("/create_preference")
+async def create_preference(request: Request, title: str, quantity: int = 1, unit_price: int = 10000,
+                            idempotency_key: str | None = Header(None, alias="Idempotency-Key")):
+    return await idempotency.handle(
+        request, idempotency_key,
+        lambda: get_preference(title, quantity, unit_price, idempotency_key),
+    )
+
+
+@router.post("/create_preferences")
+async def create_preferences(batch: PreferenceBatch):
+    """
+    Varias preferencias en una llamada (pre-calentar el catálogo). Se crean en
+    paralelo con a lo más MP_PREFERENCE_CONCURRENCY requests a MP y un solo
+    cliente HTTP; ítems repetidos o ya en caché no llaman a MP. Un error en un
+    ítem no tumba el resto: queda {"error": ...} en su posición.
+    """
+    if len(batch.items) > PREFERENCE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"máximo {PREFERENCE_BATCH_MAX} ítems por lote")
+    sem = asyncio.Semaphore(PREFERENCE_CONCURRENCY)
+    limits = httpx.Limits(max_connections=PREFERENCE_CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        async def one(it: PreferenceItem) -> dict:
+            try:
+                return await get_preference(it.title, it.quantity, it.unit_price, client=client, sem=sem)
+            except httpx.HTTPError as e:
+                return {"error": str(e) or type(e).__name__}
+
+        results = await asyncio.gather(*(one(it) for it in batch.items))
+    return {"results": results, "cache": _cache.stats()}
+
 
 @router.post("/webhook")
 async def mp_webhook(request: Request, x_mp_secret: str | None = Header(None)):
@@ -54,7 +214,8 @@ async def mp_webhook(request: Request, x_mp_secret: str | None = Header(None)):
 
     headers = {"Authorization": f"Bearer {ACCESS_TOKEN}"}
     async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(f"{MP_BASE}/v1/payments/{payment_id}", headers=headers)
+        with metrics.timed(metrics.UPSTREAM, service="mercadopago", op="get_payment"):
+            r = await client.get(f"{MP_BASE}/v1/payments/{payment_id}", headers=headers)
     r.raise_for_status()
     pay = r.json()
 
@@ -76,6 +237,7 @@ async def mp_search(q: str | None = None):
     if q:
         params["q"] = q
     async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(f"{MP_BASE}/v1/payments/search", headers=headers, params=params)
+        with metrics.timed(metrics.UPSTREAM, service="mercadopago", op="search"):
+            r = await client.get(f"{MP_BASE}/v1/payments/search", headers=headers, params=params)
     r.raise_for_status()
     return r.json()
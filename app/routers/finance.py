@@ -1,13 +1,16 @@
-﻿from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel, Field
+﻿from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
 from enum import Enum
 from typing import Optional, List
-from datetime import datetime, date
-import os, json, threading
+from datetime import date
+from decimal import Decimal
+import base64, hashlib, json, os, tempfile
 
-DATA_PATH = os.environ.get("AMETH_DATA_PATH", "data")
-RECORDS_FILE = os.path.join(DATA_PATH, "records.json")
-_lock = threading.Lock()
+from app.core import executors, idempotency, serialization
+from app.services import budgets, changes, classifier, fx, statement_import
+from app.storage import finance_storage
+from app.storage.repository import get_repository
 
 class RecordType(str, Enum):
     gasto = "gasto"
@@ -16,73 +19,305 @@ class RecordType(str, Enum):
 class RecordIn(BaseModel):
     date: date
     concept: str = Field(..., min_length=1)
-    category: str = Field(..., min_length=1)
+    # Opcional: si falta (o es "otros") se infiere del concepto con el historial
+    category: Optional[str] = None
     amount_clp: int = Field(..., ge=0)
     type: RecordType
+    # Moneda extranjera: monto original; amount_clp puede ir en 0 y se estima con la tabla FX
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)
+    amount: Optional[Decimal] = Field(None, gt=0)
     source: Optional[str] = None
     external_id: Optional[str] = None
 
+    @model_validator(mode="after")
+    def _foreign_needs_amount(self):
+        # sin monto original, amount_clp se tomaría como monto extranjero y se convertiría dos veces
+        if self.currency and self.currency.upper() != fx.BASE_CURRENCY and self.amount is None:
+            raise ValueError("amount es obligatorio cuando currency no es CLP")
+        return self
+
+class BudgetIn(BaseModel):
+    # 0 borra el presupuesto de la categoría
+    amount_clp: int = Field(..., ge=0)
+
 class RecordOut(RecordIn):
     id: str
+    category: str
     hidden: bool = False
 
-def _ensure_store():
-    os.makedirs(DATA_PATH, exist_ok=True)
-    if not os.path.exists(RECORDS_FILE):
-        with open(RECORDS_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False)
+# El router expone el esquema en inglés; el store único (app/storage/repository.py)
+# guarda el de finance_storage. Estas funciones sólo traducen.
+
+def _to_out(r: dict, fields: Optional[frozenset] = None) -> dict:
+    out = {
+        "id": r["id"],
+        "date": r.get("fecha", ""),
+        "concept": r.get("concepto", ""),
+        "category": r.get("categoria", ""),
+        "amount_clp": r.get("monto_clp", 0),
+        "type": r.get("tipo", ""),
+        "source": r.get("source"),
+        "external_id": r.get("external_id"),
+        "hidden": bool(r.get("hidden", False)),
+        "currency": r.get("moneda", fx.BASE_CURRENCY),
+        "amount": r.get("monto"),
+    }
+    if fields is not None:
+        return {k: v for k, v in out.items() if k in fields}
+    return out
+
+OUT_FIELDS = frozenset(_to_out({"id": ""}))
+
+# --- Operaciones sync: corren en app.core.executors, nunca en el event loop ---
+
+def _create(rec: "RecordIn") -> dict:
+    # Sin dedupe por contenido: dos almuerzos iguales son dos registros.
+    new, _ = get_repository().add({
+        "fecha": rec.date.isoformat(),
+        "concepto": rec.concept,
+        "categoria": classifier.resolve(rec.concept, rec.category),
+        "monto_clp": rec.amount_clp,
+        "tipo": rec.type.value,
+        "source": rec.source,
+        "external_id": rec.external_id,
+        "moneda": rec.currency,
+        "monto": str(rec.amount) if rec.amount is not None else None,
+    }, enforce_idempotency=False)
+    return _to_out(new)
 
-def _load() -> List[dict]:
-    _ensure_store()
-    with open(RECORDS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+def _hide_or_delete(rec_id: str, hard: bool) -> bool:
+    repo = get_repository()
+    return repo.delete(rec_id) if hard else repo.set_hidden(rec_id, True)
 
-def _save(items: List[dict]):
-    tmp = RECORDS_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(items, f, ensure_ascii=False, indent=2, default=str)
-    os.replace(tmp, RECORDS_FILE)
+def _event_out(e: dict) -> dict:
+    return {"seq": e["seq"], "op": e["op"], "id": e["id"], "month": e["month"], "record": _to_out(e["record"])}
 
 router = APIRouter()
 
-@router.get("/records", summary="Listar registros por mes")
-def list_records(month: str = Query(..., regex=r"^\d{4}-\d{2}$")) -> List[RecordOut]:
+RECORDS_PAGE_DEFAULT = 500
+RECORDS_PAGE_MAX = 5000
+CHANGES_MAX_WAIT_S = 30.0
+SSE_HEARTBEAT_S = 15.0
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024)) or 0)
+_MONTH_RE = r"^\d{4}-\d{2}$"
+
+# --- GET condicional ---
+# El ETag sale de la versión del mes en el repositorio (sube con cada escritura
+# que lo toca), así un If-None-Match se responde con 304 sin leer registros.
+
+def _etag(kind: str, month: str, version: str) -> str:
+    return f'"{kind}-{month}-{version}"'
+
+def _not_modified(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in inm.split(","))
+
+def _cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+async def _conditional(request: Request, kind: str, month: str, with_fx: bool = False):
+    """(etag, respuesta 304 o None). La versión se lee ANTES que los datos: el ETag nunca es más nuevo que el cuerpo."""
+    version = await executors.run_read(get_repository().month_version, month)
+    if with_fx:  # resumen/export convierten monedas: una tabla FX nueva también los cambia
+        version = f"{version}.fx{await executors.run_read(fx.version)}"
+    etag = _etag(kind, month, version)
+    if _not_modified(request, etag):
+        return etag, Response(status_code=304, headers=_cache_headers(etag))
+    return etag, None
+
+# --- Lista rápida: paginación por cursor + selección de campos ---
+# Los registros ya se validaron al escribirse: se traducen y se serializan con
+# app.core.serialization (orjson) sin volver a pasar por RecordOut.
+
+def _encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if isinstance(key, list) and len(key) == 3 and all(isinstance(x, str) for x in key):
+            return tuple(key)
+    except ValueError:
+        pass
+    raise HTTPException(status_code=400, detail="cursor inválido")
+
+def _parse_fields(fields: Optional[str]) -> Optional[frozenset]:
+    if not fields:
+        return None
+    wanted = frozenset(f.strip() for f in fields.split(",") if f.strip())
+    unknown = wanted - OUT_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"campos desconocidos: {', '.join(sorted(unknown))}")
+    return wanted
+
+def _list_page(month: str, after, limit: Optional[int], fields: Optional[frozenset]):
+    if limit is None and after is None:
+        items, nxt = get_repository().list_month(month), None
+    else:
+        items, nxt = get_repository().page_month(month, after, limit or RECORDS_PAGE_DEFAULT)
+    return serialization.dumps([_to_out(r, fields) for r in items]), nxt
+
+@router.get("/records", summary="Listar registros por mes", response_model=List[RecordOut])
+async def list_records(
+    request: Request,
+    month: str = Query(..., regex=_MONTH_RE),
+    limit: Optional[int] = Query(None, ge=1, le=RECORDS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    fields: Optional[str] = Query(None, description="p.ej. id,date,amount_clp"),
+):
+    """
+    Sin limit/cursor devuelve el mes completo (como siempre). Con `limit`
+    devuelve una página; si hay más, el cursor siguiente viene en el header
+    X-Next-Cursor (y en Link rel=next).
+    """
     y, m = [int(x) for x in month.split("-")]
-    with _lock:
-        items = _load()
-    pref = f"{y:04d}-{m:02d}"
-    return [x for x in items if str(x.get("date","")).startswith(pref) and not x.get("hidden", False)]
+    month = f"{y:04d}-{m:02d}"
+    cols = _parse_fields(fields)
+    after = _decode_cursor(cursor) if cursor else None
+    variant = "records"
+    if limit or cursor or cols:
+        q = f"{limit}|{cursor}|{','.join(sorted(cols or ()))}"
+        variant += "." + hashlib.sha1(q.encode()).hexdigest()[:10]
+    etag, not_modified = await _conditional(request, variant, month)
+    if not_modified:
+        return not_modified
+    body, nxt = await executors.run_read(_list_page, month, after, limit, cols)
+    headers = _cache_headers(etag)
+    if nxt is not None:
+        token = _encode_cursor(nxt)
+        headers["X-Next-Cursor"] = token
+        next_url = request.url.include_query_params(cursor=token, limit=limit or RECORDS_PAGE_DEFAULT)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/summary", summary="Resumen del mes")
+async def month_summary(request: Request, response: Response, month: str = Query(..., regex=_MONTH_RE)):
+    etag, not_modified = await _conditional(request, "summary", month, with_fx=True)
+    if not_modified:
+        return not_modified
+    response.headers.update(_cache_headers(etag))
+    return await executors.run_read(finance_storage.summary_month, month)
+
+@router.get("/export", summary="Exportar mes (csv/xlsx)")
+async def export_month(request: Request, month: str = Query(..., regex=_MONTH_RE),
+                       fmt: str = Query("csv", regex=r"^(csv|xlsx)$")):
+    etag, not_modified = await _conditional(request, f"export.{fmt}", month, with_fx=True)
+    if not_modified:
+        return not_modified
+    try:
+        content, media_type, filename = await executors.run_read(finance_storage.export_month, month, fmt)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    headers = _cache_headers(etag)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return Response(content=content, media_type=media_type, headers=headers)
 
 @router.post("/records", summary="Crear registro", response_model=RecordOut)
-def create_record(rec: RecordIn):
-    with _lock:
-        items = _load()
-        new_id = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-        new = {
-            "id": new_id,
-            "date": rec.date.isoformat(),
-            "concept": rec.concept,
-            "category": rec.category,
-            "amount_clp": rec.amount_clp,
-            "type": rec.type.value,
-            "source": rec.source,
-            "external_id": rec.external_id,
-            "hidden": False,
-        }
-        items.append(new)
-        _save(items)
-    return new
+async def create_record(rec: RecordIn, request: Request,
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    # Con Idempotency-Key un reintento devuelve el mismo registro sin crear otro.
+    return await idempotency.handle(request, idempotency_key, lambda: executors.run_write(_create, rec))
 
 @router.delete("/records/{rec_id}", summary="Ocultar o borrar registro")
-def hide_or_delete_record(rec_id: str, hard: bool = False):
-    with _lock:
-        items = _load()
-        idx = next((i for i, x in enumerate(items) if x.get("id")==rec_id), None)
-        if idx is None:
-            raise HTTPException(status_code=404, detail="Not Found")
-        if hard:
-            items.pop(idx)
-        else:
-            items[idx]["hidden"] = True
-        _save(items)
+async def hide_or_delete_record(rec_id: str, hard: bool = False):
+    if not await executors.run_write(_hide_or_delete, rec_id, hard):
+        raise HTTPException(status_code=404, detail="Not Found")
     return {"ok": True}
+
+def _import_spooled(fh, fmt: str, profile: str, size: int, dry_run: bool) -> dict:
+    try:
+        fh.seek(0)
+        return statement_import.import_file(fh, fmt, statement_import.load_profile(profile), size, dry_run)
+    finally:
+        fh.close()
+
+@router.post("/import", summary="Importar cartola bancaria (csv/xlsx, body crudo)")
+async def import_statement(request: Request, profile: str = "default",
+                           fmt: str = Query("csv", regex=r"^(csv|xlsx)$"), dry_run: bool = False):
+    # El body va a un archivo temporal por chunks (nada de cargarlo entero en memoria)
+    fh = tempfile.TemporaryFile()
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if IMPORT_MAX_BYTES and size > IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="archivo demasiado grande")
+            fh.write(chunk)
+    except BaseException:
+        fh.close()
+        raise
+    # Fuera del hilo escritor: cada lote toma el lock del repositorio, así las
+    # altas normales se intercalan con la importación.
+    try:
+        return await executors.run_read(_import_spooled, fh, fmt, profile, size, dry_run)
+    except statement_import.StatementError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+@router.get("/budgets", summary="Presupuestos por categoría y gasto del mes")
+async def list_budgets(month: str = Query(..., regex=_MONTH_RE)):
+    return {"month": month, "budgets": await executors.run_read(budgets.tracker.status, month)}
+
+@router.put("/budgets/{category}", summary="Fijar (o borrar con 0) el presupuesto mensual de una categoría")
+async def set_budget(category: str, body: BudgetIn):
+    await executors.run_write(budgets.tracker.set_budget, category, body.amount_clp)
+    return {"ok": True, "category": category.strip().lower(), "amount_clp": body.amount_clp}
+
+@router.get("/changes", summary="Cambios desde una secuencia (long-poll)")
+async def changes_long_poll(
+    since: Optional[int] = Query(None, ge=0),
+    month: Optional[str] = Query(None, regex=_MONTH_RE),
+    timeout: float = Query(25.0, ge=0, le=CHANGES_MAX_WAIT_S),
+    limit: int = Query(500, ge=1, le=5000),
+):
+    """
+    Sin `since` devuelve la secuencia actual (punto de partida). Con `since`
+    responde en cuanto haya eventos posteriores o al vencer `timeout`. Si
+    reset=true hay que recargar el mes y seguir desde `seq`.
+    """
+    if since is None:
+        return {"seq": await changes.current_seq(), "reset": False, "events": []}
+    res = await changes.wait_changes(since, timeout, limit)
+    events = [_event_out(e) for e in res["events"] if not month or e["month"] == month]
+    return {"seq": res["seq"], "reset": res["reset"], "events": events}
+
+async def _sse(request: Request, since: int, month: Optional[str]):
+    yield "retry: 3000\n\n"
+    while not await request.is_disconnected():
+        res = await changes.wait_changes(since, SSE_HEARTBEAT_S)
+        if res["reset"]:
+            since = res["seq"]
+            yield f"id: {since}\nevent: reset\ndata: {json.dumps({'seq': since})}\n\n"
+            continue
+        if not res["events"]:
+            yield ": keepalive\n\n"
+            continue
+        for e in res["events"]:
+            since = e["seq"]
+            if month and e["month"] != month:
+                continue
+            data = json.dumps(_event_out(e), ensure_ascii=False, default=str)
+            yield f"id: {e['seq']}\nevent: {e['op']}\ndata: {data}\n\n"
+
+@router.get("/changes/stream", summary="Cambios como Server-Sent Events")
+async def changes_stream(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    month: Optional[str] = Query(None, regex=_MONTH_RE),
+):
+    # Al reconectar, EventSource manda Last-Event-ID = último seq recibido.
+    last_id = request.headers.get("last-event-id", "")
+    if last_id.isdigit():
+        since = int(last_id)
+    if since is None:
+        since = await changes.current_seq()
+    return StreamingResponse(
+        _sse(request, since, month),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
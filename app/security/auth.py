@@ -1,8 +1,16 @@
 ﻿# app/security/auth.py
-import os
-from typing import Set
+import hashlib, hmac, os, signal, threading, time
+from typing import Dict, FrozenSet, Optional, Set
 from fastapi import Header, HTTPException, status
 
+# Archivo opcional con una clave por línea (texto plano o "sha256:<hex>").
+API_KEYS_FILE = os.getenv("API_KEYS_FILE", "")
+# Token bucket por clave: ráfaga máxima y recarga por segundo (0 = sin límite).
+API_RATE_BURST = float(os.getenv("API_RATE_BURST", "60") or 60)
+API_RATE_PER_SEC = float(os.getenv("API_RATE_PER_SEC", "5") or 5)
+# Cada cuánto (s) se revisa el mtime de API_KEYS_FILE para recargar.
+_FILE_CHECK_EVERY = 5.0
+
 def _get_keys() -> Set[str]:
     """
     Lee claves válidas desde API_KEYS (coma-separadas) o API_KEY.
@@ -11,16 +19,131 @@ def _get_keys() -> Set[str]:
     raw = os.getenv("API_KEYS") or os.getenv("API_KEY") or ""
     return {k.strip() for k in raw.split(",") if k.strip()}
 
+def _digest(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+def _parse(entry: str) -> Optional[bytes]:
+    if entry.startswith("sha256:"):
+        try:
+            return bytes.fromhex(entry[7:])
+        except ValueError:
+            return None
+    return _digest(entry)
+
+
+class KeyStore:
+    """
+    Claves hasheadas (sha256) cargadas una vez. Se recargan con SIGHUP o
+    cuando cambia el mtime de API_KEYS_FILE. La verificación compara contra
+    todas las claves con hmac.compare_digest (tiempo constante).
+    """
+
+    def __init__(self, path: str = API_KEYS_FILE):
+        self.path = path
+        self._digests: FrozenSet[bytes] = frozenset()
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> None:
+        entries = set(_get_keys())
+        mtime = None
+        if self.path:
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    entries |= {ln.strip() for ln in f if ln.strip() and not ln.startswith("#")}
+            except OSError:
+                pass
+        digests = {d for d in (_parse(e) for e in entries) if d}
+        with self._lock:
+            self._digests = frozenset(digests)
+            self._mtime = mtime
+
+    def _maybe_reload(self) -> None:
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + _FILE_CHECK_EVERY
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.reload()
+
+    def __bool__(self) -> bool:
+        self._maybe_reload()
+        return bool(self._digests)
+
+    def verify(self, key: str) -> Optional[bytes]:
+        """Devuelve el digest de la clave si es válida (sirve como id del bucket)."""
+        d = _digest(key)
+        ok = False
+        for known in self._digests:
+            ok |= hmac.compare_digest(d, known)
+        return d if ok else None
+
+
+class RateLimiter:
+    """Token bucket en memoria por clave: O(1) por request, sin I/O."""
+
+    def __init__(self, burst: float = API_RATE_BURST, per_sec: float = API_RATE_PER_SEC):
+        self.burst = burst
+        self.per_sec = per_sec
+        self._buckets: Dict[bytes, list] = {}  # id -> [tokens, último ts]
+        self._lock = threading.Lock()
+
+    def allow(self, ident: bytes) -> float:
+        """0.0 si se permite; si no, segundos sugeridos para reintentar."""
+        if self.per_sec <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(ident)
+            if b is None:
+                b = self._buckets[ident] = [self.burst, now]
+            b[0] = min(self.burst, b[0] + (now - b[1]) * self.per_sec)
+            b[1] = now
+            if b[0] >= 1.0:
+                b[0] -= 1.0
+                return 0.0
+            return (1.0 - b[0]) / self.per_sec
+
+
+keystore = KeyStore()
+limiter = RateLimiter()
+
+def _on_sighup(signum, frame):
+    keystore.reload()
+
+try:
+    # Sólo se puede registrar desde el hilo principal (y no existe en Windows)
+    if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, _on_sighup)
+except (ValueError, OSError):
+    pass
+
 async def api_key_auth(x_api_key: str | None = Header(None, alias="x-api-key")):
-    keys = _get_keys()
-    if not keys:
+    if not keystore:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="API key no configurada en el servidor",
         )
-    if not x_api_key or x_api_key not in keys:
+    ident = keystore.verify(x_api_key) if x_api_key else None
+    if ident is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="API key inválida o ausente",
         )
+    retry = limiter.allow(ident)
+    if retry:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit excedido",
+            headers={"Retry-After": str(max(1, int(retry + 0.999)))},
+        )
     return True
@@ -0,0 +1,293 @@
+# app/services/budgets.py
+"""
+Presupuestos mensuales por categoría ("comida: 150.000") con alertas por
+Telegram al cruzar BUDGET_ALERT_THRESHOLDS (por defecto 80% y 100%).
+
+- Presupuestos: BUDGETS_FILE (JSON {categoria: monto}) o, si no existe, la
+  variable BUDGETS="comida:150000,transporte:60000". PUT /finance/budgets
+  escribe el archivo; cada worker lo relee cuando cambia (mtime/tamaño, como
+  fx.RateTable) antes de status(), on_write() y record_external().
+- Totales de gasto por (mes, categoría) en memoria. Un mes se siembra una
+  sola vez con repository.category_totals (que devuelve también el seq) y
+  después se actualiza con cada evento del listener del repositorio
+  (router, finance_storage.add_record, db.record_item, comandos de chat):
+  cada alta/baja/ocultado es O(1) y los eventos con seq <= al de la siembra
+  se ignoran porque ya estaban contados.
+- Los pagos de Mercado Pago no pasan por el repositorio (van a Kyaru): el
+  webhook los suma con record_external(), deduplicados por referencia.
+- Una alerta por cruce: se recuerda el umbral más alto alcanzado por
+  (mes, categoría); si el gasto baja (borrado/ocultado) se vuelve a armar.
+  La siembra no alerta (el historial ya se conocía).
+- Si el seq salta (escribió otro worker) se descartan los totales y se
+  vuelven a sembrar; las alertas de esas escrituras las manda el otro worker.
+
+El envío a Telegram va por un hilo propio: el listener corre en el hilo
+escritor y no debe esperar a la red.
+"""
+import json, logging, os, queue, threading
+from typing import Dict, List, Optional, Tuple
+
+from app.storage.repository import DATA_DIR, get_repository
+
+log = logging.getLogger("ameth.budgets")
+
+BUDGETS_FILE = os.environ.get("BUDGETS_FILE", os.path.join(DATA_DIR, "budgets.json"))
+BUDGET_ALERT_THRESHOLDS = tuple(sorted(
+    float(x) for x in os.getenv("BUDGET_ALERT_THRESHOLDS", "0.8,1.0").split(",") if x.strip()
+))
+# Referencias de MP ya sumadas (MP reintenta el mismo webhook)
+_EXTERNAL_SEEN_MAX = 20000
+
+
+def _norm(categoria: Optional[str]) -> str:
+    return (categoria or "otros").strip().lower()
+
+
+def _parse_env(raw: str) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for piece in raw.split(","):
+        if ":" in piece:
+            k, v = piece.split(":", 1)
+            try:
+                out[_norm(k)] = int(v.strip().replace(".", ""))
+            except ValueError:
+                log.warning("BUDGETS: monto inválido para %s", k.strip())
+    return out
+
+
+def _file_stamp() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(BUDGETS_FILE)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def _load_budgets() -> Dict[str, int]:
+    if os.path.exists(BUDGETS_FILE):
+        try:
+            with open(BUDGETS_FILE, "r", encoding="utf-8") as f:
+                return {_norm(k): int(v) for k, v in (json.load(f) or {}).items() if int(v) > 0}
+        except (OSError, ValueError, TypeError) as e:
+            log.warning("budgets file unreadable: %s", e)
+    return {k: v for k, v in _parse_env(os.getenv("BUDGETS", "")).items() if v > 0}
+
+
+class _Month:
+    __slots__ = ("seq", "totals", "external")
+
+    def __init__(self, totals: Dict[str, int], seq: int):
+        self.seq = seq            # seq del repositorio ya incluido en totals
+        self.totals = totals      # categoria -> gasto del repositorio
+        self.external = {}        # categoria -> gasto fuera del repositorio (MP)
+
+
+class BudgetTracker:
+    def __init__(self, budgets: Optional[Dict[str, int]] = None,
+                 thresholds: Tuple[float, ...] = BUDGET_ALERT_THRESHOLDS):
+        # Con budgets explícitos no se vigila BUDGETS_FILE
+        self._watch = budgets is None
+        self._stamp = _file_stamp() if self._watch else None
+        self.budgets = budgets if budgets is not None else _load_budgets()
+        self.thresholds = thresholds
+        self._lock = threading.RLock()
+        self._months: Dict[str, _Month] = {}
+        self._external: Dict[str, Dict[str, int]] = {}  # sobrevive a la resiembra
+        self._level: Dict[Tuple[str, str], int] = {}    # (mes, cat) -> nº de umbrales cruzados
+        self._last_seq = 0
+        self._seen_refs: Dict[str, None] = {}
+        self._alerts: "queue.Queue[Optional[Dict]]" = queue.Queue()
+        self._sender: Optional[threading.Thread] = None
+
+    # --- presupuestos ---
+    def _reload(self) -> None:
+        """Relee BUDGETS_FILE si cambió (PUT atendido por otro worker)."""
+        if not self._watch:
+            return
+        stamp = _file_stamp()
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._apply(_load_budgets())
+
+    def _apply(self, budgets: Dict[str, int]) -> None:
+        """Reemplaza los presupuestos y re-evalúa los niveles sin alertar."""
+        if set(budgets) - set(self.budgets):
+            self._months.clear()  # categorías nuevas: sus totales no se venían siguiendo
+        changed = {c for c in set(budgets) | set(self.budgets) if budgets.get(c) != self.budgets.get(c)}
+        self.budgets = budgets
+        for month, m in self._months.items():
+            for c in changed:
+                self._level[(month, c)] = self._crossed(month, c, m)
+
+    # --- totales ---
+    def _month(self, month: str) -> _Month:
+        m = self._months.get(month)
+        if m is None:
+            raw, seq = get_repository().category_totals(month)
+            totals: Dict[str, int] = {}
+            for c, v in raw.items():
+                totals[_norm(c)] = totals.get(_norm(c), 0) + v
+            m = self._months[month] = _Month(totals, seq)
+            m.external = self._external.setdefault(month, {})
+            for c in self.budgets:  # el historial fija el nivel sin alertar
+                self._level[(month, c)] = self._crossed(month, c, m)
+        return m
+
+    def spent(self, month: str, categoria: str) -> int:
+        with self._lock:
+            self._reload()
+            m = self._month(month)
+            c = _norm(categoria)
+            return m.totals.get(c, 0) + m.external.get(c, 0)
+
+    def _crossed(self, month: str, c: str, m: _Month) -> int:
+        budget = self.budgets.get(c)
+        if not budget:
+            return 0
+        spent = m.totals.get(c, 0) + m.external.get(c, 0)
+        return sum(1 for t in self.thresholds if spent >= t * budget)
+
+    def _check(self, month: str, c: str, m: _Month) -> None:
+        if c not in self.budgets:
+            return
+        level = self._crossed(month, c, m)
+        prev = self._level.get((month, c), 0)
+        self._level[(month, c)] = level
+        if level > prev:  # saltar de 70% a 110% manda una sola alerta (la más alta)
+            self._queue_alert(month, c, self.thresholds[level - 1], m)
+
+    # --- entradas ---
+    def on_write(self, events: List[Dict]) -> None:
+        """Listener del repositorio (hilo escritor)."""
+        with self._lock:
+            self._reload()
+            if events and self._last_seq and events[0]["seq"] > self._last_seq + 1:
+                self._months.clear()  # escritura de otro proceso: resembrar al usar
+            for e in events:
+                self._last_seq = max(self._last_seq, e["seq"])
+                r = e["record"]
+                if r.get("tipo") != "gasto":
+                    continue
+                if e["op"] == "created":
+                    sign = 0 if r.get("hidden") else 1
+                elif e["op"] == "unhidden":
+                    sign = 1
+                elif e["op"] == "hidden":
+                    sign = -1
+                elif e["op"] == "deleted":
+                    sign = 0 if r.get("hidden") else -1
+                else:
+                    sign = 0
+                if not sign:
+                    continue
+                c = _norm(r.get("categoria"))
+                if c not in self.budgets:
+                    continue  # sin presupuesto no hay nada que vigilar
+                delta = sign * int(r.get("monto_clp") or 0)
+                seeded = e["month"] in self._months
+                m = self._month(e["month"])
+                if not seeded:
+                    # la siembra ya incluye este evento: el nivel "previo" es sin él
+                    m.totals[c] = m.totals.get(c, 0) - delta
+                    self._level[(e["month"], c)] = self._crossed(e["month"], c, m)
+                elif e["seq"] <= m.seq:
+                    continue  # ya contado en la siembra
+                m.totals[c] = m.totals.get(c, 0) + delta
+                self._check(e["month"], c, m)
+
+    def record_external(self, month: str, categoria: str, monto_clp: int, ref: Optional[str] = None) -> None:
+        """Gasto que no pasa por el repositorio (pagos MP enviados a Kyaru)."""
+        if not month:
+            return
+        with self._lock:
+            if ref:
+                if ref in self._seen_refs:
+                    return
+                self._seen_refs[ref] = None
+                if len(self._seen_refs) > _EXTERNAL_SEEN_MAX:
+                    self._seen_refs.pop(next(iter(self._seen_refs)))
+            self._reload()
+            m = self._month(month)
+            c = _norm(categoria)
+            m.external[c] = m.external.get(c, 0) + int(monto_clp)
+            self._check(month, c, m)
+
+    def set_budget(self, categoria: str, monto_clp: int) -> None:
+        """Cambia (o borra con 0) un presupuesto y lo guarda en BUDGETS_FILE. Re-evalúa sin alertar."""
+        with self._lock:
+            self._reload()  # partir de lo último guardado (quizás por otro worker)
+            budgets = dict(self.budgets)
+            c = _norm(categoria)
+            if monto_clp > 0:
+                budgets[c] = int(monto_clp)
+            else:
+                budgets.pop(c, None)
+            self._apply(budgets)
+            os.makedirs(os.path.dirname(BUDGETS_FILE) or ".", exist_ok=True)
+            tmp = BUDGETS_FILE + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.budgets, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, BUDGETS_FILE)
+            if self._watch:
+                self._stamp = _file_stamp()  # la escritura propia no es un cambio externo
+
+    def status(self, month: str) -> List[Dict]:
+        with self._lock:
+            self._reload()
+            m = self._month(month)
+            out = []
+            for c, budget in sorted(self.budgets.items()):
+                spent = m.totals.get(c, 0) + m.external.get(c, 0)
+                out.append({"category": c, "budget_clp": budget, "spent_clp": spent,
+                            "pct": round(spent / budget * 100, 1), "remaining_clp": budget - spent})
+            return out
+
+    # --- alertas ---
+    def _queue_alert(self, month: str, c: str, threshold: float, m: _Month) -> None:
+        if self._sender is None:
+            return  # sin start(): se lleva la cuenta pero no se envía
+        self._alerts.put({"month": month, "categoria": c, "threshold": threshold,
+                          "spent": m.totals.get(c, 0) + m.external.get(c, 0), "budget": self.budgets[c]})
+
+    def _send_loop(self) -> None:
+        from app.services.notifications import notify_budget_alert
+        while True:
+            a = self._alerts.get()
+            if a is None:
+                return
+            try:
+                notify_budget_alert(**a)
+            except Exception as e:
+                log.warning("budget alert failed: %s", e, extra={"categoria": a["categoria"]})
+
+    def start(self) -> None:
+        if self._sender is None:
+            self._sender = threading.Thread(target=self._send_loop, name="budget-alerts", daemon=True)
+            self._sender.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._sender is not None:
+            self._alerts.put(None)
+            self._sender.join(timeout)
+            self._sender = None
+
+
+tracker = BudgetTracker()
+_registered = False
+
+
+def start() -> None:
+    global _registered
+    if not _registered:
+        get_repository().add_listener(tracker.on_write)
+        _registered = True
+    tracker.start()
+
+
+def stop() -> None:
+    tracker.stop()
+
+
+def record_external(month: str, categoria: str, monto_clp: int, ref: Optional[str] = None) -> None:
+    tracker.record_external(month, categoria, monto_clp, ref)
@@ -0,0 +1,65 @@
+# app/services/changes.py
+"""
+Change feed de registros de finanzas para long-poll y SSE.
+
+El repositorio (app/storage/repository.py) numera cada escritura con una
+secuencia monótona y guarda los eventos recientes en memoria. Aquí sólo se
+despierta a los clientes que esperan: el listener del repo (hilo escritor)
+hace call_soon_threadsafe y se reemplaza un asyncio.Event por "época". Una
+conexión ociosa es un await sobre ese Event, sin lecturas del store.
+
+Escrituras de otro proceso (varios workers) no despiertan a nadie: se ven al
+vencer el timeout del long-poll o en el siguiente heartbeat del SSE.
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from app.core import executors
+from app.storage.repository import get_repository
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_event: Optional[asyncio.Event] = None
+
+
+def _wake() -> None:
+    global _event
+    ev, _event = _event, asyncio.Event()
+    if ev is not None:
+        ev.set()
+
+
+def _on_write(events: List[Dict]) -> None:
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake)
+
+
+def start() -> None:
+    global _loop, _event
+    if _loop is None:
+        get_repository().add_listener(_on_write)
+    _loop = asyncio.get_running_loop()
+    _event = asyncio.Event()
+
+
+def stop() -> None:
+    global _loop
+    _loop = None
+    _wake()  # libera a los que esperan
+
+
+async def current_seq() -> int:
+    return await executors.run_read(get_repository().current_seq)
+
+
+async def wait_changes(since: int, timeout: float, limit: int = 500) -> Dict:
+    """{seq, reset, events}; espera hasta `timeout` s si no hay nada nuevo."""
+    repo = get_repository()
+    ev = _event  # tomarlo ANTES de leer: una escritura entre medio ya lo habrá seteado
+    res = await executors.run_read(repo.changes_since, since, limit)
+    if res["events"] or res["reset"] or timeout <= 0 or ev is None:
+        return res
+    try:
+        await asyncio.wait_for(ev.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return await executors.run_read(repo.changes_since, since, limit)
@@ -0,0 +1,131 @@
+# app/services/classifier.py
+"""
+Clasificador concepto -> categoría aprendido del historial.
+
+Índice invertido token -> {categoria: conteo}. Se construye una vez (la
+primera vez que se usa) desde las fuentes registradas con add_source() y
+luego se actualiza con learn() en cada inserción; classify() cuesta
+O(tokens del concepto), sin re-escanear el historial.
+
+    classifier.classify("almuerzo oficina")  # -> "comida"
+"""
+import logging, re, threading, unicodedata
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger("ameth.classifier")
+
+DEFAULT_CATEGORY = "otros"
+# Mínimo de evidencia (score del ganador) y de margen sobre el segundo.
+MIN_SCORE = 0.5
+MIN_MARGIN = 1.2
+
+_STOP = {
+    "de", "del", "la", "el", "los", "las", "en", "y", "a", "con", "por", "para", "un", "una",
+    "al", "mp", "mercadopago", "pago", "compra", "spa", "ltda", "sa", "cl", "chile",
+}
+_TOKEN_RE = re.compile(r"[a-z]+")
+
+Source = Callable[[], Iterable[Tuple[str, str]]]
+
+
+def tokens(text: str) -> List[str]:
+    """minúsculas, sin tildes, sólo letras, sin stopwords ni tokens de 1-2 letras."""
+    t = unicodedata.normalize("NFKD", (text or "").lower())
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    return [w for w in _TOKEN_RE.findall(t) if len(w) > 2 and w not in _STOP]
+
+
+class CategoryIndex:
+    def __init__(self):
+        self._tok: Dict[str, Counter] = defaultdict(Counter)
+        self._tok_total: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def learn(self, concepto: str, categoria: str) -> None:
+        cat = (categoria or "").strip().lower()
+        if not cat or cat == DEFAULT_CATEGORY:
+            return
+        toks = set(tokens(concepto))
+        with self._lock:
+            for w in toks:
+                self._tok[w][cat] += 1
+                self._tok_total[w] += 1
+
+    def scores(self, concepto: str) -> Counter:
+        out: Counter = Counter()
+        with self._lock:
+            for w in set(tokens(concepto)):
+                total = self._tok_total.get(w)
+                if not total:
+                    continue
+                # cada token reparte 1 punto según su distribución de categorías,
+                # con peso extra por evidencia (log-ish: 1 + conteo/(conteo+2))
+                weight = 1.0 + total / (total + 2.0)
+                for cat, n in self._tok[w].items():
+                    out[cat] += weight * n / total
+        return out
+
+    def classify(self, concepto: str, default: str = DEFAULT_CATEGORY) -> str:
+        ranked = self.scores(concepto).most_common(2)
+        if not ranked or ranked[0][1] < MIN_SCORE:
+            return default
+        if len(ranked) > 1 and ranked[0][1] < ranked[1][1] * MIN_MARGIN:
+            return default
+        return ranked[0][0]
+
+    def __len__(self) -> int:
+        return len(self._tok)
+
+
+_index = CategoryIndex()
+_sources: List[Source] = []
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def add_source(fn: Source) -> None:
+    """Registra una fuente de historial (iterable de (concepto, categoria))."""
+    _sources.append(fn)
+
+
+def _ensure_loaded() -> None:
+    global _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        for src in _sources:
+            try:
+                for concepto, categoria in src():
+                    _index.learn(concepto, categoria)
+            except Exception:
+                # una fuente rota no debe impedir clasificar, pero sí verse
+                log.exception("classifier source failed", extra={"source": getattr(src, "__name__", repr(src))})
+        _loaded = True
+
+
+def warm() -> None:
+    """Construye el índice ya (lee el historial). Bloqueante: llamarlo fuera del event loop."""
+    _ensure_loaded()
+
+
+def learn(concepto: str, categoria: str) -> None:
+    # Antes de cargar, el historial completo se leerá en _ensure_loaded;
+    # aprender aquí duplicaría el registro recién guardado.
+    if _loaded:
+        _index.learn(concepto, categoria)
+
+
+def classify(concepto: str, default: str = DEFAULT_CATEGORY) -> str:
+    _ensure_loaded()
+    return _index.classify(concepto, default)
+
+
+def resolve(concepto: str, categoria: Optional[str]) -> str:
+    """Categoría explícita si viene (y no es 'otros'); si no, la clasificada."""
+    cat = (categoria or "").strip()
+    if cat and cat.lower() != DEFAULT_CATEGORY:
+        return cat
+    return classify(concepto)
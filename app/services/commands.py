@@ -0,0 +1,144 @@
+# app/services/commands.py
+"""
+Registro de finanzas por chat: "gasto 6000 almuerzo comida".
+
+Gramática (regex precompilada, una pasada por mensaje):
+
+    <tipo> <monto> <concepto...> [<categoria>]
+
+- tipo:   gasto|g|gaste|gasté|pago|compra  /  ingreso|i|recibi|recibí|cobro
+- monto:  6000 · 6.000 · 6,000 · $6.000 · 6k · 1,5k · 6 mil · 6 lucas · 2mm · 1 palo
+          (decimales sólo con sufijo: "1.5" a secas no es un monto CLP válido)
+- si hay 2+ palabras tras el monto, la última es la categoría; si no, se
+  infiere del concepto con app.services.classifier.
+
+Los mensajes entran por app.services.inbox (webhooks de WhatsApp/Telegram) y
+se guardan con finance_storage.add_record (dedupe por idem_key) en el hilo
+escritor de app.core.executors.
+"""
+import logging, re
+from collections import OrderedDict
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo
+
+from app.core import executors
+from app.services import classifier, gateway
+
+log = logging.getLogger("ameth.commands")
+TZ = ZoneInfo("America/Santiago")
+
+_TIPOS = {
+    "gasto": "gasto", "g": "gasto", "gaste": "gasto", "gasté": "gasto", "pago": "gasto", "compra": "gasto",
+    "ingreso": "ingreso", "i": "ingreso", "recibi": "ingreso", "recibí": "ingreso", "cobro": "ingreso",
+}
+_MULT = {"k": 1000, "mil": 1000, "luca": 1000, "lucas": 1000, "mm": 1_000_000, "palo": 1_000_000, "palos": 1_000_000}
+
+COMMAND_RE = re.compile(
+    r"^\s*(?P<tipo>" + "|".join(sorted(map(re.escape, _TIPOS), key=len, reverse=True)) + r")\s+"
+    r"\$?\s*(?P<num>\d{1,3}(?:\.\d{3})+|\d{1,3}(?:,\d{3})+|\d+(?:[.,]\d+)?)"
+    r"\s*(?P<suf>" + "|".join(sorted(_MULT, key=len, reverse=True)) + r")?"
+    r"(?:\s+(?P<rest>.+?))?\s*$",
+    re.IGNORECASE,
+)
+_THOUSANDS_RE = re.compile(r"\d{1,3}(?:\.\d{3})+|\d{1,3}(?:,\d{3})+")
+
+
+def parse_amount(num: str, suf: Optional[str]) -> Optional[int]:
+    if _THOUSANDS_RE.fullmatch(num):
+        value = Decimal(num.replace(".", "").replace(",", ""))  # separador de miles (. o ,)
+    else:
+        value = Decimal(num.replace(",", "."))
+    if suf:
+        value *= _MULT[suf.lower()]
+    elif value != value.to_integral_value():
+        return None  # "1.5" sin sufijo: ambiguo, no se adivina
+    amount = int(value.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    return amount if amount > 0 else None
+
+
+def parse_command(text: str) -> Optional[Dict[str, Any]]:
+    """Devuelve {tipo, monto_clp, concepto, categoria} o None si no es un comando."""
+    m = COMMAND_RE.match(text or "")
+    if not m:
+        return None
+    amount = parse_amount(m.group("num"), m.group("suf"))
+    if amount is None:
+        return None
+    words = (m.group("rest") or "").split()
+    if len(words) >= 2:
+        concepto, categoria = " ".join(words[:-1]), words[-1]
+    else:
+        concepto, categoria = (words[0] if words else "sin concepto"), None
+    return {
+        "tipo": _TIPOS[m.group("tipo").lower()],
+        "monto_clp": amount,
+        "concepto": concepto.lower(),
+        "categoria": categoria.lower() if categoria else None,
+    }
+
+
+def _fmt_money(n: int) -> str:
+    return f"${n:,}".replace(",", ".")
+
+
+# Ids de mensaje ya procesados (Meta/Telegram reintentan la misma entrega).
+_SEEN_MAX = 5000
+_seen: "OrderedDict[str, None]" = OrderedDict()
+
+
+# Ids en proceso: una re-entrega que llega mientras el primero se guarda no se duplica.
+_inflight: set = set()
+
+
+def _already_seen(msg_id: Optional[str]) -> bool:
+    return bool(msg_id) and (msg_id in _seen or msg_id in _inflight)
+
+
+def _mark_seen(msg_id: Optional[str]) -> None:
+    # Sólo después de guardar: si la escritura falla, la re-entrega de la plataforma se procesa.
+    if not msg_id:
+        return
+    _seen[msg_id] = None
+    if len(_seen) > _SEEN_MAX:
+        _seen.popitem(last=False)
+
+
+def _store(cmd: Dict[str, Any], fecha: str):
+    from app.storage import finance_storage
+    cmd = dict(cmd, categoria=classifier.resolve(cmd["concepto"], cmd["categoria"]))
+    return finance_storage.add_record(fecha, cmd["concepto"], cmd["categoria"], cmd["monto_clp"], cmd["tipo"])
+
+
+async def _reply(evt: Dict[str, Any], text: str) -> None:
+    channel = "whatsapp_cloud" if evt.get("source") == "whatsapp" else "telegram"
+    to = evt.get("from") if channel == "whatsapp_cloud" else evt.get("chat_id")
+    try:
+        await gateway.send(channel, to, text)
+    except gateway.GatewayError as e:
+        log.info("command reply skipped: %s", e)
+
+
+async def handle_event(evt: Dict[str, Any]) -> None:
+    """Handler de app.services.inbox: procesa mensajes de texto con comando."""
+    if evt.get("kind") != "message" or not evt.get("text"):
+        return
+    cmd = parse_command(evt["text"])
+    msg_id = evt.get("id")
+    if cmd is None or _already_seen(msg_id):
+        return
+    fecha = datetime.now(TZ).date().isoformat()
+    if msg_id:
+        _inflight.add(msg_id)
+    try:
+        rec, created = await executors.run_write(_store, cmd, fecha)
+        _mark_seen(msg_id)
+    finally:
+        _inflight.discard(msg_id)
+    signo = "-" if cmd["tipo"] == "gasto" else "+"
+    if created:
+        msg = f"✅ {cmd['tipo'].capitalize()} registrado: {rec['concepto']} ({rec['categoria']}) {signo}{_fmt_money(rec['monto_clp'])}"
+    else:
+        msg = f"ℹ️ Ya estaba registrado: {rec['concepto']} ({rec['categoria']}) {_fmt_money(rec['monto_clp'])}"
+    await _reply(evt, msg)
@@ -0,0 +1,203 @@
+# app/services/fx.py
+"""
+Tabla local de tipos de cambio (CLP por unidad de moneda extranjera).
+
+Archivo FX_RATES_FILE (por defecto DATA_DIR/fx_rates.json):
+
+    {"base": "CLP", "rates": {"USD": {"2025-06-02": "945.31", ...}, "EUR": {...}}}
+
+Se llena a mano, con refresh_from_provider() (FX_PROVIDER_URL devuelve el
+mismo JSON; en benchmarks apunta a bench.stub_server) o con
+
+    python -m app.services.fx --refresh
+
+- En memoria, por moneda: dict fecha -> tasa (Decimal) + lista de fechas
+  ordenada. La tasa de una fecha es la última publicada <= esa fecha (fines
+  de semana / feriados); cada (moneda, fecha) resuelta queda memorizada.
+- El archivo se relee si cambia (mtime/tamaño). `version()` es un hash del
+  contenido: igual en todos los workers que ven la misma tabla, así sirve de
+  clave para cachés de agregados (repository.summary) y para los ETags.
+- Las conversiones son con Decimal y se redondean una sola vez por grupo:
+  convert_groups() suma los montos originales por (moneda, fecha) y aplica
+  la tasa del día una vez por grupo, así un resumen histórico es exacto y
+  no depende de cuántas filas tenga.
+"""
+import bisect, hashlib, json, logging, os, threading
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+log = logging.getLogger("ameth.fx")
+
+BASE_CURRENCY = "CLP"
+FX_RATES_FILE = os.environ.get("FX_RATES_FILE", os.path.join(os.environ.get("DATA_DIR", "/data"), "fx_rates.json"))
+FX_PROVIDER_URL = os.getenv("FX_PROVIDER_URL", "").strip()
+
+
+def to_decimal(x: Any) -> Optional[Decimal]:
+    if x is None or x == "":
+        return None
+    try:
+        d = Decimal(str(x))
+    except InvalidOperation:
+        return None
+    return d if d.is_finite() else None
+
+
+def _round_clp(d: Decimal) -> int:
+    return int(d.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+class RateTable:
+    def __init__(self, path: str = FX_RATES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._rates: Dict[str, Dict[str, Decimal]] = {}
+        self._dates: Dict[str, List[str]] = {}
+        self._resolved: Dict[Tuple[str, str], Optional[Decimal]] = {}
+        self._version = "none"  # sin archivo
+
+    def _check(self) -> None:
+        try:
+            st = os.stat(self.path)
+            stamp: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        rates: Dict[str, Dict[str, Decimal]] = {}
+        version = "none"
+        if stamp is not None:
+            try:
+                with open(self.path, "rb") as f:
+                    raw = f.read()
+                data = json.loads(raw)
+                version = hashlib.sha256(raw).hexdigest()[:16]
+                for cur, by_date in (data.get("rates") or {}).items():
+                    clean = {str(d)[:10]: r for d, r in ((d, to_decimal(v)) for d, v in by_date.items()) if r}
+                    if clean:
+                        rates[cur.upper()] = clean
+            except (OSError, ValueError, AttributeError) as e:
+                log.warning("fx rates unreadable: %s", e, extra={"path": self.path})
+                return  # se conserva la tabla anterior
+        self._rates = rates
+        self._dates = {c: sorted(v) for c, v in rates.items()}
+        self._resolved = {}
+        self._stamp = stamp
+        self._version = version
+
+    def version(self) -> str:
+        with self._lock:
+            self._check()
+            return self._version
+
+    def _rate(self, currency: str, fecha: str) -> Optional[Decimal]:
+        key = (currency, fecha)
+        if key in self._resolved:
+            return self._resolved[key]
+        by_date = self._rates.get(currency)
+        r = None
+        if by_date:
+            r = by_date.get(fecha)
+            if r is None:
+                dates = self._dates[currency]
+                i = bisect.bisect_right(dates, fecha)
+                r = by_date[dates[i - 1]] if i else None
+        self._resolved[key] = r
+        return r
+
+    def rate(self, currency: str, fecha: str) -> Optional[Decimal]:
+        currency = (currency or BASE_CURRENCY).upper()
+        if currency == BASE_CURRENCY:
+            return Decimal(1)
+        with self._lock:
+            self._check()
+            return self._rate(currency, str(fecha or "")[:10])
+
+    def convert_groups(self, groups: Dict[Hashable, Tuple[str, str, Decimal]]) -> Dict[Hashable, Optional[int]]:
+        """
+        {clave: (moneda, fecha, monto_total)} -> {clave: CLP o None si no hay tasa}.
+        Un solo lock y una resolución de tasa por grupo.
+        """
+        out: Dict[Hashable, Optional[int]] = {}
+        with self._lock:
+            self._check()
+            for k, (currency, fecha, amount) in groups.items():
+                currency = (currency or BASE_CURRENCY).upper()
+                r = Decimal(1) if currency == BASE_CURRENCY else self._rate(currency, str(fecha or "")[:10])
+                out[k] = _round_clp(amount * r) if r is not None else None
+        return out
+
+    def save(self, data: Dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+table = RateTable()
+
+
+def rate(currency: str, fecha: str) -> Optional[Decimal]:
+    return table.rate(currency, fecha)
+
+
+def to_clp(amount: Any, currency: str, fecha: str) -> Optional[int]:
+    d = to_decimal(amount)
+    r = table.rate(currency, fecha)
+    return _round_clp(d * r) if d is not None and r is not None else None
+
+
+def convert_groups(groups: Dict[Hashable, Tuple[str, str, Decimal]]) -> Dict[Hashable, Optional[int]]:
+    return table.convert_groups(groups)
+
+
+def version() -> str:
+    return table.version()
+
+
+def refresh_from_provider(url: str = FX_PROVIDER_URL) -> int:
+    """Baja la tabla de FX_PROVIDER_URL, la mezcla con la local y la guarda. Devuelve cuántas tasas nuevas hubo."""
+    if not url:
+        raise RuntimeError("Falta FX_PROVIDER_URL")
+    import requests
+    from app.core import metrics
+
+    with metrics.timed(metrics.UPSTREAM, service="fx", op="rates"):
+        resp = requests.get(url, timeout=30)
+    resp.raise_for_status()
+    incoming = (resp.json() or {}).get("rates") or {}
+    try:
+        with open(table.path, "r", encoding="utf-8") as f:
+            current = json.load(f)
+    except (OSError, ValueError):
+        current = {"base": BASE_CURRENCY, "rates": {}}
+    merged = current.setdefault("rates", {})
+    added = 0
+    for cur, by_date in incoming.items():
+        dst = merged.setdefault(cur.upper(), {})
+        for d, v in by_date.items():
+            if to_decimal(v) and dst.get(d) != str(v):
+                dst[d] = str(v)
+                added += 1
+    if added:
+        table.save(current)
+    return added
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Tabla local de tipos de cambio")
+    ap.add_argument("--refresh", action="store_true", help="bajar tasas de FX_PROVIDER_URL")
+    ap.add_argument("--url", default=FX_PROVIDER_URL)
+    args = ap.parse_args()
+    if args.refresh:
+        print(json.dumps({"added": refresh_from_provider(args.url), "file": table.path}))
+    else:
+        table.version()
+        print(json.dumps({"file": table.path, "currencies": {c: len(v) for c, v in table._rates.items()}}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# app/services/gateway.py
+"""
+Gateway único de mensajería saliente: Telegram, WhatsApp Cloud y Twilio.
+
+- Un solo httpx.AsyncClient (pool de conexiones keep-alive compartido).
+- Límite de concurrencia y circuit breaker por canal.
+- Reintentos con backoff ante 429/5xx y errores de red.
+- Estado de entrega común (en memoria, acotado) consultable por id.
+
+    d = await gateway.send("telegram", None, "hola")
+    gateway.get_delivery(d["id"])
+"""
+import asyncio, random, threading, time, uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.core import metrics
+from app.core.settings import settings
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CHANNELS = ("telegram", "whatsapp_cloud", "twilio")
+
+
+class GatewayError(RuntimeError):
+    pass
+
+
+class CircuitOpen(GatewayError):
+    pass
+
+
+class CircuitBreaker:
+    """closed -> (N fallos seguidos) -> open -> (reset_after s) -> half-open -> 1 intento."""
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        st = self.state
+        if st == "closed":
+            return True
+        if st == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Libera el intento de half-open si terminó sin veredicto (cancelado, excepción)."""
+        self._probing = False
+
+
+class DeliveryStore:
+    """Últimas N entregas por id (LRU). Thread-safe: también se consulta desde endpoints sync."""
+
+    def __init__(self, max_items: int = 10000):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, d: Dict[str, Any]) -> None:
+        with self._lock:
+            self._items[d["id"]] = d
+            self._items.move_to_end(d["id"])
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, delivery_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            d = self._items.get(delivery_id)
+            return dict(d) if d else None
+
+
+_client = None
+_sems: Dict[str, asyncio.Semaphore] = {}
+breakers: Dict[str, CircuitBreaker] = {
+    ch: CircuitBreaker(settings.gateway_breaker_threshold, settings.gateway_breaker_reset_s) for ch in CHANNELS
+}
+deliveries = DeliveryStore()
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        import httpx  # diferido: no pesa en el arranque
+        _client = httpx.AsyncClient(
+            timeout=15,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        )
+    return _client
+
+
+def _sem(channel: str) -> asyncio.Semaphore:
+    s = _sems.get(channel)
+    if s is None:
+        s = _sems[channel] = asyncio.Semaphore(settings.gateway_concurrency.get(channel, 8))
+    return s
+
+
+def _build(channel: str, to: Optional[str], text: str) -> Dict[str, Any]:
+    """Arma el request HTTP del canal (url + kwargs de httpx)."""
+    s = settings
+    if channel == "telegram":
+        if not s.telegram_bot_token:
+            raise GatewayError("Falta TELEGRAM_BOT_TOKEN/TELEGRAM_TOKEN")
+        chat = to or s.telegram_chat_id
+        if not chat:
+            raise GatewayError("Falta TELEGRAM_CHAT_ID")
+        return {
+            "url": f"{s.telegram_api_base}/bot{s.telegram_bot_token}/sendMessage",
+            "json": {"chat_id": chat, "text": text, "parse_mode": "HTML"},
+        }
+    if channel == "whatsapp_cloud":
+        if not (s.whatsapp_token and s.phone_number_id):
+            raise GatewayError("Faltan WHATSAPP_TOKEN/PHONE_NUMBER_ID")
+        return {
+            "url": f"{s.whatsapp_api_base}/{s.phone_number_id}/messages",
+            "headers": {"Authorization": f"Bearer {s.whatsapp_token}"},
+            "json": {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": text}},
+        }
+    if channel == "twilio":
+        if not (s.twilio_account_sid and s.twilio_auth_token and s.twilio_whatsapp_from):
+            raise GatewayError("Faltan credenciales TWILIO_ (SID/TOKEN/FROM)")
+        return {
+            "url": f"{s.twilio_api_base}/2010-04-01/Accounts/{s.twilio_account_sid}/Messages.json",
+            "auth": (s.twilio_account_sid, s.twilio_auth_token),
+            "data": {"From": s.twilio_whatsapp_from, "To": to, "Body": text},
+        }
+    raise GatewayError(f"canal desconocido: {channel}")
+
+
+def check_config(channel: str) -> None:
+    """Lanza GatewayError si el canal no está configurado."""
+    _build(channel, None, "")
+
+
+def _provider_id(channel: str, data: Dict[str, Any]) -> Optional[str]:
+    if channel == "telegram":
+        return str(((data or {}).get("result") or {}).get("message_id") or "") or None
+    if channel == "whatsapp_cloud":
+        msgs = (data or {}).get("messages") or [{}]
+        return msgs[0].get("id")
+    return (data or {}).get("sid")
+
+
+async def send(channel: str, to: Optional[str], text: str) -> Dict[str, Any]:
+    """
+    Envía y devuelve el registro de entrega (status 'sent' o 'failed').
+    Errores de configuración y circuito abierto se lanzan como GatewayError.
+    """
+    req = _build(channel, to, text)
+    breaker = breakers[channel]
+    d = {"id": uuid.uuid4().hex, "channel": channel, "to": to, "status": "queued",
+         "attempts": 0, "provider_id": None, "error": None, "ts": time.time()}
+    deliveries.put(d)
+    if not breaker.allow():
+        d.update(status="failed", error="circuit_open")
+        raise CircuitOpen(f"{channel}: circuito abierto")
+
+    client = _get_client()
+    try:
+        return await _deliver(client, req, breaker, channel, d)
+    finally:
+        breaker.release()
+
+
+async def _deliver(client, req: Dict[str, Any], breaker: CircuitBreaker, channel: str,
+                   d: Dict[str, Any]) -> Dict[str, Any]:
+    async with _sem(channel):
+        while True:
+            d["attempts"] += 1
+            status, err = None, None
+            try:
+                with metrics.timed(metrics.UPSTREAM, service=channel, op="send"):
+                    r = await client.post(req["url"], **{k: v for k, v in req.items() if k != "url"})
+                status = r.status_code
+            except Exception as e:  # red / timeout
+                err = repr(e)
+            if status is not None and status < 400:
+                breaker.success()
+                try:
+                    data = r.json()
+                except ValueError:
+                    data = {}
+                d.update(status="sent", provider_id=_provider_id(channel, data), ts=time.time())
+                return dict(d)
+            if status is not None:
+                err = f"HTTP {status}: {r.text[:200]}"
+            retryable = status is None or status in RETRY_STATUSES
+            if not retryable or d["attempts"] > settings.gateway_max_retries:
+                if retryable:
+                    breaker.failure()
+                else:
+                    breaker.success()  # un 4xx es culpa de la petición: el upstream respondió
+                d.update(status="failed", error=err, ts=time.time())
+                return dict(d)
+            await asyncio.sleep(min(8.0, 0.25 * 2 ** (d["attempts"] - 1)) * (0.5 + random.random()))
+
+
+def get_delivery(delivery_id: str) -> Optional[Dict[str, Any]]:
+    return deliveries.get(delivery_id)
+
+
+def health() -> Dict[str, str]:
+    return {ch: b.state for ch, b in breakers.items()}
+
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _sems.clear()
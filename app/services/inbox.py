@@ -0,0 +1,93 @@
+# app/services/inbox.py
+"""
+Cola interna de eventos entrantes (mensajes de WhatsApp/Telegram).
+
+Los webhooks publican con `publish(evt)` (O(1), no bloquea) y responden de
+inmediato; N workers async consumen la cola y llaman a los handlers
+registrados con `register(fn)`. Cola acotada (INBOX_MAX_EVENTS): si se
+llena, el evento se descarta y se loguea (mejor que bloquear el webhook).
+"""
+import asyncio, logging, os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger("ameth.inbox")
+
+INBOX_MAX_EVENTS = int(os.getenv("INBOX_MAX_EVENTS", "10000") or 10000)
+INBOX_WORKERS = max(1, int(os.getenv("INBOX_WORKERS", "4") or 4))
+
+Event = Dict[str, Any]
+Handler = Callable[[Event], Awaitable[None]]
+
+_handlers: List[Handler] = []
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+dropped = 0
+
+
+def register(fn: Handler) -> Handler:
+    """Registra un handler async(evt). Usable como decorador."""
+    if fn not in _handlers:
+        _handlers.append(fn)
+    return fn
+
+
+async def _worker() -> None:
+    assert _queue is not None
+    while True:
+        evt = await _queue.get()
+        try:
+            for fn in _handlers:
+                try:
+                    await fn(evt)
+                except Exception:
+                    log.exception("inbox handler failed", extra={"handler": getattr(fn, "__name__", str(fn))})
+        finally:
+            _queue.task_done()
+
+
+def start() -> None:
+    """Crea la cola y los workers en el event loop actual (idempotente)."""
+    global _queue
+    if _workers:
+        return
+    _queue = asyncio.Queue(maxsize=INBOX_MAX_EVENTS)
+    loop = asyncio.get_running_loop()
+    for _ in range(INBOX_WORKERS):
+        _workers.append(loop.create_task(_worker()))
+
+
+def publish(evt: Event) -> bool:
+    global dropped
+    if not _workers:
+        start()
+    try:
+        _queue.put_nowait(evt)
+        return True
+    except asyncio.QueueFull:
+        dropped += 1
+        log.warning("inbox full, event dropped", extra={"dropped": dropped, "source": evt.get("source")})
+        return False
+
+
+async def drain() -> None:
+    """Espera a que la cola quede vacía (útil en benchmarks/replay)."""
+    if _queue is not None:
+        await _queue.join()
+
+
+async def stop() -> None:
+    global _queue
+    for t in _workers:
+        t.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+
+def stats() -> Dict[str, int]:
+    return {
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "workers": len(_workers),
+        "handlers": len(_handlers),
+        "dropped": dropped,
+    }
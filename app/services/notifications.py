@@ -3,7 +3,7 @@ import os
 from datetime import date
 from zoneinfo import ZoneInfo
 from app.integrations.telegram import send_message
-from app.storage.db import summary_month
+from app.storage.finance_storage import summary_month
 
 TZ = ZoneInfo("America/Santiago")
 NOTIFY_ENABLED = os.getenv("TELEGRAM_NOTIFY", "true").lower() == "true"
@@ -28,6 +28,19 @@ def notify_finance_event(tipo: str, concepto: str, monto_clp: int, categoria: st
     except Exception:
         pass
 
+def notify_budget_alert(month: str, categoria: str, threshold: float, spent: int, budget: int):
+    """Llamada desde el hilo de alertas de app.services.budgets (una vez por cruce de umbral)."""
+    if not NOTIFY_ENABLED:
+        return
+    titulo = "Presupuesto superado" if threshold >= 1 else f"Presupuesto al {threshold:.0%}"
+    msg = (
+        f"<b>{titulo}</b>\n"
+        f"Mes: <code>{month}</code> — {categoria}\n"
+        f"• Gastado: {_fmt_money(spent)} de {_fmt_money(budget)} ({spent / budget:.0%})\n"
+        f"• Disponible: {_fmt_money(max(0, budget - spent))}"
+    )
+    send_message(msg)
+
 def daily_greeting_summary():
     if not NOTIFY_ENABLED:
         return
@@ -0,0 +1,221 @@
+# app/services/sheets_sync.py
+"""
+Espejo de los registros de cada mes en Google Sheets (una hoja por 'YYYY-MM').
+
+- Las escrituras en finance_storage llaman notify(month) (thread-safe).
+- Los avisos se agrupan con un debounce (SHEETS_DEBOUNCE_S) por mes.
+- flush(month) compara por id contra lo último sincronizado y manda SÓLO
+  las filas cambiadas en un único values:batchUpdate (+ un batchClear si
+  hubo borrados). Nunca una llamada por registro.
+
+Layout de la hoja: fila 1 = encabezado, columna A = id del registro.
+"""
+import asyncio, hashlib, json, logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.core import metrics
+from app.core.settings import settings
+
+log = logging.getLogger("ameth.sheets")
+
+COLUMNS = ["id", "fecha", "concepto", "categoria", "monto_clp", "tipo", "created_at"]
+_LAST_COL = chr(ord("A") + len(COLUMNS) - 1)
+
+
+def _rng(month: str, a1: str) -> str:
+    # nombres de hoja con '-' van entre comillas simples en notación A1
+    return f"'{month}'!{a1}"
+
+
+def _row(rec: Dict[str, Any]) -> List[Any]:
+    return [rec.get(c, "") for c in COLUMNS]
+
+
+def _digest(row: List[Any]) -> str:
+    return hashlib.sha1(json.dumps(row, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+class _MonthState:
+    def __init__(self):
+        self.row_of: Dict[str, int] = {}   # id -> nº de fila en la hoja
+        self.digest: Dict[str, str] = {}   # id -> hash de la última fila enviada
+        self.next_row = 2
+        self.ready = False                 # ya se leyó la hoja / se creó
+
+
+class SheetsSync:
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        token_provider: Callable[[], Optional[str]],
+        records_loader: Callable[[str], List[Dict[str, Any]]],
+        api_base: str = "https://sheets.googleapis.com/v4",
+        debounce_s: float = 2.0,
+    ):
+        self.spreadsheet_id = spreadsheet_id
+        self.token_provider = token_provider
+        self.records_loader = records_loader
+        self.api_base = api_base.rstrip("/")
+        self.debounce_s = debounce_s
+        self.api_calls = 0
+        self._state: Dict[str, _MonthState] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client = None
+        self._pending: Set[asyncio.Task] = set()
+
+    # --- ciclo de vida ---
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+
+    async def aclose(self) -> None:
+        for h in self._timers.values():
+            h.cancel()
+        self._timers.clear()
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # --- debounce ---
+    def notify(self, month: str) -> None:
+        """Marca el mes como sucio. Se puede llamar desde cualquier hilo."""
+        if self._loop is None or not month:
+            return
+        self._loop.call_soon_threadsafe(self._schedule, month)
+
+    def _schedule(self, month: str) -> None:
+        h = self._timers.pop(month, None)
+        if h:
+            h.cancel()
+        self._timers[month] = self._loop.call_later(self.debounce_s, self._fire, month)
+
+    def _fire(self, month: str) -> None:
+        self._timers.pop(month, None)
+        t = self._loop.create_task(self._safe_flush(month))
+        self._pending.add(t)
+        t.add_done_callback(self._pending.discard)
+
+    async def _safe_flush(self, month: str) -> None:
+        try:
+            await self.flush(month)
+        except Exception as e:
+            log.warning("sheets flush failed: %s", e, extra={"month": month})
+
+    # --- HTTP ---
+    async def _call(self, op: str, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        if self._client is None:
+            import httpx  # diferido: no pesa en el arranque
+            self._client = httpx.AsyncClient(timeout=30)
+        token = await asyncio.to_thread(self.token_provider)
+        if not token:
+            raise RuntimeError("sin credenciales de Google")
+        self.api_calls += 1
+        with metrics.timed(metrics.UPSTREAM, service="google_sheets", op=op):
+            r = await self._client.request(
+                method, f"{self.api_base}/spreadsheets/{self.spreadsheet_id}{path}",
+                headers={"Authorization": f"Bearer {token}"}, **kwargs,
+            )
+        r.raise_for_status()
+        return r.json() if r.content else {}
+
+    async def _prepare(self, month: str, st: _MonthState) -> None:
+        """Primera vez por mes: lee la columna A (1 llamada) o crea la hoja (1 llamada)."""
+        try:
+            data = await self._call("values_get", "GET", f"/values/{_rng(month, 'A:A')}")
+            ids = [(row[0] if row else "") for row in data.get("values", [])]
+            for i, rid in enumerate(ids[1:], start=2):
+                if rid:
+                    st.row_of[rid] = i
+            st.next_row = max(2, len(ids) + 1)
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status not in (400, 404):
+                raise
+            await self._call("add_sheet", "POST", ":batchUpdate", json={
+                "requests": [{"addSheet": {"properties": {"title": month}}}],
+            })
+            st.row_of.clear()
+            st.next_row = 2
+        st.ready = True
+
+    async def flush(self, month: str) -> Dict[str, int]:
+        lock = self._locks.setdefault(month, asyncio.Lock())
+        async with lock:
+            st = self._state.setdefault(month, _MonthState())
+            if not st.ready:
+                await self._prepare(month, st)
+            records = await asyncio.to_thread(self.records_loader, month)
+
+            data: List[Dict[str, Any]] = []
+            if st.next_row == 2 and not st.row_of:
+                data.append({"range": _rng(month, f"A1:{_LAST_COL}1"), "values": [COLUMNS]})
+            seen: Set[str] = set()
+            new_digest: Dict[str, str] = {}
+            for rec in records:
+                rid = str(rec.get("id") or "")
+                if not rid:
+                    continue
+                seen.add(rid)
+                row = _row(rec)
+                d = _digest(row)
+                new_digest[rid] = d
+                if st.digest.get(rid) == d:
+                    continue
+                n = st.row_of.get(rid)
+                if n is None:
+                    n = st.row_of[rid] = st.next_row
+                    st.next_row += 1
+                data.append({"range": _rng(month, f"A{n}:{_LAST_COL}{n}"), "values": [row]})
+
+            removed = [rid for rid in st.row_of if rid not in seen]
+            clears = [_rng(month, f"A{st.row_of[rid]}:{_LAST_COL}{st.row_of[rid]}") for rid in removed]
+
+            if data:
+                await self._call("values_batch_update", "POST", "/values:batchUpdate", json={"valueInputOption": "RAW", "data": data})
+            if clears:
+                await self._call("values_batch_clear", "POST", "/values:batchClear", json={"ranges": clears})
+            for rid in removed:
+                st.row_of.pop(rid, None)
+            st.digest = new_digest
+            return {"updated": len(data), "cleared": len(clears)}
+
+
+_engine: Optional[SheetsSync] = None
+
+
+def _google_token() -> Optional[str]:
+    from app.integrations import google_oauth
+    creds = google_oauth.holder.get()
+    return creds.token if creds and creds.valid else None
+
+
+def _finance_month(month: str) -> List[Dict[str, Any]]:
+    from app.storage import finance_storage
+    return finance_storage.list_records(month=month)
+
+
+def start() -> Optional[SheetsSync]:
+    """Arranca el motor si SHEETS_SPREADSHEET_ID está configurado."""
+    global _engine
+    if _engine is None and settings.sheets_spreadsheet_id:
+        _engine = SheetsSync(
+            settings.sheets_spreadsheet_id, _google_token, _finance_month,
+            api_base=settings.sheets_api_base, debounce_s=settings.sheets_debounce_s,
+        )
+        _engine.start()
+    return _engine
+
+
+def notify(month: str) -> None:
+    if _engine is not None:
+        _engine.notify(month)
+
+
+async def stop() -> None:
+    global _engine
+    if _engine is not None:
+        await _engine.aclose()
+        _engine = None
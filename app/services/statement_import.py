@@ -0,0 +1,331 @@
+# app/services/statement_import.py
+"""
+Importación de cartolas bancarias (CSV / XLSX) al repositorio único.
+
+    python -m app.services.statement_import cartola.csv --profile default
+    python -m app.services.statement_import cartola_2025.xlsx --profile bancoestado --dry-run
+    POST /finance/import?profile=default&fmt=csv   (body = archivo crudo)
+
+- Lectura en streaming y memoria constante: CSV con el módulo csv sobre el
+  archivo abierto; XLSX con openpyxl en modo read_only (iter_rows con
+  values_only). Nunca se arma la lista completa de filas.
+- Las columnas se mapean con un perfil (IMPORT_PROFILES_FILE, JSON
+  {nombre: perfil}; "default" viene incluido). Un perfil indica columnas de
+  fecha, descripción y monto con signo, o cargo/abono por separado, además del
+  formato de fecha y de números.
+- Las filas se normalizan en chunks de IMPORT_CHUNK_ROWS. En archivos
+  grandes (>= IMPORT_PARALLEL_MIN_BYTES) los chunks van a un
+  ProcessPoolExecutor de IMPORT_WORKERS procesos, con a lo más 2 chunks en
+  vuelo por worker; el orden se conserva. Los workers arrancan con
+  forkserver (spawn donde no existe): un fork del proceso de la app copiaría
+  el hilo escritor, el pool de lectura y locks tomados.
+- La categoría sale de la columna del perfil o de app.services.classifier
+  (en el proceso principal, que tiene el historial).
+- Se hace commit con repository.add_many cada IMPORT_COMMIT_ROWS registros
+  (un flock y una escritura por mes tocado por lote). Reimportar la misma
+  cartola es inocuo; la idem_key de cada fila (_import_key) es:
+    - con nº de operación (columna 'reference'): (source, external_id), así
+      dos compras iguales con distinta referencia son dos registros;
+    - sin referencia: compute_idem_key + nº de repetición dentro del archivo
+      (la 2ª fila idéntica es "la segunda", no un duplicado de la primera).
+"""
+import argparse, csv, hashlib, io, itertools, json, multiprocessing, os, time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.storage.repository import DATA_DIR, compute_idem_key, get_repository
+
+IMPORT_PROFILES_FILE = os.environ.get("IMPORT_PROFILES_FILE", os.path.join(DATA_DIR, "import_profiles.json"))
+IMPORT_CHUNK_ROWS = max(1, int(os.getenv("IMPORT_CHUNK_ROWS", "5000") or 5000))
+IMPORT_COMMIT_ROWS = max(1, int(os.getenv("IMPORT_COMMIT_ROWS", "10000") or 10000))
+IMPORT_WORKERS = max(1, int(os.getenv("IMPORT_WORKERS", str(min(4, os.cpu_count() or 1))) or 1))
+IMPORT_PARALLEL_MIN_BYTES = int(os.getenv("IMPORT_PARALLEL_MIN_BYTES", str(2 * 1024 * 1024)) or 0)
+# Errores de fila que se devuelven en el reporte (el resto sólo se cuenta)
+MAX_REPORTED_ERRORS = 50
+
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "date": "fecha",
+    "description": "descripcion",
+    "amount": "monto",          # monto con signo (negativo = gasto) ...
+    "debit": None,              # ... o cargo/abono en columnas separadas
+    "credit": None,
+    "category": None,
+    "reference": None,          # nº de operación -> external_id
+    "date_formats": ["%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"],
+    "decimal": ",",
+    "thousands": ".",
+    "delimiter": None,          # None = detectar (csv.Sniffer) entre ; , y tab
+    "encoding": "utf-8-sig",
+    "skip_rows": 0,             # filas antes del encabezado (logo, datos de la cuenta...)
+    "sheet": None,
+}
+
+
+class StatementError(ValueError):
+    """Archivo o perfil inválido (no errores de fila: esos van al reporte)."""
+
+
+def _norm_header(x: Any) -> str:
+    return " ".join(str(x or "").strip().lower().split())
+
+
+def load_profile(name: str = "default") -> Dict[str, Any]:
+    profiles: Dict[str, Dict] = {}
+    if os.path.exists(IMPORT_PROFILES_FILE):
+        try:
+            with open(IMPORT_PROFILES_FILE, "r", encoding="utf-8") as f:
+                profiles = json.load(f) or {}
+        except (OSError, ValueError) as e:
+            raise StatementError(f"{IMPORT_PROFILES_FILE} ilegible: {e}")
+        if not isinstance(profiles, dict) or not isinstance(profiles.get(name, {}), dict):
+            raise StatementError(f"{IMPORT_PROFILES_FILE} debe ser un JSON {{nombre: perfil}}")
+    if name != "default" and name not in profiles:
+        raise StatementError(f"perfil desconocido: {name}")
+    return {**DEFAULT_PROFILE, **profiles.get(name, {}), "name": name}
+
+
+# --- lectura (streaming) ---
+def _iter_csv(fh, profile: Dict) -> Iterator[Sequence[Any]]:
+    text = io.TextIOWrapper(fh, encoding=profile["encoding"], errors="replace", newline="")
+    delimiter = profile["delimiter"]
+    if not delimiter:
+        sample = text.read(64 * 1024)
+        sample += text.readline()  # completar la última línea de la muestra
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+        except csv.Error:
+            delimiter = ";"
+        text = itertools.chain(io.StringIO(sample), text)
+    return csv.reader(text, delimiter=delimiter)
+
+
+def _iter_xlsx(fh, profile: Dict) -> Iterator[Sequence[Any]]:
+    try:
+        from openpyxl import load_workbook
+    except Exception:
+        raise RuntimeError("xlsx no disponible: instala 'openpyxl'")
+    wb = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        ws = wb[profile["sheet"]] if profile.get("sheet") else wb.worksheets[0]
+        for row in ws.iter_rows(values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+
+def _columns(header: Sequence[Any], profile: Dict) -> Dict[str, int]:
+    idx = {_norm_header(h): i for i, h in enumerate(header)}
+    cols: Dict[str, int] = {}
+    for key in ("date", "description", "amount", "debit", "credit", "category", "reference"):
+        name = profile.get(key)
+        if name:
+            if _norm_header(name) not in idx:
+                if key in ("category", "reference"):
+                    continue
+                raise StatementError(f"columna '{name}' no está en el encabezado")
+            cols[key] = idx[_norm_header(name)]
+    if "date" not in cols or "description" not in cols:
+        raise StatementError("el perfil debe indicar columnas de fecha y descripción")
+    if "amount" not in cols and not ("debit" in cols or "credit" in cols):
+        raise StatementError("el perfil debe indicar 'amount' o 'debit'/'credit'")
+    return cols
+
+
+def iter_rows(fh, fmt: str, profile: Dict) -> Tuple[Dict[str, int], Iterator[Tuple[int, Sequence[Any]]]]:
+    """(columnas, iterador de (nº de línea, fila)) desde un archivo binario abierto."""
+    raw = _iter_xlsx(fh, profile) if fmt == "xlsx" else _iter_csv(fh, profile)
+    numbered = enumerate(raw, start=1)
+    for _ in range(int(profile.get("skip_rows") or 0)):
+        next(numbered, None)
+    for line, header in numbered:
+        if any(str(c or "").strip() for c in header):
+            return _columns(header, profile), (x for x in numbered if any(str(c or "").strip() for c in x[1]))
+    raise StatementError("archivo sin encabezado")
+
+
+# --- normalización (corre en procesos hijos: sólo funciones de módulo y datos simples) ---
+def _amount(v: Any, profile: Dict) -> Optional[Decimal]:
+    if v is None or v == "":
+        return None
+    if isinstance(v, (int, float, Decimal)):
+        return Decimal(str(v))
+    s = str(v).strip().replace("$", "").replace(" ", "")
+    neg = s.startswith("(") and s.endswith(")")
+    s = s.strip("()")
+    if profile["thousands"]:
+        s = s.replace(profile["thousands"], "")
+    if profile["decimal"] and profile["decimal"] != ".":
+        s = s.replace(profile["decimal"], ".")
+    if not s or s in ("-", "+"):
+        return None
+    d = Decimal(s)
+    return -d if neg else d
+
+
+def _date(v: Any, profile: Dict) -> str:
+    if isinstance(v, datetime):
+        return v.date().isoformat()
+    if hasattr(v, "isoformat"):  # date
+        return v.isoformat()
+    s = str(v or "").strip()
+    for f in profile["date_formats"]:
+        try:
+            return datetime.strptime(s, f).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"fecha inválida: {s!r}")
+
+
+def _cell(row: Sequence[Any], i: Optional[int]) -> Any:
+    return row[i] if i is not None and i < len(row) else None
+
+
+def normalize_chunk(profile: Dict, cols: Dict[str, int],
+                    rows: List[Tuple[int, Sequence[Any]]]) -> Tuple[List[Dict], List[Tuple[int, str]]]:
+    """Filas crudas -> (registros sin categoría inferida, [(línea, error)])."""
+    out: List[Dict] = []
+    errors: List[Tuple[int, str]] = []
+    source = f"bank:{profile['name']}"
+    for line, row in rows:
+        try:
+            if "amount" in cols:
+                amount = _amount(_cell(row, cols["amount"]), profile)
+            else:
+                debit = _amount(_cell(row, cols.get("debit")), profile) or Decimal(0)
+                credit = _amount(_cell(row, cols.get("credit")), profile) or Decimal(0)
+                amount = credit - abs(debit)
+            if not amount:
+                raise ValueError("sin monto")
+            concepto = " ".join(str(_cell(row, cols["description"]) or "").split())
+            ref = _cell(row, cols.get("reference"))
+            out.append({
+                "fecha": _date(_cell(row, cols["date"]), profile),
+                "concepto": concepto or "sin concepto",
+                "categoria": str(_cell(row, cols.get("category")) or "").strip().lower() or None,
+                "monto_clp": int(abs(amount).to_integral_value(ROUND_HALF_UP)),
+                "tipo": "gasto" if amount < 0 else "ingreso",
+                "source": source,
+                "external_id": str(ref).strip() if ref not in (None, "") else None,
+            })
+        except (ValueError, InvalidOperation, ArithmeticError) as e:
+            errors.append((line, str(e) or type(e).__name__))
+    return out, errors
+
+
+def _chunks(it: Iterable, size: int) -> Iterator[List]:
+    it = iter(it)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _normalized(rows: Iterator, profile: Dict, cols: Dict[str, int], parallel: bool) -> Iterator[Tuple[List[Dict], List]]:
+    chunks = _chunks(rows, IMPORT_CHUNK_ROWS)
+    if not parallel or IMPORT_WORKERS == 1:
+        for c in chunks:
+            yield normalize_chunk(profile, cols, c)
+        return
+    # ventana acotada de chunks en vuelo: memoria constante y orden preservado
+    with ProcessPoolExecutor(max_workers=IMPORT_WORKERS, mp_context=_mp_context()) as pool:
+        inflight: deque = deque()
+        for c in chunks:
+            inflight.append(pool.submit(normalize_chunk, profile, cols, c))
+            if len(inflight) >= IMPORT_WORKERS * 2:
+                yield inflight.popleft().result()
+        while inflight:
+            yield inflight.popleft().result()
+
+
+# --- import ---
+def _import_key(r: Dict, repeats: Counter) -> str:
+    if r.get("external_id"):
+        raw = f"ref|{r['source']}|{r['external_id']}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    base = compute_idem_key(r["fecha"], r["concepto"], r["categoria"], r["monto_clp"], r["tipo"])
+    repeats[base] += 1
+    n = repeats[base]
+    # la primera conserva la clave normal (dedupe con lo cargado a mano/por chat)
+    return base if n == 1 else hashlib.sha256(f"{base}|{n}".encode("utf-8")).hexdigest()
+
+
+def import_file(fh, fmt: str, profile: Dict, size_hint: int = 0, dry_run: bool = False) -> Dict[str, Any]:
+    from app.services import classifier
+    from app.storage.repository import ensure_schema
+
+    fmt = fmt.lower()
+    if fmt not in ("csv", "xlsx"):
+        raise StatementError("Formato no soportado. Usa csv o xlsx.")
+    t0 = time.perf_counter()
+    repo = get_repository()
+    cols, rows = iter_rows(fh, fmt, profile)
+    parallel = size_hint >= IMPORT_PARALLEL_MIN_BYTES
+    report: Dict[str, Any] = {"profile": profile["name"], "format": fmt, "parallel": parallel,
+                              "rows": 0, "inserted": 0, "duplicates": 0, "errors": 0, "error_samples": [],
+                              "months": set()}
+    seen = set()
+    repeats: Counter = Counter()
+    pending: List[Dict] = []
+
+    def commit():
+        if dry_run:
+            existing = {r["idem_key"] for m in {r["fecha"][:7] for r in pending}
+                        for r in repo.list_month(m, include_hidden=True)}
+            n = 0
+            for r in map(ensure_schema, pending):
+                if r["idem_key"] not in existing and r["idem_key"] not in seen:
+                    seen.add(r["idem_key"])
+                    n += 1
+        else:
+            n = repo.add_many(pending, enforce_idempotency=True)
+        report["inserted"] += n
+        report["duplicates"] += len(pending) - n
+        pending.clear()
+
+    for recs, errors in _normalized(rows, profile, cols, parallel):
+        report["rows"] += len(recs) + len(errors)
+        report["errors"] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(report["error_samples"])
+        report["error_samples"].extend({"line": ln, "error": msg} for ln, msg in errors[:max(0, room)])
+        for r in recs:
+            r["categoria"] = classifier.resolve(r["concepto"], r["categoria"])
+            r["idem_key"] = _import_key(r, repeats)
+            report["months"].add(r["fecha"][:7])
+        pending.extend(recs)
+        if len(pending) >= IMPORT_COMMIT_ROWS:
+            commit()
+    if pending:
+        commit()
+    report["months"] = sorted(report["months"])
+    report["dry_run"] = dry_run
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+def import_path(path: str, profile: str = "default", fmt: Optional[str] = None, dry_run: bool = False) -> Dict[str, Any]:
+    fmt = fmt or ("xlsx" if path.lower().endswith((".xlsx", ".xlsm")) else "csv")
+    with open(path, "rb") as fh:
+        return import_file(fh, fmt, load_profile(profile), os.path.getsize(path), dry_run)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Importa una cartola bancaria (CSV/XLSX) al repositorio de finanzas")
+    ap.add_argument("path")
+    ap.add_argument("--profile", default="default")
+    ap.add_argument("--format", choices=("csv", "xlsx"))
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    print(json.dumps(import_path(args.path, args.profile, args.format, args.dry_run), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
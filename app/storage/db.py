@@ -1,38 +1,16 @@
 # app/storage/db.py
+"""
+Adaptador de la antigua API sqlite sobre el repositorio único
+(app/storage/repository.py). DATA_DIR/ameth.sqlite3 ya no se escribe; sus
+filas se traen con `python -m app.storage.migrate`.
+"""
 import os
-import sqlite3
 from typing import Any, Dict, List
 
-DB_DIR = os.getenv("DATA_DIR", "./data").strip() or "./data"
-DB_PATH = os.path.join(DB_DIR, "ameth.sqlite3")
-
-def _ensure_db() -> None:
-    os.makedirs(DB_DIR, exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        # Tabla principal
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS finance_items (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                fecha      TEXT    NOT NULL,                   -- 'YYYY-MM-DD'
-                concepto   TEXT    NOT NULL,
-                categoria  TEXT    NOT NULL,
-                tipo       TEXT    NOT NULL CHECK (tipo IN ('gasto','ingreso')),
-                monto_clp  INTEGER NOT NULL,
-                ts         TEXT    NOT NULL DEFAULT (datetime('now','localtime'))
-            )
-            """
-        )
-        # Migración defensiva: agrega ts si faltara
-        cur.execute("PRAGMA table_info(finance_items)")
-        cols = {row[1] for row in cur.fetchall()}
-        if "ts" not in cols:
-            cur.execute("ALTER TABLE finance_items ADD COLUMN ts TEXT NOT NULL DEFAULT (datetime('now','localtime'))")
-        conn.commit()
+from app.storage.repository import get_repository
 
-def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
-    return {k: row[k] for k in row.keys()}
+DB_DIR = os.getenv("DATA_DIR", "./data").strip() or "./data"
+DB_PATH = os.path.join(DB_DIR, "ameth.sqlite3")  # sólo como fuente de la migración
 
 def record_item(item: Dict[str, Any]) -> bool:
     """
@@ -42,68 +20,37 @@ def record_item(item: Dict[str, Any]) -> bool:
         'tipo': 'gasto'|'ingreso', 'monto_clp': int
     }
     """
-    _ensure_db()
     required = {"fecha", "concepto", "categoria", "tipo", "monto_clp"}
     if not required.issubset(item.keys()):
         raise ValueError(f"Faltan campos: {required - set(item.keys())}")
+    if str(item["tipo"]) not in ("gasto", "ingreso"):
+        raise ValueError("tipo debe ser 'gasto' o 'ingreso'")
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO finance_items (fecha, concepto, categoria, tipo, monto_clp)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                str(item["fecha"]),
-                str(item["concepto"]),
-                str(item["categoria"]),
-                str(item["tipo"]),
-                int(item["monto_clp"]),
-            ),
-        )
-        conn.commit()
+    # como el INSERT de sqlite: sin dedupe por contenido
+    get_repository().add({
+        "fecha": str(item["fecha"]),
+        "concepto": str(item["concepto"]),
+        "categoria": str(item["categoria"]),
+        "tipo": str(item["tipo"]),
+        "monto_clp": int(item["monto_clp"]),
+    }, enforce_idempotency=False)
     return True
 
 def list_items() -> List[Dict[str, Any]]:
     """Retorna todos los items (más nuevos primero)."""
-    _ensure_db()
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT fecha, concepto, categoria, tipo, monto_clp, ts
-            FROM finance_items
-            ORDER BY datetime(ts) DESC, id DESC
-            """
-        )
-        rows = cur.fetchall()
-        return [_row_to_dict(r) for r in rows]
+    items = get_repository().list_all()
+    return [
+        {
+            "fecha": r["fecha"], "concepto": r["concepto"], "categoria": r["categoria"],
+            "tipo": r["tipo"], "monto_clp": r["monto_clp"], "ts": r["created_at"],
+        }
+        for r in sorted(items, key=lambda r: r.get("created_at", ""), reverse=True)
+    ]
 
 def month_summary(month: str) -> Dict[str, Any]:
     """
     Devuelve resumen del mes 'YYYY-MM':
     { 'month': 'YYYY-MM', 'ingresos': int, 'gastos': int, 'saldo': int }
     """
-    _ensure_db()
-    prefix = f"{month}-"
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        # Sumatorias por tipo usando LIKE en fecha o ts
-        cur.execute(
-            """
-            SELECT
-              SUM(CASE WHEN tipo='ingreso' THEN monto_clp ELSE 0 END) AS ingresos,
-              SUM(CASE WHEN tipo='gasto'   THEN monto_clp ELSE 0 END) AS gastos
-            FROM finance_items
-            WHERE fecha LIKE ? OR ts LIKE ?
-            """,
-            (prefix + "%", month + "%"),
-        )
-        row = cur.fetchone() or {"ingresos": 0, "gastos": 0}
-        ingresos = int(row["ingresos"] or 0)
-        gastos   = int(row["gastos"] or 0)
-        return {"month": month, "ingresos": ingresos, "gastos": gastos, "saldo": ingresos - gastos}
+    s = get_repository().summary(month)
+    return {"month": month, "ingresos": s["ingresos"], "gastos": s["gastos"], "saldo": s["saldo"]}
@@ -0,0 +1,126 @@
+# app/storage/migrate.py
+"""
+Migración en línea de los stores viejos al repositorio único.
+
+Fuentes (las que existan):
+  - AMETH_DATA_PATH/records.json   (router /finance, campos en inglés)
+  - DATA_DIR/ameth.sqlite3         (app/storage/db.py, tabla finance_items)
+Antes de eso, DATA_DIR/finance/records.json (layout de un solo archivo) se
+parte en DATA_DIR/finance/months/YYYY-MM.json + manifest.json.
+
+Se recorre cada fuente en lotes (sqlite con fetchmany; el JSON del router se
+parsea una vez y se itera) y cada lote entra con repository.add_many: un flock
+y una escritura por lote, así la app puede seguir atendiendo entre lotes.
+
+Dedupe:
+  - dentro de una misma fuente, sólo por id: ni el router ni sqlite
+    deduplicaban por contenido (dos almuerzos iguales son dos registros).
+    Las filas del router conservan su id; las de sqlite reciben
+    "sqlite-<rowid>", así re-ejecutar es inocuo.
+  - entre stores, por idem_key: una fila igual a un registro que vino de
+    otro store (o que ya estaba en el repositorio) es el mismo movimiento.
+Los archivos fuente no se tocan.
+
+    python -m app.storage.migrate
+    python -m app.storage.migrate --dry-run --batch-size 5000
+"""
+import argparse, itertools, json, os, sqlite3
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from app.storage import db
+from app.storage.repository import ensure_schema, get_repository
+
+ROUTER_FILE = os.path.join(os.environ.get("AMETH_DATA_PATH", "data"), "records.json")
+SQLITE_ID_PREFIX = "sqlite-"
+
+
+def iter_router_json(path: str) -> Iterator[Dict]:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    for x in items:
+        yield {
+            "id": x.get("id"),
+            "fecha": str(x.get("date", "")),
+            "concepto": x.get("concept", ""),
+            "categoria": x.get("category") or "otros",
+            "monto_clp": int(x.get("amount_clp", 0)),
+            "tipo": x.get("type", ""),
+            "source": x.get("source"),
+            "external_id": x.get("external_id"),
+            "hidden": bool(x.get("hidden", False)),
+        }
+
+
+def iter_sqlite(path: str, batch_size: int = 1000) -> Iterator[Dict]:
+    if not os.path.exists(path):
+        return
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        cur = conn.execute("SELECT id, fecha, concepto, categoria, tipo, monto_clp, ts FROM finance_items ORDER BY id")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for r in rows:
+                yield dict({k: r[k] for k in r.keys()}, id=f"{SQLITE_ID_PREFIX}{r['id']}")
+    except sqlite3.OperationalError:
+        return  # base sin la tabla
+    finally:
+        conn.close()
+
+
+def _batches(it: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    it = iter(it)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def migrate(router_file: str = ROUTER_FILE, sqlite_file: str = db.DB_PATH,
+            batch_size: int = 1000, dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    repo = get_repository()
+    legacy = 0 if dry_run else repo.migrate_legacy_file()
+    # id -> idem_key de todo lo guardado (y de lo que se va insertando)
+    keys: Dict[str, str] = {r["id"]: r["idem_key"] for r in repo.list_all(include_hidden=True)}
+    report = {"single_file_layout": {"read": legacy, "inserted": legacy, "duplicates": 0}}
+    router_rows = list(iter_router_json(router_file))
+    router_ids = {r["id"] for r in router_rows if r["id"]}
+    sources: List[Tuple[str, Iterable[Dict], Callable[[str], bool]]] = [
+        ("router_json", router_rows, lambda i: i in router_ids),
+        ("sqlite", iter_sqlite(sqlite_file, batch_size), lambda i: i.startswith(SQLITE_ID_PREFIX)),
+    ]
+    for name, rows, own in sources:
+        # idem_keys de otros stores; los registros de esta fuente sólo chocan por id
+        other = {k for i, k in keys.items() if not own(i)}
+        read = inserted = 0
+        for batch in _batches(rows, batch_size):
+            read += len(batch)
+            fresh = []
+            for r in map(ensure_schema, batch):
+                if r["id"] in keys or r["idem_key"] in other:
+                    continue
+                keys[r["id"]] = r["idem_key"]
+                fresh.append(r)
+            inserted += len(fresh) if dry_run else repo.add_many(fresh, enforce_idempotency=False)
+        report[name] = {"read": read, "inserted": inserted, "duplicates": read - inserted}
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Migra records.json del router y ameth.sqlite3 al repositorio único")
+    ap.add_argument("--router-file", default=ROUTER_FILE)
+    ap.add_argument("--sqlite-file", default=db.DB_PATH)
+    ap.add_argument("--batch-size", type=int, default=1000)
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    report = migrate(args.router_file, args.sqlite_file, args.batch_size, args.dry_run)
+    print(json.dumps({"dry_run": args.dry_run, "target": get_repository().root, "sources": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
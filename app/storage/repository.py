@@ -0,0 +1,717 @@
+# app/storage/repository.py
+"""
+Repositorio único de registros de finanzas.
+
+Antes había tres stores con tres esquemas (AMETH_DATA_PATH/records.json del
+router, DATA_DIR/finance/records.json y DATA_DIR/ameth.sqlite3). Ahora todo
+vive en DATA_DIR/finance/ con el esquema de finance_storage:
+
+    id, fecha, concepto, categoria, monto_clp, tipo, created_at, idem_key,
+    source, external_id, hidden
+    [+ moneda, monto si no es CLP: monto original como string decimal]
+
+Layout particionado por mes:
+
+    DATA_DIR/finance/manifest.json        epoch, seq y {mes: versión, count}
+    DATA_DIR/finance/months/YYYY-MM.json  registros de ese mes
+
+- Cada partición se parsea una vez y queda en memoria con sus índices
+  (id -> registro, idem_key -> id, orden por fecha). Listar, resumir,
+  limpiar o deduplicar un mes sólo toca su archivo; una escritura reescribe
+  sólo la partición de su mes (+ el manifest, que es chico).
+- Si otro proceso escribe (otro worker, la migración) se detecta por
+  (mtime_ns, tamaño) del manifest / la partición y se relee.
+- Las escrituras toman un flock sobre DATA_DIR/finance/.lock, aplican sobre
+  el estado fresco y guardan de forma atómica (tmp + os.replace).
+- Un DATA_DIR/finance/records.json del layout anterior se migra solo al
+  primer acceso (queda como records.json.migrated).
+
+Adaptadores: finance_storage (API en español), app.routers.finance (inglés)
+y app.storage.db (ex-sqlite). Migración de los stores viejos:
+python -m app.storage.migrate
+"""
+import abc, bisect, hashlib, itertools, json, logging, os, re, threading, uuid
+from contextlib import contextmanager
+from datetime import datetime
+from collections import deque
+from decimal import Decimal
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core import metrics
+from app.services import classifier, fx, sheets_sync
+
+log = logging.getLogger("ameth.repository")
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo el lock del proceso
+    fcntl = None
+
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+FINANCE_PATH = os.path.join(DATA_DIR, "finance")
+MANIFEST_NAME = "manifest.json"
+PARTS_DIRNAME = "months"
+LEGACY_NAME = "records.json"
+# Layout anterior (un solo archivo); se migra solo al primer acceso
+DB_FILE = os.path.join(FINANCE_PATH, LEGACY_NAME)
+# Eventos recientes que se guardan en memoria para el change feed
+CHANGES_LOG_MAX = int(os.environ.get("FINANCE_CHANGES_LOG_MAX", "10000"))
+
+
+# --- esquema ---
+def _normalize_str(x: str) -> str:
+    return " ".join((x or "").strip().lower().split())
+
+def compute_idem_key(fecha: str, concepto: str, categoria: str, monto_clp: int, tipo: str) -> str:
+    raw = "|".join([
+        _normalize_str(fecha),
+        _normalize_str(concepto),
+        _normalize_str(categoria),
+        str(int(monto_clp)),
+        _normalize_str(tipo),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def ensure_schema(r: Dict) -> Dict:
+    # Migra registros antiguos: añade id/created_at/idem_key en base a campos existentes.
+    r = dict(r)
+    if "id" not in r or not r.get("id"):
+        r["id"] = str(uuid.uuid4())
+    if "created_at" not in r or not r.get("created_at"):
+        # si hay 'ts' antiguo, úsalo; si no, ahora.
+        created = r.get("ts")
+        if created:
+            # normaliza a ISO con Z si viene como "YYYY-MM-DD HH:MM:SS"
+            if "T" not in created:
+                created = created.replace(" ", "T") + "Z"
+            r["created_at"] = created
+        else:
+            r["created_at"] = datetime.utcnow().isoformat() + "Z"
+    r.pop("ts", None)
+    r["monto_clp"] = int(r.get("monto_clp", 0))
+    # Moneda extranjera: se guarda el monto original; monto_clp queda como
+    # estimación al escribir y los resúmenes/exportes convierten con app.services.fx.
+    moneda = (r.get("moneda") or fx.BASE_CURRENCY).upper()
+    if moneda == fx.BASE_CURRENCY:
+        r.pop("moneda", None)
+        r.pop("monto", None)
+    else:
+        r["moneda"] = moneda
+        monto = fx.to_decimal(r.get("monto"))
+        if monto is None:
+            # sin monto original no hay nada que convertir: resúmenes/exportes
+            # usan monto_clp tal cual (nunca se toma el CLP como monto extranjero)
+            r.pop("monto", None)
+        else:
+            r["monto"] = str(monto)
+            if not r["monto_clp"]:
+                r["monto_clp"] = fx.to_clp(monto, moneda, r.get("fecha", "")) or 0
+    if "idem_key" not in r or not r.get("idem_key"):
+        r["idem_key"] = compute_idem_key(
+            r.get("fecha",""),
+            r.get("concepto",""),
+            r.get("categoria",""),
+            r["monto_clp"],
+            r.get("tipo",""),
+        )
+    r.setdefault("source", None)
+    r.setdefault("external_id", None)
+    r.setdefault("hidden", False)
+    return r
+
+_MONTH_RE = re.compile(r"\d{4}-\d{2}")
+
+def _month(r: Dict) -> str:
+    m = str(r.get("fecha", ""))[:7]
+    return m if _MONTH_RE.fullmatch(m) else ""
+
+def _part_name(month: str) -> str:
+    return f"{month}.json" if month else "sin_fecha.json"
+
+def _order(r: Dict) -> Tuple[str, str, str]:
+    # id desempata: el orden es total y sirve de cursor de paginación
+    return (r.get("fecha", ""), r.get("created_at", ""), r.get("id", ""))
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+# Cada escritura emite eventos {seq, op, id, month, record}; op ∈ created|hidden|unhidden|deleted.
+# Los listeners se llaman en el hilo que escribió, fuera del lock.
+Listener = Callable[[List[Dict]], None]
+
+
+class _Tx:
+    """Escritura en curso: acumula los eventos; sin eventos no se reescribe el archivo."""
+    __slots__ = ("events",)
+
+    def __init__(self):
+        self.events: List[Dict] = []
+
+
+class FinanceRepository(abc.ABC):
+    """Interfaz del store de finanzas. Los registros usan el esquema de ensure_schema."""
+
+    @abc.abstractmethod
+    def add(self, rec: Dict, enforce_idempotency: bool = True) -> Tuple[Dict, bool]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_many(self, recs: Iterable[Dict], enforce_idempotency: bool = True) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, rec_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_month(self, month: str, include_hidden: bool = False) -> List[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_all(self, include_hidden: bool = False) -> List[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def page_month(self, month: str, after: Optional[Tuple[str, str, str]], limit: int) -> Tuple[List[Dict], Optional[Tuple[str, str, str]]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def summary(self, month: str) -> Dict:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def category_totals(self, month: str, tipo: str = "gasto") -> Tuple[Dict[str, int], int]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_hidden(self, rec_id: str, hidden: bool = True) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, rec_id: str) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear_month(self, month: str) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def dedupe_month(self, month: str) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def current_seq(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def month_version(self, month: str) -> str:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def changes_since(self, since: int, limit: int = 500) -> Dict:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_listener(self, fn: Listener) -> None:
+        raise NotImplementedError
+
+    def migrate_legacy_file(self) -> int:
+        return 0
+
+
+class _Part:
+    """Partición de un mes cargada en memoria."""
+    __slots__ = ("items", "by_idem", "sorted", "stamp", "summary")
+
+    def __init__(self):
+        self.items: Dict[str, Dict] = {}       # id -> registro
+        self.by_idem: Dict[str, str] = {}      # idem_key -> id (el primero)
+        self.sorted: Optional[List[Dict]] = None
+        self.stamp: Optional[Tuple[int, int]] = None
+        self.summary: Optional[Tuple[Tuple[int, str], Dict]] = None  # ((versión mes, versión fx), resumen)
+
+
+def _stat(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _write_json(path: str, data: Dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class JsonRepository(FinanceRepository):
+    def __init__(self, root: str = FINANCE_PATH):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.parts_dir = os.path.join(root, PARTS_DIRNAME)
+        self.legacy_path = os.path.join(root, LEGACY_NAME)
+        self._lock = threading.RLock()
+        self._flock_depth = 0
+        self._parts: Dict[str, _Part] = {}
+        self._id_month: Dict[str, str] = {}   # pista id -> mes (se verifica al usarla)
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._loaded = False
+        # secuencia de escrituras: persistida en el manifest, nunca retrocede
+        self._seq = 0
+        self._log: Deque[Dict] = deque(maxlen=CHANGES_LOG_MAX)
+        self._log_floor = 0  # hay eventos para todo since >= _log_floor
+        self._listeners: List[Listener] = []
+        # mes -> seq de la última escritura que lo tocó (ETag de listas/resúmenes)
+        self._month_ver: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._epoch = ""
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Lock del proceso + flock entre procesos. Reentrante (flock no lo es entre fds)."""
+        with self._lock:
+            if self._flock_depth:
+                self._flock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._flock_depth -= 1
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with _file_lock(os.path.join(self.root, ".lock")):
+                self._flock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._flock_depth = 0
+
+    # --- manifest ---
+    def _refresh(self) -> None:
+        stamp = _stat(self.manifest_path)
+        if self._loaded and stamp == self._stamp:
+            return
+        if stamp is None and os.path.exists(self.legacy_path):
+            self.migrate_legacy_file()
+            stamp = _stat(self.manifest_path)
+        meta: Dict = {}
+        if stamp is not None:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        self._apply_meta(meta)
+        self._stamp = stamp
+        self._loaded = True
+
+    def _apply_meta(self, meta: Dict) -> None:
+        seq = int(meta.get("seq", 0))
+        if not self._loaded or seq != self._seq:
+            # primera carga o escrituras de otro proceso: no tenemos sus eventos
+            self._log.clear()
+            self._seq = self._log_floor = max(seq, self._seq)
+        months = meta.get("months", {})
+        self._month_ver = {m: int(v.get("version", 0)) for m, v in months.items()}
+        self._counts = {m: int(v.get("count", 0)) for m, v in months.items()}
+        # Sin epoch (store nuevo o reemplazado a mano): uno nuevo, así sus
+        # versiones no chocan con ETags emitidos para otro contenido.
+        self._epoch = meta.get("epoch") or uuid.uuid4().hex[:12]
+
+    def _manifest(self) -> Dict:
+        return {
+            "format": 1,
+            "epoch": self._epoch,
+            "seq": self._seq,
+            "months": {
+                m: {"version": self._month_ver.get(m, 0), "count": self._counts.get(m, 0), "file": _part_name(m)}
+                for m in sorted(set(self._month_ver) | set(self._counts))
+            },
+        }
+
+    # --- particiones ---
+    def _part_path(self, month: str) -> str:
+        return os.path.join(self.parts_dir, _part_name(month))
+
+    def _part(self, month: str) -> _Part:
+        """Partición del mes; se (re)lee sólo si su archivo cambió."""
+        stamp = _stat(self._part_path(month))
+        p = self._parts.get(month)
+        if p is not None and p.stamp == stamp:
+            return p
+        p = _Part()
+        if stamp is not None:
+            with metrics.timed(metrics.STORAGE, store="finance_json", op="load"):
+                with open(self._part_path(month), "r", encoding="utf-8") as f:
+                    raw = json.load(f).get("items", [])
+            for x in raw:
+                self._index(p, month, ensure_schema(x))
+        p.stamp = stamp
+        self._parts[month] = p
+        return p
+
+    def _months(self) -> List[str]:
+        return sorted(set(self._month_ver) | set(self._counts))
+
+    def _index(self, p: _Part, month: str, r: Dict) -> None:
+        p.items[r["id"]] = r
+        p.by_idem.setdefault(r["idem_key"], r["id"])
+        p.sorted = None
+        self._id_month[r["id"]] = month
+
+    def _unindex(self, p: _Part, rec_id: str) -> Optional[Dict]:
+        r = p.items.pop(rec_id, None)
+        if r is None:
+            return None
+        p.sorted = None
+        self._id_month.pop(rec_id, None)
+        if p.by_idem.get(r["idem_key"]) == rec_id:
+            del p.by_idem[r["idem_key"]]
+            # otro registro con la misma clave (altas sin idempotencia) pasa a ser el canónico
+            for other in p.items.values():
+                if other["idem_key"] == r["idem_key"]:
+                    p.by_idem[r["idem_key"]] = other["id"]
+                    break
+        return r
+
+    def _find(self, rec_id: str) -> Optional[_Part]:
+        month = self._id_month.get(rec_id)
+        if month is not None:
+            p = self._part(month)
+            if rec_id in p.items:
+                return p
+        # sin pista: se recorren las particiones, las más recientes primero
+        for month in reversed(self._months()):
+            p = self._part(month)
+            if rec_id in p.items:
+                return p
+        return None
+
+    def _persist(self, months: Iterable[str]) -> None:
+        os.makedirs(self.parts_dir, exist_ok=True)
+        with metrics.timed(metrics.STORAGE, store="finance_json", op="save"):
+            for m in months:
+                p = self._parts[m]
+                self._counts[m] = len(p.items)
+                _write_json(self._part_path(m), {"month": m, "version": self._month_ver.get(m, 0),
+                                                  "items": list(p.items.values())})
+                p.stamp = _stat(self._part_path(m))
+            # el manifest al final: si algo falla antes, nadie ve una versión nueva sin datos
+            _write_json(self.manifest_path, self._manifest())
+        self._stamp = _stat(self.manifest_path)
+
+    @contextmanager
+    def _writing(self) -> Iterator[_Tx]:
+        tx = _Tx()
+        with self._exclusive():
+            self._refresh()
+            try:
+                yield tx
+            except BaseException:
+                # el estado en memoria pudo quedar a medias: releer todo
+                self._loaded = False
+                self._parts.clear()
+                raise
+            if tx.events:
+                self._persist({e["month"] for e in tx.events})
+                self._log.extend(tx.events)
+        if tx.events:
+            self._after_write(tx.events)
+
+    def migrate_legacy_file(self) -> int:
+        """
+        Parte DATA_DIR/finance/records.json (un solo archivo) en una
+        partición por mes + manifest. Conserva seq/epoch/versiones si el
+        archivo ya las traía y lo deja renombrado como records.json.migrated.
+        Devuelve cuántos registros se migraron (0 si no había nada que hacer).
+        """
+        with self._exclusive():
+            if os.path.exists(self.manifest_path) or not os.path.exists(self.legacy_path):
+                return 0
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            meta = data if isinstance(data, dict) else {"items": data}
+            by_month: Dict[str, List[Dict]] = {}
+            for x in meta.get("items", []):
+                r = ensure_schema(x)
+                by_month.setdefault(_month(r), []).append(r)
+            versions = {m: int(v) for m, v in meta.get("months", {}).items()}
+            os.makedirs(self.parts_dir, exist_ok=True)
+            for m, items in by_month.items():
+                _write_json(self._part_path(m), {"month": m, "version": versions.get(m, 0), "items": items})
+            _write_json(self.manifest_path, {
+                "format": 1,
+                "epoch": meta.get("epoch") or uuid.uuid4().hex[:12],
+                "seq": int(meta.get("seq", 0)),
+                "months": {m: {"version": versions.get(m, 0), "count": len(items), "file": _part_name(m)}
+                           for m, items in sorted(by_month.items())},
+            })
+            os.replace(self.legacy_path, self.legacy_path + ".migrated")
+            self._loaded = False
+            self._parts.clear()
+            return sum(len(v) for v in by_month.values())
+
+    def _emit(self, tx: _Tx, op: str, r: Dict) -> None:
+        self._seq += 1
+        self._month_ver[_month(r)] = self._seq
+        tx.events.append({"seq": self._seq, "op": op, "id": r["id"], "month": _month(r), "record": dict(r)})
+
+    def _after_write(self, events: List[Dict]) -> None:
+        # La escritura ya está hecha: un hook roto se loguea y no se propaga.
+        try:
+            for e in events:
+                if e["op"] == "created":
+                    classifier.learn(e["record"].get("concepto", ""), e["record"].get("categoria", ""))
+        except Exception:
+            log.exception("repository hook failed", extra={"listener": "classifier.learn"})
+        try:
+            for month in {e["month"] for e in events}:
+                sheets_sync.notify(month)
+        except Exception:
+            log.exception("repository hook failed", extra={"listener": "sheets_sync.notify"})
+        for fn in self._listeners:
+            try:
+                fn(events)
+            except Exception:
+                log.exception("repository listener failed", extra={
+                    "listener": f"{getattr(fn, '__module__', '?')}.{getattr(fn, '__qualname__', repr(fn))}",
+                    "events": len(events),
+                })
+
+    def _sorted_month(self, month: str) -> List[Dict]:
+        p = self._part(month)
+        if p.sorted is None:
+            p.sorted = sorted(p.items.values(), key=_order)
+        return p.sorted
+
+    def _month_items(self, month: str, include_hidden: bool) -> List[Dict]:
+        return [r for r in self._part(month).items.values() if include_hidden or not r.get("hidden")]
+
+    # --- lecturas ---
+    def get(self, rec_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            p = self._find(rec_id)
+            return dict(p.items[rec_id]) if p else None
+
+    def list_month(self, month: str, include_hidden: bool = False) -> List[Dict]:
+        with self._lock:
+            self._refresh()
+            return [dict(r) for r in self._sorted_month(month) if include_hidden or not r.get("hidden")]
+
+    def page_month(self, month: str, after: Optional[Tuple[str, str, str]], limit: int) -> Tuple[List[Dict], Optional[Tuple[str, str, str]]]:
+        """
+        Hasta `limit` registros visibles del mes posteriores a `after` (clave
+        de orden del último recibido). Devuelve (página, cursor siguiente o None).
+        Búsqueda binaria sobre la lista ordenada en caché: O(log n + limit).
+        """
+        with self._lock:
+            self._refresh()
+            lst = self._sorted_month(month)
+            i = bisect.bisect_right(lst, tuple(after), key=_order) if after else 0
+            page: List[Dict] = []
+            while i < len(lst) and len(page) < limit:
+                r = lst[i]
+                i += 1
+                if not r.get("hidden"):
+                    page.append(dict(r))
+            more = any(not r.get("hidden") for r in itertools.islice(lst, i, None))
+        return page, (_order(page[-1]) if page and more else None)
+
+    def list_all(self, include_hidden: bool = False) -> List[Dict]:
+        """Todas las particiones (historial completo): sólo para usos no calientes."""
+        with self._lock:
+            self._refresh()
+            out: List[Dict] = []
+            for m in self._months():
+                out.extend(dict(r) for r in self._sorted_month(m) if include_hidden or not r.get("hidden"))
+        return out
+
+    def summary(self, month: str) -> Dict:
+        """
+        Totales CLP del mes. Los registros en moneda extranjera se agrupan por
+        (tipo, moneda, fecha) y cada grupo se convierte una vez con la tabla
+        de app.services.fx; sin tasa se usa el monto_clp guardado y se cuenta
+        en fx_pendientes. Queda en caché hasta que cambie el mes o la tabla.
+        """
+        with self._lock:
+            self._refresh()
+            p = self._part(month)
+            key = (self._month_ver.get(month, 0), fx.version())
+            if p.summary is not None and p.summary[0] == key:
+                return dict(p.summary[1])
+            totals = {"gasto": 0, "ingreso": 0}
+            groups: Dict[Tuple[str, str, str], List] = {}  # (tipo, moneda, fecha) -> [monto, monto_clp guardado, n]
+            count = 0
+            for x in p.items.values():
+                if x.get("hidden"):
+                    continue
+                count += 1
+                tipo = x.get("tipo")
+                if tipo not in totals:
+                    continue
+                if "monto" not in x:  # CLP, o extranjero sin monto original
+                    totals[tipo] += x["monto_clp"]
+                    continue
+                g = groups.setdefault((tipo, x["moneda"], x.get("fecha", "")[:10]), [Decimal(0), 0, 0])
+                g[0] += Decimal(x["monto"])
+                g[1] += x["monto_clp"]
+                g[2] += 1
+            converted = fx.convert_groups({k: (k[1], k[2], g[0]) for k, g in groups.items()})
+            pending = 0
+            by_currency: Dict[str, Dict[str, str]] = {}
+            for k, g in groups.items():
+                clp = converted[k]
+                if clp is None:
+                    clp, pending = g[1], pending + g[2]
+                totals[k[0]] += clp
+                cur = by_currency.setdefault(k[1], {"gasto": "0", "ingreso": "0"})
+                cur[k[0]] = str(Decimal(cur[k[0]]) + g[0])
+            out = {"month": month, "count": count, "ingresos": totals["ingreso"], "gastos": totals["gasto"],
+                   "saldo": totals["ingreso"] - totals["gasto"]}
+            if groups:
+                out["monedas"] = by_currency
+                out["fx_pendientes"] = pending
+            p.summary = (key, out)
+            return dict(out)
+
+    def category_totals(self, month: str, tipo: str = "gasto") -> Tuple[Dict[str, int], int]:
+        """({categoria: total visible del mes}, seq al que corresponde), leídos bajo el mismo lock."""
+        with self._lock:
+            self._refresh()
+            totals: Dict[str, int] = {}
+            for x in self._month_items(month, include_hidden=False):
+                if x.get("tipo") == tipo:
+                    c = x.get("categoria") or "otros"
+                    totals[c] = totals.get(c, 0) + int(x.get("monto_clp") or 0)
+            return totals, self._seq
+
+    # --- change feed ---
+    def current_seq(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._seq
+
+    def month_version(self, month: str) -> str:
+        """Versión opaca del mes: cambia con cada escritura que lo toca. Sólo hace un stat del manifest si nada cambió."""
+        with self._lock:
+            self._refresh()
+            return f"{self._epoch}.{self._month_ver.get(month, 0)}"
+
+    def changes_since(self, since: int, limit: int = 500) -> Dict:
+        """
+        Eventos con seq > since (a lo más `limit`). reset=True si ya no están
+        en memoria (log rotado u otro proceso escribió): el cliente debe
+        volver a leer el mes completo y seguir desde `seq`.
+        """
+        with self._lock:
+            self._refresh()
+            if since >= self._seq:
+                return {"seq": self._seq, "reset": False, "events": []}
+            if since < self._log_floor or not self._log or since < self._log[0]["seq"] - 1:
+                return {"seq": self._seq, "reset": True, "events": []}
+            start = since - self._log[0]["seq"] + 1  # seq contiguas dentro del log
+            events = list(itertools.islice(self._log, start, start + limit))
+        return {"seq": events[-1]["seq"] if events else self._seq, "reset": False, "events": events}
+
+    def add_listener(self, fn: Listener) -> None:
+        self._listeners.append(fn)
+
+    # --- escrituras (sólo reescriben las particiones de los meses tocados) ---
+    def add(self, rec: Dict, enforce_idempotency: bool = True) -> Tuple[Dict, bool]:
+        rec = ensure_schema(rec)
+        month = _month(rec)
+        with self._writing() as tx:
+            p = self._part(month)
+            if enforce_idempotency:
+                dup = p.by_idem.get(rec["idem_key"])  # la idem_key incluye la fecha: basta el mes
+                if dup is not None:
+                    return dict(p.items[dup]), False
+            self._index(p, month, rec)
+            self._emit(tx, "created", rec)
+        return dict(rec), True
+
+    def add_many(self, recs: Iterable[Dict], enforce_idempotency: bool = True) -> int:
+        """Alta en lote: un solo lock y una escritura por mes tocado."""
+        with self._writing() as tx:
+            for rec in recs:
+                rec = ensure_schema(rec)
+                month = _month(rec)
+                p = self._part(month)
+                if rec["id"] in p.items or (rec["id"] in self._id_month and self._find(rec["id"]) is not None):
+                    continue
+                if enforce_idempotency and rec["idem_key"] in p.by_idem:
+                    continue
+                self._index(p, month, rec)
+                self._emit(tx, "created", rec)
+        return len(tx.events)
+
+    def set_hidden(self, rec_id: str, hidden: bool = True) -> bool:
+        with self._writing() as tx:
+            p = self._find(rec_id)
+            if p is None:
+                return False
+            r = p.items[rec_id]
+            if bool(r.get("hidden")) != hidden:
+                r["hidden"] = hidden
+                self._emit(tx, "hidden" if hidden else "unhidden", r)
+        return True
+
+    def delete(self, rec_id: str) -> bool:
+        with self._writing() as tx:
+            p = self._find(rec_id)
+            if p is None:
+                return False
+            self._emit(tx, "deleted", self._unindex(p, rec_id))
+        return True
+
+    def clear_month(self, month: str) -> int:
+        with self._writing() as tx:
+            p = self._part(month)
+            for i in list(p.items):
+                self._emit(tx, "deleted", self._unindex(p, i))
+        return len(tx.events)
+
+    def dedupe_month(self, month: str) -> int:
+        """Quita duplicados dentro del mes según idem_key (conserva el primero cronológico)."""
+        with self._writing() as tx:
+            p = self._part(month)
+            seen = set()
+            drop = []
+            for r in self._sorted_month(month):
+                if r["idem_key"] in seen:
+                    drop.append(r["id"])
+                else:
+                    seen.add(r["idem_key"])
+            for i in drop:
+                self._emit(tx, "deleted", self._unindex(p, i))
+        return len(tx.events)
+
+
+_repo: Optional[FinanceRepository] = None
+_repo_lock = threading.Lock()
+
+
+def get_repository() -> FinanceRepository:
+    global _repo
+    if _repo is None:
+        with _repo_lock:
+            if _repo is None:
+                _repo = JsonRepository(FINANCE_PATH)
+    return _repo
+
+
+def _history():
+    for x in get_repository().list_all():
+        yield x.get("concepto", ""), x.get("categoria", "")
+
+classifier.add_source(_history)
@@ -0,0 +1,247 @@
+# bench/api.py
+"""
+Benchmark de los caminos calientes de la API, con la app en proceso.
+
+- Levanta app.main:app sobre httpx.ASGITransport (sin red, sin uvicorn) con
+  AMETH_DATA_PATH / DATA_DIR en un directorio temporal.
+- Mercado Pago, Kyaru y Telegram apuntan a bench.stub_server (MP_API_BASE,
+  AMETH_INTERNAL_URL, TELEGRAM_API_BASE).
+- Por cada tamaño de dataset siembra el repositorio único y mide p50/p99 y throughput de:
+    http_post_records, http_get_records, storage_add_record,
+    storage_list_records, db_month_summary, http_mp_webhook
+
+    python -m bench.api --sizes 1000,10000,100000 --ops 200 --out base.json
+    python -m bench.api --sizes 1000000 --ops 20
+    python -m bench.api --compare base.json head.json
+
+La salida es JSON (meta con commit/python + resultados por tamaño) para poder
+comparar entre commits con --compare.
+"""
+import argparse, asyncio, json, os, platform, random, shutil, subprocess, sys, tempfile, time
+from datetime import datetime
+
+from bench.stub_server import StubServer
+
+MONTHS = [f"2025-{m:02d}" for m in range(1, 13)]
+TARGET_MONTH = "2025-06"
+_CATS = ["comida", "transporte", "supermercado", "hogar", "ocio", "salud"]
+
+
+def _env(tmp: str, stub_url: str) -> None:
+    # Antes de importar app.*: settings y los stores leen el entorno al importar.
+    os.environ.update({
+        "AMETH_DATA_PATH": os.path.join(tmp, "ameth"),
+        "DATA_DIR": os.path.join(tmp, "data"),
+        "AMETH_ROUTERS": "mercadopago,finance",
+        "MP_API_BASE": stub_url,
+        "MP_ACCESS_TOKEN": "bench",
+        "MP_WEBHOOK_SECRET": "",
+        "AMETH_INTERNAL_URL": stub_url,
+        "TELEGRAM_API_BASE": stub_url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "SHEETS_SPREADSHEET_ID": "",
+        "GOOGLE_CLIENT_ID": "",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+
+
+def _mp_payment(path: str, body: bytes):
+    pid = path.rsplit("/", 1)[-1]
+    return 200, {
+        "id": pid, "status": "approved", "transaction_amount": 12990,
+        "transaction_details": {"net_received_amount": 12300},
+        "description": "Supermercado Lider", "date_approved": f"{TARGET_MONTH}-15T12:00:00.000-04:00",
+        "currency_id": "CLP", "collector_id": 1, "payer": {"id": 2},
+    }
+
+
+# --- siembra ---
+def _rows(n: int):
+    rnd = random.Random(n)
+    for i in range(n):
+        month = MONTHS[i % len(MONTHS)]
+        yield (f"{month}-{1 + i % 28:02d}", f"concepto {i}", rnd.choice(_CATS),
+               rnd.choice(("gasto", "gasto", "ingreso")), rnd.randint(500, 200_000), i)
+
+
+def _seed(n: int) -> None:
+    # Todas las rutas leen del repositorio único (app/storage/repository.py).
+    from app.storage import repository
+
+    items = []
+    for fecha, concepto, cat, tipo, monto, i in _rows(n):
+        items.append({
+            "id": f"seed-{i}", "fecha": fecha, "concepto": concepto, "categoria": cat,
+            "monto_clp": monto, "tipo": tipo, "created_at": "2025-01-01T00:00:00Z",
+            "idem_key": repository.compute_idem_key(fecha, concepto, cat, monto, tipo),
+            "source": "bench", "external_id": None, "hidden": False,
+        })
+    # se escribe en el layout de un solo archivo y se deja que el repo lo particione
+    shutil.rmtree(repository.FINANCE_PATH, ignore_errors=True)
+    os.makedirs(repository.FINANCE_PATH, exist_ok=True)
+    with open(repository.DB_FILE, "w", encoding="utf-8") as f:
+        json.dump({"items": items}, f, ensure_ascii=False)
+    repository.get_repository().current_seq()
+
+
+# --- medición ---
+def _stats(lat: list, wall: float) -> dict:
+    lat = sorted(lat)
+    n = len(lat)
+
+    def pct(p):
+        return lat[min(n - 1, max(0, int(round(p / 100 * n)) - 1))]
+
+    return {
+        "ops": n,
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p99_ms": round(pct(99) * 1000, 3),
+        "mean_ms": round(sum(lat) / n * 1000, 3),
+        "throughput_ops_s": round(n / wall, 1) if wall else None,
+    }
+
+
+async def _measure_async(fn, ops: int) -> dict:
+    lat = []
+    t0 = time.perf_counter()
+    for i in range(ops):
+        t = time.perf_counter()
+        await fn(i)
+        lat.append(time.perf_counter() - t)
+    return _stats(lat, time.perf_counter() - t0)
+
+
+def _measure_sync(fn, ops: int) -> dict:
+    lat = []
+    t0 = time.perf_counter()
+    for i in range(ops):
+        t = time.perf_counter()
+        fn(i)
+        lat.append(time.perf_counter() - t)
+    return _stats(lat, time.perf_counter() - t0)
+
+
+async def _bench_size(client, n: int, ops: int) -> dict:
+    from app.storage import db, finance_storage
+
+    t = time.perf_counter()
+    await asyncio.to_thread(_seed, n)
+    seed_s = time.perf_counter() - t
+    out = {"seed_s": round(seed_s, 3)}
+
+    async def post(i):
+        r = await client.post("/finance/records", json={
+            "date": f"{TARGET_MONTH}-10", "concept": f"bench post {n}-{i}", "category": "comida",
+            "amount_clp": 1000 + i, "type": "gasto",
+        })
+        assert r.status_code == 200, r.text
+
+    async def get(i):
+        r = await client.get("/finance/records", params={"month": TARGET_MONTH})
+        assert r.status_code == 200, r.text
+
+    async def webhook(i):
+        r = await client.post("/mp/webhooks/mercadopago", json={
+            "live_mode": True, "type": "payment", "data": {"id": str(10_000 + i)},
+        })
+        assert r.status_code == 200, r.text
+
+    out["http_post_records"] = await _measure_async(post, ops)
+    out["http_get_records"] = await _measure_async(get, ops)
+    out["storage_add_record"] = _measure_sync(
+        lambda i: finance_storage.add_record(f"{TARGET_MONTH}-11", f"bench add {n}-{i}", "comida", 1000 + i, "gasto"),
+        ops,
+    )
+    out["storage_list_records"] = _measure_sync(lambda i: finance_storage.list_records(month=TARGET_MONTH), ops)
+    out["db_month_summary"] = _measure_sync(lambda i: db.month_summary(TARGET_MONTH), ops)
+    out["http_mp_webhook"] = await _measure_async(webhook, ops)
+    return out
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def _run(args) -> dict:
+    stub = StubServer(latency_ms=args.stub_latency_ms, routes={("GET", "/v1/payments/"): _mp_payment})
+    await stub.start()
+    tmp = tempfile.mkdtemp(prefix="ameth-bench-")
+    _env(tmp, stub.url)
+
+    import httpx
+    from app.main import app
+
+    await app.router.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for n in args.sizes:
+                # con 1M registros cada escritura reescribe el JSON completo: limitar ops
+                ops = max(1, min(args.ops, args.max_ops_per_million * 1_000_000 // max(n, 1)))
+                results[str(n)] = await _bench_size(client, n, ops)
+    finally:
+        await app.router.shutdown()
+        await stub.stop()
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "ops": args.ops,
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_requests": stub.requests,
+            "data_dir": tmp,
+        },
+        "results": results,
+    }
+
+
+def compare(base: dict, head: dict) -> dict:
+    """Δ% de p50/p99/throughput por tamaño y benchmark (head vs base)."""
+    out = {}
+    for size, benches in head.get("results", {}).items():
+        for name, h in benches.items():
+            b = base.get("results", {}).get(size, {}).get(name)
+            if not isinstance(h, dict) or not isinstance(b, dict):
+                continue
+            row = {}
+            for k in ("p50_ms", "p99_ms", "throughput_ops_s"):
+                if b.get(k) and h.get(k) is not None:
+                    row[k] = {"base": b[k], "head": h[k], "delta_pct": round((h[k] - b[k]) / b[k] * 100, 1)}
+            out[f"{size}/{name}"] = row
+    return {"base": base.get("meta", {}).get("commit"), "head": head.get("meta", {}).get("commit"), "diff": out}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000",
+                    type=lambda s: [int(x) for x in s.split(",") if x])
+    ap.add_argument("--ops", type=int, default=200)
+    ap.add_argument("--max-ops-per-million", type=int, default=20,
+                    help="tope de ops para datasets grandes (ops <= X * 1M / tamaño)")
+    ap.add_argument("--stub-latency-ms", type=float, default=0.0)
+    ap.add_argument("--out", help="además de imprimir, guarda el JSON en este archivo")
+    ap.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"))
+    args = ap.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            print(json.dumps(compare(json.load(a), json.load(b)), indent=2))
+        return
+
+    result = asyncio.run(_run(args))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
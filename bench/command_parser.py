@@ -0,0 +1,45 @@
+# bench/command_parser.py
+"""
+Micro-benchmark del parser de comandos de chat (app.services.commands).
+
+    python -m bench.command_parser --messages 200000
+"""
+import argparse, json, random, time
+
+from app.services.commands import parse_command
+
+CORPUS = [
+    "gasto 6000 almuerzo comida",
+    "gasto 6.000 almuerzo comida",
+    "g 6k uber transporte",
+    "gasté $12.500 super lider supermercado",
+    "ingreso 1,5k venta ropa ventas",
+    "ingreso 850 mil sueldo",
+    "compra 2 lucas pan",
+    "pago 45.990 cuenta luz hogar",
+    "gasto 2mm auto transporte",
+    "hola, cómo estás?",
+    "ok gracias",
+    "recibí 20k devolución",
+]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=100000)
+    args = ap.parse_args()
+
+    msgs = [random.choice(CORPUS) for _ in range(args.messages)]
+    t0 = time.perf_counter()
+    parsed = sum(1 for m in msgs if parse_command(m) is not None)
+    dt = time.perf_counter() - t0
+    print(json.dumps({
+        "messages": args.messages,
+        "parsed": parsed,
+        "seconds": round(dt, 4),
+        "us_per_message": round(dt / args.messages * 1e6, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
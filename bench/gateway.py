@@ -0,0 +1,53 @@
+# bench/gateway.py
+"""
+Mensajes/seg por canal del gateway contra un stub HTTP local (sin red).
+
+    python -m bench.gateway --messages 2000 --latency-ms 20
+"""
+import argparse, asyncio, json, os, time
+
+from bench.stub_server import StubServer
+
+
+async def _run(args) -> dict:
+    stub = StubServer(latency_ms=args.latency_ms)
+    await stub.start()
+    base = stub.url
+    # settings se lee una vez al importar: configurar el entorno antes
+    os.environ.update({
+        "TELEGRAM_API_BASE": base, "TELEGRAM_BOT_TOKEN": "x", "TELEGRAM_CHAT_ID": "1",
+        "WHATSAPP_API_BASE": base, "WHATSAPP_TOKEN": "x", "PHONE_NUMBER_ID": "1",
+        "TWILIO_API_BASE": base, "TWILIO_ACCOUNT_SID": "AC1", "TWILIO_AUTH_TOKEN": "x",
+    })
+    from app.services import gateway
+
+    out = {"messages": args.messages, "stub_latency_ms": args.latency_ms, "channels": {}}
+    try:
+        for ch in gateway.CHANNELS:
+            t0 = time.perf_counter()
+            res = await asyncio.gather(*(gateway.send(ch, "+56900000000", f"m{i}") for i in range(args.messages)))
+            dt = time.perf_counter() - t0
+            ok = sum(1 for r in res if r["status"] == "sent")
+            out["channels"][ch] = {
+                "sent": ok,
+                "seconds": round(dt, 4),
+                "msgs_per_sec": round(ok / dt, 1) if dt else None,
+                "concurrency": gateway.settings.gateway_concurrency.get(ch),
+            }
+        out["stub_requests"] = stub.requests
+    finally:
+        await gateway.aclose()
+        await stub.stop()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=1000)
+    ap.add_argument("--latency-ms", type=float, default=10.0)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
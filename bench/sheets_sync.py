@@ -0,0 +1,116 @@
+# bench/sheets_sync.py
+"""
+Sincronización a Sheets contra un fake local de la API (bench.stub_server).
+
+Inserta N registros en ráfagas, deja que el debounce agrupe y verifica que
+el nº de llamadas a la API no crece con N (batching + diff por id).
+
+    python -m bench.sheets_sync --records 5000 --bursts 5
+"""
+import argparse, asyncio, json, time, uuid
+
+from app.services.sheets_sync import SheetsSync
+from bench.stub_server import StubServer
+
+SHEET_ID = "bench-sheet"
+
+
+class FakeSheets:
+    """Estado mínimo de una planilla: qué hojas existen y cuántas filas se escribieron."""
+
+    def __init__(self):
+        self.sheets = set()
+        self.rows_written = 0
+        self.rows_cleared = 0
+        self.calls = {"values_get": 0, "add_sheet": 0, "values_batch_update": 0, "values_batch_clear": 0}
+
+    def routes(self):
+        base = f"/spreadsheets/{SHEET_ID}"
+        return {
+            ("GET", f"{base}/values/"): self.values_get,
+            ("POST", f"{base}:batchUpdate"): self.add_sheet,
+            ("POST", f"{base}/values:batchUpdate"): self.batch_update,
+            ("POST", f"{base}/values:batchClear"): self.batch_clear,
+        }
+
+    def values_get(self, path, body):
+        self.calls["values_get"] += 1
+        return (200, {"values": [["id"]]}) if self.sheets else (400, {"error": "Unable to parse range"})
+
+    def add_sheet(self, path, body):
+        self.calls["add_sheet"] += 1
+        for r in json.loads(body)["requests"]:
+            self.sheets.add(r["addSheet"]["properties"]["title"])
+        return 200, {}
+
+    def batch_update(self, path, body):
+        self.calls["values_batch_update"] += 1
+        self.rows_written += sum(len(d["values"]) for d in json.loads(body)["data"])
+        return 200, {}
+
+    def batch_clear(self, path, body):
+        self.calls["values_batch_clear"] += 1
+        self.rows_cleared += len(json.loads(body)["ranges"])
+        return 200, {}
+
+
+async def _run(args) -> dict:
+    fake = FakeSheets()
+    stub = StubServer(routes=fake.routes())
+    await stub.start()
+    month = "2025-09"
+    store = []
+    engine = SheetsSync(SHEET_ID, lambda: "token", lambda m: list(store),
+                        api_base=stub.url, debounce_s=args.debounce)
+    engine.start()
+    t0 = time.perf_counter()
+    try:
+        per_burst = args.records // args.bursts
+        for _ in range(args.bursts):
+            for _ in range(per_burst):
+                store.append({"id": uuid.uuid4().hex, "fecha": f"{month}-01", "concepto": "x",
+                              "categoria": "otros", "monto_clp": 1000, "tipo": "gasto"})
+                engine.notify(month)
+            await asyncio.sleep(args.debounce * 2)  # deja disparar el debounce
+        # un borrado y una edición: sólo 2 filas deberían viajar
+        store.pop(0)
+        store[0] = dict(store[0], monto_clp=2000)
+        engine.notify(month)
+        await asyncio.sleep(args.debounce * 2)
+        dt = time.perf_counter() - t0
+    finally:
+        await engine.aclose()
+        await stub.stop()
+
+    total_calls = engine.api_calls
+    assert total_calls == sum(fake.calls.values()), (total_calls, fake.calls)
+    # Cota, no valor exacto: 1 GET + 1 addSheet + a lo más 1 batchUpdate por
+    # ráfaga + (batchUpdate + batchClear) final. Si un flush tarda (el primero
+    # también prepara la hoja) la ráfaga siguiente entra en él y hay menos.
+    assert fake.calls["values_get"] == 1 and fake.calls["add_sheet"] == 1, fake.calls
+    assert 1 <= fake.calls["values_batch_update"] <= args.bursts + 1, fake.calls
+    assert total_calls <= 2 + args.bursts + 2, total_calls
+    n = args.records // args.bursts * args.bursts
+    assert fake.rows_written == 1 + n + 1, fake.rows_written  # header + inserts + 1 edición
+    assert fake.rows_cleared == 1, fake.rows_cleared  # el borrado
+    return {
+        "records": len(store) + 1,
+        "bursts": args.bursts,
+        "api_calls": total_calls,
+        "calls": fake.calls,
+        "rows_written": fake.rows_written,
+        "seconds": round(dt, 3),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=2000)
+    ap.add_argument("--bursts", type=int, default=4)
+    ap.add_argument("--debounce", type=float, default=0.05)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
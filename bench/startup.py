@@ -0,0 +1,62 @@
+# bench/startup.py
+"""
+Perfil de arranque: importa el módulo (default app.main) en un proceso
+limpio con `python -X importtime` y reporta el tiempo total y los módulos
+más caros (tiempo acumulado).
+
+    python -m bench.startup --top 15
+    python -m bench.startup --module app.routers.finance --runs 5
+"""
+import argparse, json, os, re, statistics, subprocess, sys, time
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(module: str) -> dict:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    mods = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            mods.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cum_us),
+                         "depth": len(indent) // 2})
+    top_level = [x for x in mods if x["depth"] == 0]
+    return {
+        "wall_s": round(wall, 4),
+        "import_s": round(sum(x["cumulative_us"] for x in top_level) / 1e6, 4),
+        "modules": mods,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="app.main")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+
+    runs = [profile(args.module) for _ in range(args.runs)]
+    last = runs[-1]
+    top = sorted(last["modules"], key=lambda x: x["cumulative_us"], reverse=True)
+    # sólo dependencias directas del módulo o de primer nivel, para que el top sea legible
+    top = [x for x in top if x["depth"] <= 1][: args.top]
+    print(json.dumps({
+        "module": args.module,
+        "runs": args.runs,
+        "wall_s_median": round(statistics.median(r["wall_s"] for r in runs), 4),
+        "import_s_median": round(statistics.median(r["import_s"] for r in runs), 4),
+        "top_cumulative": [{"module": x["module"], "ms": round(x["cumulative_us"] / 1000, 2)} for x in top],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
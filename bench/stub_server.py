@@ -0,0 +1,70 @@
+# bench/stub_server.py
+"""
+Servidor HTTP/1.1 mínimo (asyncio, keep-alive) para benchmarks sin red.
+
+Responde 200 con un JSON que sirve para Telegram, WhatsApp Cloud y Twilio.
+`routes` permite respuestas específicas: {("GET", "/v1/payments/"): fn(path, body) -> (status, dict)}
+(match por prefijo del path).
+"""
+import asyncio, json
+from typing import Callable, Dict, Optional, Tuple
+
+Handler = Callable[[str, bytes], Tuple[int, dict]]
+
+_DEFAULT = {"ok": True, "result": {"message_id": 1}, "messages": [{"id": "wamid.1"}], "sid": "SM1", "id": "1"}
+
+
+class StubServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 routes: Optional[Dict[Tuple[str, str], Handler]] = None):
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000.0
+        self.routes = routes or {}
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _respond(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        for (m, prefix), fn in self.routes.items():
+            if m == method and path.startswith(prefix):
+                return fn(path, body)
+        return 200, _DEFAULT
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                length = 0
+                for ln in lines[1:]:
+                    if ln.lower().startswith("content-length:"):
+                        length = int(ln.split(":", 1)[1])
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                status, data = self._respond(method, path, body)
+                payload = json.dumps(data).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
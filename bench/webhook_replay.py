@@ -0,0 +1,265 @@
+# bench/webhook_replay.py
+"""
+Reproduce ráfagas de webhooks (Mercado Pago y WhatsApp) contra la app en proceso.
+
+Entrada:
+  --file capture.jsonl   entregas guardadas por app.core.capture
+                         (WEBHOOK_CAPTURE_FILE=... en producción)
+  --synthetic N          N entregas generadas: mitad pagos MP, mitad mensajes
+                         "gasto ..." de WhatsApp, con --dup-ratio reintentos
+
+La app corre sobre httpx.ASGITransport como en bench.api; api.mercadopago.com,
+el endpoint de Kyaru (/recordFinance) y la Graph API de WhatsApp son un
+bench.stub_server. Las firmas vienen redactadas en la captura, así que cada
+entrega se vuelve a firmar con secretos del bench (x-signature de MP,
+X-Hub-Signature-256 de WhatsApp): se ejercita también la verificación.
+
+    python -m bench.webhook_replay --synthetic 2000 --rate 500 --concurrency 32
+    python -m bench.webhook_replay --file capture.jsonl --rate 0 --out replay.json
+
+--rate 0 = sin límite. El reporte (JSON) trae throughput, p50/p99, códigos
+HTTP y corrección: pagos únicos vs posts a Kyaru y mensajes únicos vs
+registros guardados (duplicados / faltantes).
+"""
+import argparse, asyncio, base64, hashlib, hmac, json, os, random, tempfile, time
+from collections import Counter
+from typing import Dict, Iterator, List
+
+from bench.api import _env, _stats
+from bench.stub_server import StubServer
+
+MP_PATH = "/mp/webhooks/mercadopago"
+WA_PATH = "/messaging/whatsapp/webhook"
+MP_SECRET = "bench-mp-secret"
+WA_SECRET = "bench-wa-secret"
+
+
+# --- stubs ---
+class _Upstream:
+    def __init__(self):
+        self.kyaru: List[str] = []  # referencia (payment id) de cada post a Kyaru
+
+    def mp_payment(self, path: str, body: bytes):
+        pid = path.rsplit("/", 1)[-1]
+        return 200, {
+            "id": pid, "status": "approved", "transaction_amount": 12990,
+            "transaction_details": {"net_received_amount": 12300},
+            "description": f"Pago replay {pid}", "date_approved": "2025-06-15T12:00:00.000-04:00",
+            "currency_id": "CLP", "collector_id": 1, "payer": {"id": 2},
+        }
+
+    def kyaru_record(self, path: str, body: bytes):
+        try:
+            self.kyaru.append(str(json.loads(body).get("referencia")))
+        except ValueError:
+            self.kyaru.append("")
+        return 200, {"ok": True}
+
+
+# --- entregas ---
+def _load(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _raw(d: Dict) -> bytes:
+    if d.get("body_encoding") == "base64":
+        return base64.b64decode(d["body"])
+    return (d.get("body") or "").encode("utf-8")
+
+
+def _wa_body(i: int, msg_id: str) -> Dict:
+    return {"object": "whatsapp_business_account", "entry": [{"id": "0", "changes": [{"field": "messages", "value": {
+        "messaging_product": "whatsapp",
+        "metadata": {"phone_number_id": "bench"},
+        "contacts": [{"wa_id": "56900000000", "profile": {"name": "bench"}}],
+        "messages": [{"id": msg_id, "from": "56900000000", "timestamp": str(int(time.time())),
+                      "type": "text", "text": {"body": f"gasto {1000 + i} replay {i} comida"}}],
+    }}]}]}
+
+
+def synthetic(n: int, dup_ratio: float, seed: int = 0) -> List[Dict]:
+    rnd = random.Random(seed)
+    out: List[Dict] = []
+    for i in range(n):
+        if out and rnd.random() < dup_ratio:
+            out.append(dict(rnd.choice(out)))  # reintento de una entrega anterior
+        elif i % 2 == 0:
+            body = {"action": "payment.updated", "live_mode": True, "type": "payment",
+                    "data": {"id": str(900_000 + i)}}
+            out.append({"path": MP_PATH, "query": "", "headers": {"content-type": "application/json"},
+                        "body": json.dumps(body), "body_encoding": "utf-8"})
+        else:
+            body = _wa_body(i, f"wamid.replay.{i}")
+            out.append({"path": WA_PATH, "query": "", "headers": {"content-type": "application/json"},
+                        "body": json.dumps(body), "body_encoding": "utf-8"})
+    return out
+
+
+def _sign(d: Dict, raw: bytes, n: int) -> Dict[str, str]:
+    headers = {k: v for k, v in (d.get("headers") or {}).items()
+               if v != "***" and k not in ("host", "content-length")}
+    if d["path"] == MP_PATH:
+        try:
+            data_id = str(((json.loads(raw or b"{}") or {}).get("data") or {}).get("id") or "")
+        except ValueError:
+            data_id = ""
+        req_id = headers.get("x-request-id") or f"replay-{n}"
+        ts = str(int(time.time()))
+        v1 = hmac.new(MP_SECRET.encode(), f"id:{data_id};request-id:{req_id};ts:{ts}".encode(),
+                      hashlib.sha256).hexdigest()
+        headers.update({"x-request-id": req_id, "x-signature": f"ts={ts},v1={v1}"})
+    elif d["path"] == WA_PATH:
+        headers["x-hub-signature-256"] = "sha256=" + hmac.new(WA_SECRET.encode(), raw, hashlib.sha256).hexdigest()
+    return headers
+
+
+def _expected(deliveries: List[Dict]) -> Dict[str, set]:
+    """Pagos MP 'live' únicos y mensajes de WhatsApp con comando únicos."""
+    from app.integrations.messaging import iter_whatsapp_events
+    from app.services.commands import parse_command
+
+    payments, messages = set(), set()
+    for d in deliveries:
+        try:
+            body = json.loads(_raw(d) or b"{}")
+        except ValueError:
+            continue
+        if not isinstance(body, dict):
+            continue
+        if d["path"] == MP_PATH:
+            pid = (body.get("data") or {}).get("id")
+            if body and body.get("live_mode") is not False and pid:
+                payments.add(str(pid))
+        elif d["path"] == WA_PATH:
+            for evt in iter_whatsapp_events(body):
+                if evt["kind"] == "message" and evt.get("id") and parse_command(evt.get("text") or ""):
+                    messages.add(evt["id"])
+    return {"payments": payments, "messages": messages}
+
+
+# --- replay ---
+async def replay(client, deliveries: List[Dict], rate: float, concurrency: int) -> Dict:
+    sem = asyncio.Semaphore(max(1, concurrency))
+    lat: List[float] = []
+    codes: Counter = Counter()
+
+    async def one(n: int, d: Dict):
+        raw = _raw(d)
+        headers = _sign(d, raw, n)
+        url = d["path"] + (f"?{d['query']}" if d.get("query") else "")
+        async with sem:
+            t = time.perf_counter()
+            try:
+                r = await client.post(url, content=raw, headers=headers)
+                codes[str(r.status_code)] += 1
+            except Exception as e:
+                codes[type(e).__name__] += 1
+            lat.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    tasks = []
+    for n, d in enumerate(deliveries):
+        if rate > 0:
+            delay = t0 + n / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(n, d)))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - t0
+    out = _stats(lat, wall) if lat else {"ops": 0}
+    out["status"] = dict(codes)
+    return out
+
+
+async def _run(args) -> Dict:
+    up = _Upstream()
+    stub = StubServer(latency_ms=args.stub_latency_ms, routes={
+        ("GET", "/v1/payments/"): up.mp_payment,
+        ("POST", "/recordFinance"): up.kyaru_record,
+    })
+    await stub.start()
+    tmp = tempfile.mkdtemp(prefix="ameth-replay-")
+    _env(tmp, stub.url)
+    os.environ.update({
+        "AMETH_ROUTERS": "messaging,mercadopago,finance",
+        "MP_WEBHOOK_SECRET": MP_SECRET,
+        "WHATSAPP_APP_SECRET": WA_SECRET,
+        "WHATSAPP_API_BASE": stub.url,
+        "WHATSAPP_TOKEN": "bench",
+        "PHONE_NUMBER_ID": "bench",
+        "KYARU_RECORD_ENDPOINT": "/recordFinance",
+        "WEBHOOK_CAPTURE_FILE": "",
+    })
+    deliveries = list(_load(args.file)) if args.file else synthetic(args.synthetic, args.dup_ratio, args.seed)
+    deliveries = [d for d in deliveries if d.get("path") in (MP_PATH, WA_PATH)]
+
+    import httpx
+    from app.main import app
+    from app.services import inbox
+    from app.storage.repository import get_repository
+
+    await app.router.startup()
+    try:
+        expected = _expected(deliveries)
+        before = len(get_repository().list_all(include_hidden=True))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            result = await replay(client, deliveries, args.rate, args.concurrency)
+        t = time.perf_counter()
+        await inbox.drain()
+        result["inbox_drain_s"] = round(time.perf_counter() - t, 3)
+        result["inbox"] = inbox.stats()
+        stored = len(get_repository().list_all(include_hidden=True)) - before
+    finally:
+        await app.router.shutdown()
+        await stub.stop()
+
+    posted = Counter(up.kyaru)
+    paths = Counter(d["path"] for d in deliveries)
+    result["correctness"] = {
+        "mercadopago": {
+            "deliveries": paths[MP_PATH],
+            "unique_payments": len(expected["payments"]),
+            "kyaru_posts": len(up.kyaru),
+            "duplicates": sum(c - 1 for c in posted.values()),
+            "missing": len(expected["payments"] - set(posted)),
+        },
+        "whatsapp": {
+            "deliveries": paths[WA_PATH],
+            "unique_messages": len(expected["messages"]),
+            "records_stored": stored,
+            "duplicates": max(0, stored - len(expected["messages"])),
+            "missing": max(0, len(expected["messages"]) - stored),
+        },
+    }
+    result["meta"] = {"source": args.file or f"synthetic:{args.synthetic}", "rate": args.rate,
+                      "concurrency": args.concurrency, "stub_latency_ms": args.stub_latency_ms,
+                      "stub_requests": stub.requests, "data_dir": tmp}
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay de webhooks MP/WhatsApp contra la app en proceso")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--file", help="JSONL de app.core.capture")
+    src.add_argument("--synthetic", type=int, help="generar N entregas")
+    ap.add_argument("--dup-ratio", type=float, default=0.1, help="fracción de reintentos en --synthetic")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--rate", type=float, default=0.0, help="entregas/s (0 = sin límite)")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--stub-latency-ms", type=float, default=0.0)
+    ap.add_argument("--out", help="además de imprimir, guarda el JSON en este archivo")
+    args = ap.parse_args()
+
+    text = json.dumps(asyncio.run(_run(args)), indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
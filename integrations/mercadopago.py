@@ -1,10 +1,14 @@
-﻿import os, json
+﻿import os, json, logging
 from datetime import datetime
 from typing import Any, Dict, Optional
 import httpx
 from fastapi import APIRouter, Request, HTTPException
 
+from app.core import metrics
+from app.services import classifier
+
 router = APIRouter()
+log = logging.getLogger("ameth.mercadopago")
 
 # === Env ===
 MP_ACCESS_TOKEN        = os.getenv("MP_ACCESS_TOKEN", "")
@@ -16,8 +20,7 @@ DEBUG_MP               = os.getenv("DEBUG_MP", "0").lower() in ("1","true","yes"
 
 def _dbg(*a):
     if DEBUG_MP:
-        try: print(*a, flush=True)
-        except: pass
+        log.info(" ".join(["%s"] * len(a)), *a)
 
 def _record_endpoint() -> Dict[str, str]:
     """
@@ -39,7 +42,8 @@ async def _get_payment(mp_id: str) -> Dict[str, Any]:
     url = f"https://api.mercadopago.com/v1/payments/{mp_id}"
     headers = {"Authorization": f"Bearer {MP_ACCESS_TOKEN}"}
     async with httpx.AsyncClient(timeout=20) as c:
-        r = await c.get(url, headers=headers)
+        with metrics.timed(metrics.UPSTREAM, service="mercadopago", op="get_payment"):
+            r = await c.get(url, headers=headers)
     if r.status_code >= 300:
         _dbg("MP get payment failed:", r.status_code, r.text)
         raise HTTPException(status_code=200, detail="skip")  # no reintentar
@@ -72,7 +76,7 @@ def _to_record(p: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "fecha": fecha,
         "concepto": concepto,
-        "categoria": "otros",
+        "categoria": classifier.classify(concepto),
         "monto_clp": monto_clp,
         "tipo": tipo,
     }
@@ -112,7 +116,8 @@ async def mp_webhook(request: Request):
     conf = _record_endpoint()
     try:
         async with httpx.AsyncClient(timeout=20) as c:
-            r = await c.post(conf["url"], headers=conf["headers"], json=record)
+            with metrics.timed(metrics.UPSTREAM, service="kyaru", op="record"):
+                r = await c.post(conf["url"], headers=conf["headers"], json=record)
         if r.status_code >= 300:
             _dbg("save failed:", r.status_code, r.text)
             return {"ok": True, "stored": False}
@@ -1,42 +1,70 @@
 ﻿# app/integrations/messaging.py
-import os
+import asyncio
+from typing import List
 from fastapi import APIRouter, HTTPException, Query
-from twilio.rest import Client
-from dotenv import load_dotenv
+from pydantic import BaseModel, Field
 
-# Cargar variables del .env (local). En hosting se usan envs del servicio.
-load_dotenv(override=True)
+from app.core.settings import settings
+from app.services import gateway
 
 # Router que importa app.main
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
 
-def _get_twilio():
-    sid   = os.getenv("TWILIO_ACCOUNT_SID")
-    token = os.getenv("TWILIO_AUTH_TOKEN")
-    from_ = os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886")
-    if not sid or not token or not from_:
-        raise HTTPException(
-            status_code=500,
-            detail="Faltan credenciales TWILIO_ en .env (SID/TOKEN/FROM)"
-        )
-    return Client(sid, token), from_
+async def send_async(to: str, body: str) -> str:
+    """
+    Envía un WhatsApp vía Twilio a través del gateway común (pool HTTP
+    compartido, concurrencia por canal, reintentos 429/5xx, circuit breaker).
+    Devuelve el SID del mensaje.
+    """
+    d = await gateway.send("twilio", to, body)
+    if d["status"] != "sent":
+        raise RuntimeError(d["error"] or "twilio send failed")
+    return d["provider_id"]
+
+class WhatsAppMessage(BaseModel):
+    to: str = Field(..., description="whatsapp:+56XXXXXXXXX")
+    body: str = Field(..., min_length=1)
+
+class SendManyIn(BaseModel):
+    messages: List[WhatsAppMessage]
 
 @router.get("/debug")
 def debug():
     return {
-        "sid_ok":   bool(os.getenv("TWILIO_ACCOUNT_SID")),
-        "token_ok": bool(os.getenv("TWILIO_AUTH_TOKEN")),
-        "from":     os.getenv("TWILIO_WHATSAPP_FROM"),
+        "sid_ok":   bool(settings.twilio_account_sid),
+        "token_ok": bool(settings.twilio_auth_token),
+        "from":     settings.twilio_whatsapp_from,
     }
 
 @router.post("/send")
-def send_whatsapp(
+async def send_whatsapp(
     to:   str = Query(..., description="whatsapp:+56XXXXXXXXX"),
     body: str = Query(..., description="Texto del mensaje"),
 ):
     try:
-        client, FROM = _get_twilio()
-        msg = client.messages.create(from_=FROM, to=to, body=body)
-        return {"ok": True, "sid": msg.sid}
+        return {"ok": True, "sid": await send_async(to, body)}
+    except gateway.GatewayError as e:
+        raise HTTPException(status_code=503 if isinstance(e, gateway.CircuitOpen) else 500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
+
+@router.post("/send_many")
+async def send_many(payload: SendManyIn):
+    """Fan-out en paralelo (acotado por GATEWAY_CONCURRENCY de twilio). Un fallo no corta el resto."""
+    if not payload.messages or len(payload.messages) > 1000:
+        raise HTTPException(status_code=422, detail="messages: entre 1 y 1000")
+    try:
+        gateway.check_config("twilio")  # falla rápido si faltan credenciales
+    except gateway.GatewayError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    results = await asyncio.gather(
+        *(send_async(m.to, m.body) for m in payload.messages), return_exceptions=True
+    )
+    out = []
+    for m, r in zip(payload.messages, results):
+        if isinstance(r, Exception):
+            out.append({"to": m.to, "ok": False, "error": str(r)})
+        else:
+            out.append({"to": m.to, "ok": True, "sid": r})
+    sent = sum(1 for x in out if x["ok"])
+    return {"ok": sent == len(out), "sent": sent, "failed": len(out) - sent, "results": out}